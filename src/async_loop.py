@@ -0,0 +1,141 @@
+"""An asyncio game loop keeping simulation, rendering and I/O apart.
+
+Simulation and rendering run as separate tasks on the event loop so that a
+slow frame does not delay the fixed simulation step, and anything touching
+the filesystem (loading images referenced by Entity.image, writing traces)
+is offloaded to an executor so new assets stream in without stalling frames.
+"""
+import asyncio
+import logging
+from concurrent.futures import Executor
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+from typing import Callable
+from typing import Optional
+
+from src.gc_policy import FrameGcPolicy
+
+class AssetLoader():
+  """Loads assets on an executor and caches them by path.
+
+  Get never blocks: it returns None until the asset has finished loading,
+  and kicks off the load the first time a path is seen. Failed loads are
+  cached as None so they are not retried every frame.
+  """
+  def __init__(self,
+      load_fn: Callable[[str], Any],
+      executor: Optional[Executor] = None):
+    self.load_fn_ = load_fn
+    self.executor_ = executor
+    self.assets_: dict[str, Any] = {}
+    self.pending_: dict[str, asyncio.Future] = {}
+
+  def Request(self, path: str):
+    """Start loading path in the background if it hasn't been already."""
+    if not path or path in self.assets_ or path in self.pending_:
+      return
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(self.executor_, self.load_fn_, path)
+    self.pending_[path] = future
+    future.add_done_callback(lambda f: self.Loaded_(path, f))
+
+  def Loaded_(self, path: str, future: asyncio.Future):
+    self.pending_.pop(path, None)
+    if future.cancelled():
+      return
+    error = future.exception()
+    if error:
+      logging.warning(f'Failed to load asset "{path}": {error}')
+      self.assets_[path] = None
+    else:
+      self.assets_[path] = future.result()
+
+  def Get(self, path: str) -> Optional[Any]:
+    if path not in self.assets_:
+      self.Request(path)
+      return None
+    return self.assets_[path]
+
+  async def Drain(self):
+    """Wait for all currently pending loads to finish."""
+    if self.pending_:
+      await asyncio.gather(*self.pending_.values(), return_exceptions=True)
+
+class AsyncGameLoop():
+  """Runs step_fn at a fixed rate and render_fn once per frame as separate tasks.
+
+  The simulation task catches up with several fixed steps if it fell behind,
+  up to max_catchup_steps per wakeup, so dt stays constant regardless of how
+  long rendering takes.
+  """
+  def __init__(self,
+      step_fn: Callable[[float], None],
+      render_fn: Callable[[], None],
+      fps: float = 60,
+      sim_rate: float = 60,
+      max_catchup_steps: int = 5,
+      gc_policy: Optional[FrameGcPolicy] = None,
+      io_executor: Optional[Executor] = None):
+    self.step_fn_ = step_fn
+    self.render_fn_ = render_fn
+    self.frame_dt = 1 / fps
+    self.sim_dt = 1 / sim_rate
+    self.max_catchup_steps = max_catchup_steps
+    self.gc_policy_ = gc_policy
+    self.io_executor_ = io_executor or ThreadPoolExecutor(
+      max_workers=2, thread_name_prefix='game_io')
+    self.periodic_: list[tuple[Callable[[], Any], float]] = []
+    self.running_ = False
+    self.steps = 0
+    self.frames = 0
+
+  def Stop(self):
+    self.running_ = False
+
+  def AddPeriodic(self, fn: Callable[[], Any], interval: float):
+    """Call fn every interval seconds between frames while running."""
+    self.periodic_.append((fn, interval))
+
+  def SubmitIo(self, fn: Callable[..., Any], *args) -> asyncio.Future:
+    """Run blocking work (e.g. writing traces) off of the event loop."""
+    return asyncio.get_running_loop().run_in_executor(self.io_executor_, fn, *args)
+
+  async def Simulate_(self):
+    loop = asyncio.get_running_loop()
+    next_step = loop.time()
+    while self.running_:
+      steps = 0
+      while loop.time() >= next_step and steps < self.max_catchup_steps:
+        self.step_fn_(self.sim_dt)
+        self.steps += 1
+        steps += 1
+        next_step += self.sim_dt
+      if steps == self.max_catchup_steps:
+        # Too far behind, drop the remaining time instead of spiraling.
+        next_step = max(next_step, loop.time())
+      await asyncio.sleep(max(0, next_step - loop.time()))
+
+  async def Render_(self):
+    loop = asyncio.get_running_loop()
+    while self.running_:
+      start = loop.time()
+      self.render_fn_()
+      self.frames += 1
+      if self.gc_policy_:
+        self.gc_policy_.OnFrameEnd(self.frame_dt - (loop.time() - start))
+      await asyncio.sleep(max(0, self.frame_dt - (loop.time() - start)))
+
+  async def Periodic_(self, fn: Callable[[], Any], interval: float):
+    while self.running_:
+      fn()
+      await asyncio.sleep(interval)
+
+  async def Run(self):
+    self.running_ = True
+    try:
+      await asyncio.gather(
+        self.Simulate_(),
+        self.Render_(),
+        *(self.Periodic_(fn, interval) for fn, interval in self.periodic_))
+    finally:
+      self.running_ = False
@@ -0,0 +1,63 @@
+import asyncio
+import threading
+import unittest
+
+from src import async_loop
+
+class TestAssetLoader(unittest.TestCase):
+  def testGet_firstCall_returnsNoneThenLoadsInBackground(self):
+    loaded_on = []
+    def Load(path):
+      loaded_on.append(threading.current_thread())
+      return f'image:{path}'
+
+    async def Run():
+      loader = async_loop.AssetLoader(Load)
+      self.assertIsNone(loader.Get('sun.png'))
+      await loader.Drain()
+      return loader.Get('sun.png')
+
+    self.assertEqual(asyncio.run(Run()), 'image:sun.png')
+    self.assertEqual(len(loaded_on), 1)
+    self.assertIsNot(loaded_on[0], threading.main_thread())
+
+  def testGet_failedLoad_cachesNone(self):
+    calls = []
+    def Load(path):
+      calls.append(path)
+      raise FileNotFoundError(path)
+
+    async def Run():
+      loader = async_loop.AssetLoader(Load)
+      loader.Get('missing.png')
+      await loader.Drain()
+      self.assertIsNone(loader.Get('missing.png'))
+      await loader.Drain()
+
+    asyncio.run(Run())
+    self.assertEqual(calls, ['missing.png'])
+
+class TestAsyncGameLoop(unittest.TestCase):
+  def testRun_stepsAtFixedDtAndRendersUntilStopped(self):
+    dts = []
+
+    def Render():
+      if game_loop.frames >= 5:
+        game_loop.Stop()
+
+    game_loop = async_loop.AsyncGameLoop(dts.append, Render, fps=200, sim_rate=100)
+    asyncio.run(game_loop.Run())
+
+    self.assertGreater(len(dts), 0)
+    self.assertTrue(all(dt == 0.01 for dt in dts))
+    self.assertEqual(game_loop.frames, 6)
+
+  def testSubmitIo_runsOnExecutor(self):
+    async def Run():
+      game_loop = async_loop.AsyncGameLoop(lambda dt: None, lambda: None)
+      return await game_loop.SubmitIo(lambda: threading.current_thread())
+
+    self.assertIsNot(asyncio.run(Run()), threading.main_thread())
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,247 @@
+"""Attributes frame cost to entity templates and spawners.
+
+Time is sampled: while started, a profiling timer interrupts the main thread
+every interval seconds of CPU time and records which entities and spawners
+were being updated, from the world down, e.g.
+  world;sun;earth;moon;expressions
+where the last entry is "expressions" if a StateFn was being evaluated. The
+samples are only aggregated, so the cost doesn't grow with how long it runs.
+Entities updated on ParallelUpdater's worker threads aren't sampled.
+
+Live entities and the expressions their current StateFn evaluates are counted
+by walking the world every census_interval frames through OnFrame, and spawns
+come from Spawner.SPAWNED_.
+
+Reports are written as folded stacks, which flamegraph.pl and speedscope
+read, or as CSV:
+  attribution = CostAttribution()
+  with attribution:
+    RunHeadless(600, on_frame=attribution.OnFrame)
+  attribution.Write('frames.folded')
+"""
+import csv
+from dataclasses import astuple
+from dataclasses import dataclass
+from dataclasses import fields
+import logging
+import signal
+from typing import Optional
+from typing import TextIO
+
+from src import state_function
+from src.entity import Entity
+from src.entity import Movement
+from src.entity import Spawner
+from src.state_function import IsConstant
+
+# Methods whose self is the entity or spawner being updated.
+_ENTITY_CODES = frozenset(method.__code__ for method in (
+  Entity.Update,
+  Entity.UpdateSpawners_,
+  Entity.UpdateChildren_,
+  Entity.UpdatePosition_))
+_SPAWNER_CODES = frozenset((Spawner.Update.__code__,))
+# Compiled expressions are evaluated by lambdas defined here.
+_EXPRESSIONS_FILE = state_function.__file__
+
+# Samples taken outside of any update, e.g. rendering.
+OTHER = 'other'
+EXPRESSIONS = 'expressions'
+
+def EntityLabel(entity: Entity) -> str:
+  return entity.template_id or '<anonymous>'
+
+def SpawnerLabel(spawner: Spawner) -> str:
+  return f'spawner:{spawner.bake_key or "<anonymous>"}'
+
+@dataclass
+class AttributionRow:
+  """Everything attributed to a single template or spawner."""
+  kind: str
+  id: str
+  # Samples with this as the innermost entity or spawner.
+  self_ms: float = 0
+  # Samples with this anywhere in the stack.
+  total_ms: float = 0
+  # Part of self_ms spent evaluating expressions.
+  expressions_ms: float = 0
+  live: float = 0
+  expressions_per_frame: float = 0
+  spawns: int = 0
+
+class CostAttribution():
+  def __init__(self,
+      interval: float = 0.001,
+      census_interval: int = 10,
+      root: Optional[Entity] = None):
+    """
+    Args:
+      interval: Seconds of CPU time between samples.
+      census_interval: Frames between counting live entities and expressions.
+      root: Entity whose subtree is counted, defaulting to the world.
+    """
+    self.interval = interval
+    self.census_interval = max(1, census_interval)
+    self.root_ = root
+    # Number of samples for each stack of labels.
+    self.samples: dict[tuple[str, ...], int] = {}
+    self.frames = 0
+    self.censuses = 0
+    self.live_: dict[str, int] = {}
+    self.expressions_: dict[str, int] = {}
+    # Spawns while previously running, and Spawner.SPAWNED_ as of Start.
+    self.spawns_: dict[str, int] = {}
+    self.spawned_: dict[str, int] = {}
+    self.spawned_start_: dict[str, int] = {}
+    self.previous_handler_ = None
+    self.running_ = False
+
+  def Start(self):
+    if self.running_:
+      return
+    self.spawned_ = Spawner.SPAWNED_
+    self.spawned_start_ = dict(self.spawned_)
+    if not hasattr(signal, 'setitimer'):
+      logging.warning('No profiling timer on this platform, only counting.')
+    else:
+      self.previous_handler_ = signal.signal(signal.SIGPROF, self.Sample_)
+      signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+    self.running_ = True
+
+  def Stop(self):
+    if not self.running_:
+      return
+    if hasattr(signal, 'setitimer'):
+      signal.setitimer(signal.ITIMER_PROF, 0)
+      signal.signal(signal.SIGPROF, self.previous_handler_ or signal.SIG_DFL)
+    self.spawns_ = self.Spawns()
+    self.running_ = False
+
+  def __enter__(self) -> 'CostAttribution':
+    self.Start()
+    return self
+
+  def __exit__(self, *args):
+    self.Stop()
+
+  def Sample_(self, signum: int, frame):
+    labels = []
+    last = None
+    in_expression = False
+    while frame is not None:
+      code = frame.f_code
+      if code in _ENTITY_CODES or code in _SPAWNER_CODES:
+        updated = frame.f_locals.get('self')
+        # Several methods of the same entity are usually on the stack.
+        if updated is not last:
+          last = updated
+          labels.append(
+            EntityLabel(updated) if code in _ENTITY_CODES else SpawnerLabel(updated))
+      elif not labels and code.co_filename == _EXPRESSIONS_FILE:
+        in_expression = True
+      frame = frame.f_back
+    if not labels:
+      labels.append(OTHER)
+    labels.reverse()
+    if in_expression:
+      labels.append(EXPRESSIONS)
+    stack = tuple(labels)
+    self.samples[stack] = self.samples.get(stack, 0) + 1
+
+  def OnFrame(self, frame_index: int = 0, seconds: float = 0.0):
+    """Call after every frame, e.g. as RunHeadless's on_frame."""
+    if self.frames % self.census_interval == 0:
+      self.Census_()
+    self.frames += 1
+
+  def Census_(self):
+    live = self.live_
+    expressions = self.expressions_
+    to_visit = list((self.root_ or Entity.World()).children_)
+    while to_visit:
+      entity = to_visit.pop()
+      if entity.children_:
+        to_visit.extend(entity.children_)
+      label = EntityLabel(entity)
+      live[label] = live.get(label, 0) + 1
+      movement = entity.movement
+      if (movement.static_position is not None or not movement.is_active or
+          # Skipped by its UpdatePolicy this frame.
+          entity.skipped_frames_ or
+          # Baked movements replay positions without evaluating anything.
+          movement.__class__ is not Movement):
+        continue
+      state_fn = movement.state_fns[movement.current_idx]
+      evaluated = (
+        (not IsConstant(state_fn.x)) +
+        (not IsConstant(state_fn.y)) +
+        (not IsConstant(state_fn.angle)))
+      if evaluated:
+        expressions[label] = expressions.get(label, 0) + evaluated
+    self.censuses += 1
+
+  def Spawns(self) -> dict[str, int]:
+    """Spawns by bake_key while running."""
+    res = dict(self.spawns_)
+    if self.running_:
+      for key, count in self.spawned_.items():
+        res[key] = res.get(key, 0) + count - self.spawned_start_.get(key, 0)
+    return res
+
+  def Rows(self) -> list[AttributionRow]:
+    """One row per template and spawner, most expensive first."""
+    rows: dict[str, AttributionRow] = {}
+    def Row(label: str) -> AttributionRow:
+      row = rows.get(label)
+      if row is None:
+        if label.startswith('spawner:'):
+          row = AttributionRow('spawner', label[len('spawner:'):])
+        else:
+          row = AttributionRow('other' if label == OTHER else 'template', label)
+        rows[label] = row
+      return row
+
+    ms = self.interval * 1000
+    for stack, count in self.samples.items():
+      in_expression = stack[-1] == EXPRESSIONS
+      labels = stack[:-1] if in_expression else stack
+      innermost = Row(labels[-1])
+      innermost.self_ms += count * ms
+      if in_expression:
+        innermost.expressions_ms += count * ms
+      for label in set(labels):
+        Row(label).total_ms += count * ms
+
+    censuses = max(1, self.censuses)
+    for label, count in self.live_.items():
+      Row(label).live = count / censuses
+    for label, count in self.expressions_.items():
+      Row(label).expressions_per_frame = count / censuses
+    for key, count in self.Spawns().items():
+      if count:
+        Row(f'spawner:{key}').spawns = count
+    return sorted(rows.values(), key=lambda row: (-row.total_ms, row.kind, row.id))
+
+  def FoldedStacks(self) -> list[str]:
+    """Samples as "world;sun;earth 12" lines, the input of flamegraph.pl."""
+    return [
+      f'{";".join(stack)} {count}'
+      for stack, count in sorted(self.samples.items())]
+
+  def WriteFolded(self, f: TextIO):
+    for line in self.FoldedStacks():
+      f.write(line + '\n')
+
+  def WriteCsv(self, f: TextIO):
+    writer = csv.writer(f)
+    writer.writerow(field.name for field in fields(AttributionRow))
+    for row in self.Rows():
+      writer.writerow(astuple(row))
+
+  def Write(self, path: str):
+    """Writes CSV if path ends with .csv, folded stacks otherwise."""
+    with open(path, 'w', newline='') as f:
+      if path.endswith('.csv'):
+        self.WriteCsv(f)
+      else:
+        self.WriteFolded(f)
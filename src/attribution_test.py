@@ -0,0 +1,176 @@
+import io
+import sys
+import unittest
+
+from src import attribution
+from src import bake
+from src import baked
+from src.attribution import CostAttribution
+from src.entity import Spawner
+from src.loader import ParseDefinedUnits
+from src.world import Templates
+from src.world import World
+
+UNITS_PB_TXT = """
+  entity {
+    id { id: 'attribution_bullet' }
+    movement {
+      state_fn { polar { r: '50 * t' theta: 'tau * idx / 10' } }
+      lifetime: 0
+    }
+  }
+
+  entity {
+    id { id: 'attribution_emitter' }
+    movement {
+      state_fn { cartesian { x: '320 + 10 * t' y: '240' } }
+      lifetime: 0
+    }
+    spawner {
+      spawn_entity { id { id: 'attribution_bullet' } }
+      spawn_count: 10
+      spawn_time_fn: '0'
+      follow_center: true
+    }
+    spawner {
+      spawn_entity {
+        movement {
+          state_fn { cartesian { x: '5' } }
+          lifetime: 0
+        }
+      }
+      spawn_count: 2
+      spawn_time_fn: '0'
+    }
+  }
+
+  entity {
+    id { id: 'attribution_shot' }
+    movement {
+      state_fn { cartesian { x: '30 * t' y: '5 * idx' } }
+      lifetime: 1
+    }
+  }
+
+  entity {
+    id { id: 'attribution_baked_emitter' }
+    movement {
+      state_fn { cartesian { x: '100' y: '100' } }
+      lifetime: 0
+    }
+    spawner {
+      spawn_entity { id { id: 'attribution_shot' } }
+      spawn_count: 3
+      spawn_time_fn: '0'
+      follow_center: true
+    }
+  }
+"""
+
+DT = 1 / 60
+
+class TestCostAttribution(unittest.TestCase):
+  @classmethod
+  def setUpClass(cls):
+    cls.templates = Templates.Compile(ParseDefinedUnits(UNITS_PB_TXT))
+
+  def setUp(self):
+    self.world = World(self.templates)
+    self.emitter = self.world.Add('attribution_emitter')
+    # Only sampled when called directly.
+    self.attribution = CostAttribution(interval=1e6, census_interval=1)
+
+  def Run(self, frames: int):
+    with self.world:
+      with self.attribution:
+        for _ in range(frames):
+          self.world.Update(DT)
+          self.attribution.OnFrame()
+
+  def RowsById(self) -> dict[tuple[str, str], attribution.AttributionRow]:
+    return {(row.kind, row.id): row for row in self.attribution.Rows()}
+
+  def test_census_countsLiveAndExpressions(self):
+    self.Run(3)
+
+    rows = self.RowsById()
+    self.assertEqual(rows['template', 'attribution_emitter'].live, 1)
+    # Only x depends on t.
+    self.assertEqual(rows['template', 'attribution_emitter'].expressions_per_frame, 1)
+    # Spawned in the first frame, before its census.
+    self.assertEqual(rows['template', 'attribution_bullet'].live, 10)
+    # x and y, the angle is constant.
+    self.assertEqual(rows['template', 'attribution_bullet'].expressions_per_frame, 20)
+    # Never moves, so nothing is evaluated.
+    inline = rows['template', 'attribution_emitter/spawner[1]']
+    self.assertEqual(inline.live, 2)
+    self.assertEqual(inline.expressions_per_frame, 0)
+
+  def test_census_bakedMovementsEvaluateNothing(self):
+    with self.world:
+      trajectories, = bake.BakeEntity('attribution_baked_emitter')
+    baked.RegisterBaked(trajectories)
+    self.addCleanup(Spawner.BAKED_.pop, trajectories.bake_key)
+    self.world.Add('attribution_baked_emitter')
+    self.Run(2)
+
+    rows = self.RowsById()
+    self.assertEqual(rows['template', 'attribution_shot'].live, 3)
+    self.assertEqual(rows['template', 'attribution_shot'].expressions_per_frame, 0)
+    self.assertEqual(rows['spawner', 'attribution_shot'].spawns, 3)
+
+  def test_spawns_countedBySpawnerWhileRunning(self):
+    self.world.Update(DT)
+    self.emitter = self.world.Add('attribution_emitter', idx=1)
+    self.Run(2)
+
+    rows = self.RowsById()
+    self.assertEqual(rows['spawner', 'attribution_bullet'].spawns, 10)
+    self.assertEqual(rows['spawner', 'attribution_emitter/spawner[1]'].spawns, 2)
+
+  def test_sample_attributesExpressionsToUpdatedEntities(self):
+    def Sample(ctx: dict) -> float:
+      self.attribution.Sample_(0, sys._getframe())
+      return 0.0
+    with self.world:
+      self.world.root.Update(self.world.globals, DT)
+      bullet = self.emitter.children_[0]
+      bullet.movement.state_fns[0].angle = Sample
+    self.Run(1)
+
+    self.assertEqual(self.attribution.samples, {
+      ('world', 'attribution_emitter', 'attribution_bullet', 'expressions'): 1,
+    })
+    rows = self.RowsById()
+    self.assertEqual(rows['template', 'attribution_bullet'].self_ms, 1e9)
+    self.assertEqual(rows['template', 'attribution_bullet'].expressions_ms, 1e9)
+    self.assertEqual(rows['template', 'attribution_emitter'].self_ms, 0)
+    self.assertEqual(rows['template', 'world'].total_ms, 1e9)
+
+  def test_sample_outsideUpdate_isOther(self):
+    self.attribution.Sample_(0, sys._getframe())
+
+    self.assertEqual(self.attribution.samples, {('other',): 1})
+
+  def test_reports_csvAndFoldedStacks(self):
+    self.attribution.samples = {
+      ('world', 'attribution_emitter'): 3,
+      ('world', 'attribution_emitter', 'spawner:attribution_bullet'): 2,
+    }
+    self.assertEqual(self.attribution.FoldedStacks(), [
+      'world;attribution_emitter 3',
+      'world;attribution_emitter;spawner:attribution_bullet 2',
+    ])
+
+    f = io.StringIO()
+    self.attribution.WriteCsv(f)
+    lines = f.getvalue().splitlines()
+    self.assertEqual(
+      lines[0],
+      'kind,id,self_ms,total_ms,expressions_ms,live,expressions_per_frame,spawns')
+    self.assertEqual(
+      lines[1].split(',')[:4],
+      ['template', 'attribution_emitter', '3000000000.0', '5000000000.0'])
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,130 @@
+"""Bakes the spawners of an entity into trajectories replayed at runtime.
+
+Run with:
+  bazel run //src:bake -- --units=path/to/units.textproto --entity=sun --out=baked/
+"""
+import argparse
+import logging
+import os
+from typing import Optional
+
+import numpy as np
+
+from proto import spawner_pb2
+from src.baked import BakedFileName
+from src.baked import BakedTrajectories
+from src.entity import Entity
+from src.entity import Spawner
+from src.loader import LoadDefinedUnitsFile
+from src.mmap_store import STORE_EXTENSION
+from src.state_function import GetGlobals
+from src.state_function import PositionState
+
+GLOBALS_ = GetGlobals()
+
+# Variables that make a spawn depend on more than its parent relative state.
+UNBAKEABLE_VARIABLES = frozenset({'xa', 'ya', 'r', 'parent', 'tx', 'ty'})
+
+def WhyNotBakeable(spawner: Spawner) -> Optional[str]:
+  """Checks whether every spawn is deterministic relative to its parent.
+
+  Returns:
+    A reason if spawner can't be baked, otherwise None.
+  """
+  if not spawner.follow_center:
+    return 'spawns do not follow the center of their parent'
+  # Evaluated once while baking, so anything random would be frozen in.
+  offset_variables = spawner.offset_fn_.Variables()
+  if offset_variables is None:
+    return 'offset uses unknown variables'
+  if offset_variables & UNBAKEABLE_VARIABLES:
+    return f'offset reads {sorted(offset_variables & UNBAKEABLE_VARIABLES)}'
+  spawn = Entity(spawner.spawned_entity_pb_, template_id=spawner.template_id)
+  if spawn.spawners:
+    for spawn_spawner in spawn.spawners:
+      spawn_spawner.Cancel()
+    return 'spawned entity has spawners of its own'
+  movement = spawn.movement
+  if movement.loop or movement.timeline_.ends[-1] == float('inf'):
+    return 'spawned entity never despawns'
+  variables = movement.variables
+  if variables is None:
+    return 'spawned entity uses unknown variables'
+  unbakeable = variables & UNBAKEABLE_VARIABLES
+  if spawner.follow_angle and 'anglea' in variables:
+    unbakeable |= {'anglea'}
+  if unbakeable:
+    return f'spawned entity reads {sorted(unbakeable)}'
+  return None
+
+def BakeSpawner(spawner: Spawner, dt: float = 1 / 60) -> BakedTrajectories:
+  """Simulates every spawn of spawner once relative to a still parent."""
+  parent_pb = spawner_pb2.Entity()
+  parent_pb.movement.state_fn.add().cartesian.SetInParent()
+  parent_pb.movement.lifetime.append(0)
+  parent = Entity(parent_pb)
+
+  samples: list[list[tuple[float, float, float]]] = []
+  for t, idx in sorted(spawner.zipped_spawn_times_idx, key=lambda pair: pair[1]):
+    offset = spawner.offset_fn_.Calc(GLOBALS_ | {'t': t, 'idx': idx})
+    spawn = Entity(
+      spawner.spawned_entity_pb_,
+      parent,
+      offset,
+      idx,
+      spawner.follow_center,
+      spawner.follow_angle,
+      spawner.template_id)
+    trajectory = []
+    while spawn.movement.is_active:
+      centered = spawn.position + spawn.offset
+      trajectory.append((centered.x, centered.y, centered.angle))
+      spawn.Update(GLOBALS_, dt)
+    samples.append(trajectory)
+
+  longest = max((len(trajectory) for trajectory in samples), default=0)
+  positions = np.zeros((len(samples), longest, 3), dtype=np.float32)
+  for idx, trajectory in enumerate(samples):
+    if trajectory:
+      positions[idx, :len(trajectory)] = trajectory
+  lengths = np.array([len(trajectory) for trajectory in samples], dtype=np.int32)
+  return BakedTrajectories(spawner.bake_key, dt, positions, lengths)
+
+def BakeEntity(entity_id: str, dt: float = 1 / 60) -> list[BakedTrajectories]:
+  """Bakes every bakeable spawner of the saved entity entity_id."""
+  entity_pb = spawner_pb2.Entity()
+  entity_pb.id.id = entity_id
+  entity = Entity(entity_pb)
+  res = []
+  for spawner in entity.spawners:
+    reason = WhyNotBakeable(spawner)
+    if reason:
+      logging.warning(f'Not baking {spawner.bake_key}: {reason}')
+      continue
+    res.append(BakeSpawner(spawner, dt))
+  return res
+
+def Main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--units', required=True, help='DefinedUnits textproto.')
+  parser.add_argument('--entity', required=True, help='Id of the entity to bake.')
+  parser.add_argument('--out', required=True, help='Directory to write to.')
+  parser.add_argument('--dt', type=float, default=1 / 60, help='Seconds per sample.')
+  parser.add_argument(
+    '--format', choices=['store', 'npz'], default='store',
+    help='"store" files are memory mapped when loaded, "npz" files are compressed.')
+  args = parser.parse_args()
+
+  LoadDefinedUnitsFile(args.units)
+  os.makedirs(args.out, exist_ok=True)
+  for trajectories in BakeEntity(args.entity, args.dt):
+    if args.format == 'store':
+      path = os.path.join(args.out, BakedFileName(trajectories.bake_key, STORE_EXTENSION))
+      trajectories.SaveStore(path)
+    else:
+      path = os.path.join(args.out, BakedFileName(trajectories.bake_key))
+      trajectories.Save(path)
+    print(f'{trajectories.bake_key}: {trajectories.positions.nbytes} bytes -> {path}')
+
+if __name__ == '__main__':
+  Main()
@@ -0,0 +1,133 @@
+import os
+import tempfile
+import unittest
+
+from proto import spawner_pb2
+from src import bake
+from src import baked
+from src import entity
+from src.loader import ParseDefinedUnits
+from src.loader import RegisterDefinedUnits
+from src.state_function import PositionState
+
+UNITS_PB_TXT = """
+  entity {
+    id { id: 'bake_test_emitter' }
+    movement {
+      state_fn { cartesian { x: '100' y: '50 * t' } }
+      lifetime: 0
+    }
+    spawner {
+      spawn_entity {
+        movement {
+          state_fn { polar { r: '30 * t' theta: 'tau * idx / 4' angle: 'tau * idx / 4' } }
+          lifetime: 0.5
+          state_fn { delta { dx: '20 * cos(anglea)' dy: '20 * sin(anglea)' } }
+          lifetime: 0.5
+        }
+      }
+      spawn_count: 4
+      spawn_time_fn: 'idx / 10'
+      offset_fn { cartesian { x: '5 * idx' } }
+      period: 2
+      follow_center: true
+    }
+    spawner {
+      spawn_entity {
+        movement {
+          state_fn { cartesian { x: 'xa' } }
+          lifetime: 1
+        }
+      }
+      spawn_count: 1
+      spawn_time_fn: '0'
+      follow_center: true
+    }
+    spawner {
+      spawn_entity {
+        movement {
+          state_fn { cartesian { x: '10 * t' } }
+          lifetime: 1
+        }
+      }
+      spawn_count: 3
+      spawn_time_fn: '0'
+      offset_fn { cartesian { x: '100 * r.random()' } }
+      follow_center: true
+    }
+  }
+"""
+
+class TestBake(unittest.TestCase):
+  @classmethod
+  def setUpClass(cls):
+    RegisterDefinedUnits(ParseDefinedUnits(UNITS_PB_TXT))
+
+  def tearDown(self):
+    entity.Spawner.BAKED_.clear()
+
+  def MakeEmitter(self) -> entity.Entity:
+    emitter_pb = spawner_pb2.Entity()
+    emitter_pb.id.id = 'bake_test_emitter'
+    return entity.Entity(emitter_pb)
+
+  def Run(self, emitter: entity.Entity, frames: int) -> list[PositionState]:
+    for _ in range(frames):
+      emitter.Update({}, 1 / 60)
+    spawned = [
+      child for child in emitter.children_
+      if child.template_id == 'bake_test_emitter/spawner[0]']
+    return [child.AbsolutePosition() for child in spawned[:4]]
+
+  def testBakeEntity_onlyBakesDeterministicSpawners(self):
+    with self.assertLogs(level='WARNING') as logs:
+      res = bake.BakeEntity('bake_test_emitter')
+
+    self.assertEqual([t.bake_key for t in res], ['bake_test_emitter/spawner[0]'])
+    self.assertIn("reads ['xa']", logs.output[0])
+    # Random offsets would be the same on every replay.
+    self.assertIn("offset reads ['r']", logs.output[1])
+    self.assertEqual(res[0].positions.shape[0], 4)
+    # Starts at the offset.
+    self.assertAlmostEqual(float(res[0].positions[2, 0, 0]), 10)
+
+  def testBakedSpawner_matchesSimulatedPositions(self):
+    expected = self.Run(self.MakeEmitter(), 45)
+
+    with tempfile.TemporaryDirectory() as tmp:
+      for trajectories in bake.BakeEntity('bake_test_emitter'):
+        trajectories.Save(os.path.join(tmp, baked.BakedFileName(trajectories.bake_key)))
+      self.assertEqual(baked.LoadBakedDir(tmp), ['bake_test_emitter/spawner[0]'])
+    emitter = self.MakeEmitter()
+    actual = self.Run(emitter, 45)
+
+    self.assertIsInstance(emitter.children_[0].movement, baked.BakedMovement)
+    self.assertEqual(len(actual), 4)
+    for a, e in zip(actual, expected):
+      self.assertAlmostEqual(a.x, e.x, 3)
+      self.assertAlmostEqual(a.y, e.y, 3)
+      self.assertAlmostEqual(a.angle, e.angle, 3)
+
+  def testSaveStore_loadsMappedTrajectories(self):
+    trajectories = bake.BakeEntity('bake_test_emitter')[0]
+
+    with tempfile.TemporaryDirectory() as tmp:
+      path = os.path.join(tmp, baked.BakedFileName(trajectories.bake_key, '.pgms'))
+      trajectories.SaveStore(path)
+      self.assertEqual(baked.LoadBakedDir(tmp), [trajectories.bake_key])
+
+    loaded = entity.Spawner.BAKED_[trajectories.bake_key]
+    self.assertAlmostEqual(loaded.dt, trajectories.dt)
+    self.assertEqual(loaded.positions.tolist(), trajectories.positions.tolist())
+    self.assertEqual(loaded.lengths.tolist(), trajectories.lengths.tolist())
+
+  def testBakedMovement_pastLastSample_despawns(self):
+    trajectories = bake.BakeEntity('bake_test_emitter')[0]
+    movement = trajectories.NewMovement(0)
+
+    self.assertIsNotNone(movement.Calc({}, 0.9))
+    self.assertIsNone(movement.Calc({}, 0.2))
+    self.assertFalse(movement.is_active)
+
+if __name__ == '__main__':
+  unittest.main()
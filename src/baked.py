@@ -0,0 +1,146 @@
+"""Precomputed ("baked") spawner trajectories and the Movement that replays them.
+
+A baked spawner no longer evaluates any expressions for what it spawns.
+Each spawn instead looks up its position relative to the parent by its age
+in a NumPy array. See bake.py for creating these.
+"""
+import glob
+import os
+from math import floor
+from typing import Optional
+
+import numpy as np
+
+from src.entity import Spawner
+from src.mmap_store import MappedStore
+from src.mmap_store import OpenStore
+from src.mmap_store import STORE_EXTENSION
+from src.mmap_store import WriteStore
+from src.state_function import PositionState
+
+class BakedTrajectories():
+  """Positions relative to the parent for every idx of a spawner.
+
+  positions[idx, k] is (x, y, angle) at k * dt seconds after spawning,
+  already including the spawner's offset. lengths[idx] is how many samples
+  are valid for idx, after which the spawn is despawned.
+  """
+  def __init__(self,
+      bake_key: str,
+      dt: float,
+      positions: np.ndarray,
+      lengths: np.ndarray):
+    self.bake_key = bake_key
+    self.dt = dt
+    self.positions = positions
+    self.lengths = lengths
+
+  def Save(self, path: str):
+    np.savez_compressed(
+      path,
+      bake_key=np.str_(self.bake_key),
+      dt=np.float64(self.dt),
+      positions=self.positions,
+      lengths=self.lengths)
+
+  @classmethod
+  def Load(cls, path: str) -> 'BakedTrajectories':
+    with np.load(path) as data:
+      return BakedTrajectories(
+        str(data['bake_key']), float(data['dt']), data['positions'], data['lengths'])
+
+  def SaveStore(self, path: str):
+    """Saves uncompressed so that LoadStore can map the file instead of reading it."""
+    WriteStore(
+      path,
+      {'positions': self.positions, 'lengths': self.lengths},
+      {'bake_key': self.bake_key, 'dt': self.dt})
+
+  @classmethod
+  def LoadStore(cls, path: str) -> 'BakedTrajectories':
+    """Loads a file written by SaveStore, see mmap_store.py.
+
+    positions is a read only view of the mapped file, shared with every other
+    process that loads the same file.
+    """
+    return BakedTrajectories.FromStore(OpenStore(path))
+
+  @classmethod
+  def FromStore(cls, store: MappedStore) -> 'BakedTrajectories':
+    return BakedTrajectories(
+      store.metadata['bake_key'],
+      store.metadata['dt'],
+      store.Array('positions'),
+      store.Array('lengths'))
+
+  def NewMovement(self, idx: int) -> 'BakedMovement':
+    return BakedMovement(self, idx)
+
+def RegisterBaked(trajectories: BakedTrajectories):
+  """Makes Spawners with the same bake_key created from now on use trajectories."""
+  Spawner.BAKED_[trajectories.bake_key] = trajectories
+
+def BakedFileName(bake_key: str, extension: str = '.npz') -> str:
+  return ''.join(c if c.isalnum() else '_' for c in bake_key) + extension
+
+def LoadBakedDir(path: str) -> list[str]:
+  """Registers every baked trajectory file (.npz or store) in a directory.
+
+  Returns:
+    The bake_keys that were registered.
+  """
+  keys = []
+  file_paths = glob.glob(os.path.join(path, '*.npz'))
+  file_paths += glob.glob(os.path.join(path, '*' + STORE_EXTENSION))
+  for file_path in sorted(file_paths):
+    if file_path.endswith(STORE_EXTENSION):
+      trajectories = BakedTrajectories.LoadStore(file_path)
+    else:
+      trajectories = BakedTrajectories.Load(file_path)
+    RegisterBaked(trajectories)
+    keys.append(trajectories.bake_key)
+  return keys
+
+class BakedMovement():
+  """Drop in replacement for Movement that replays baked positions by age.
+
+  Positions between samples are linearly interpolated.
+  """
+  def __init__(self, trajectories: BakedTrajectories, idx: int = 0):
+    self.trajectories_ = trajectories
+    self.state_fn_ids: list[str] = []
+    self.variables = frozenset()
+    self.static_position = None
+    self.Reset(idx)
+
+  def Reset(self, idx: int = 0):
+    self.idx = idx
+    self.current_idx = 0
+    self.current_time = 0
+    self.is_active = True
+    self.samples_ = self.trajectories_.positions[idx]
+    self.last_sample_ = int(self.trajectories_.lengths[idx]) - 1
+
+  def ReplaceStateFn(self, fn_id: str, state_fn) -> bool:
+    return False
+
+  def Calc(self, fn_vars: dict[str, float], dt: float) -> Optional[PositionState]:
+    self.current_time += dt
+    sample = self.current_time / self.trajectories_.dt
+    if sample > self.last_sample_:
+      self.is_active = False
+      return None
+    k = floor(sample)
+    frac = sample - k
+    x0, y0, a0 = self.samples_[k]
+    if frac == 0 or k == self.last_sample_:
+      return PositionState(float(x0), float(y0), float(a0))
+    x1, y1, a1 = self.samples_[k + 1]
+    return PositionState(
+      float(x0 + (x1 - x0) * frac),
+      float(y0 + (y1 - y0) * frac),
+      float(a0 + (a1 - a0) * frac))
+
+  def GetAndClearTransitionPosition(self) -> Optional[PositionState]:
+    # Transitions are already part of the baked positions.
+    return None
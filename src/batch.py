@@ -0,0 +1,261 @@
+"""Simulates many variants of a DefinedUnits file and reports statistics.
+
+Each variant overrides fields of the base units, e.g.
+  {"name": "dense", "seed": 3, "overrides": {
+    "spawner.create_second_flares.spawn_count": 40,
+    "spawner.create_second_flares.period": 0.5,
+    "polar.earthly_annual_cycle.r": "300"}}
+where keys are <unit kind>.<unit id>.<field>[.<field>...] and kinds are the
+DefinedUnits field names without the "_function" suffix for functions.
+
+The base units are compiled once into Templates in the parent process before
+the worker processes are forked, so workers share the compiled expressions
+copy-on-write and only recompile the units their variant overrides. Every
+variant runs in its own World at a fixed step, and results are streamed as
+one JSON object per line as soon as each variant finishes.
+
+Run with:
+  bazel run //src:batch -- --units=path/to/units.textproto \\
+    --variants=path/to/variants.jsonl --entity=sun --seconds=30 > results.jsonl
+"""
+import argparse
+from dataclasses import asdict
+from dataclasses import dataclass
+from dataclasses import field
+import json
+import multiprocessing
+import sys
+import time
+from typing import Any
+from typing import Iterable
+from typing import Iterator
+from typing import Optional
+
+from google.protobuf.message import Message
+from proto import spawner_pb2
+from src.gc_policy import FreezeLoadedUnits
+from src.gc_policy import UnfreezeLoadedUnits
+from src.hot_reload import ApplyDefinedUnits
+from src.loader import ParseDefinedUnits
+from src.transforms import ResolveAbsolutePositions
+from src.world import Templates
+from src.world import World
+
+# Override key prefixes and the DefinedUnits fields they refer to.
+UNIT_KINDS = {
+  'cartesian': 'cartesian_function',
+  'polar': 'polar_function',
+  'delta': 'delta_function',
+  'entity': 'entity',
+  'spawner': 'spawner',
+}
+
+@dataclass
+class Variant:
+  name: str = ''
+  overrides: dict[str, Any] = field(default_factory=dict)
+  seed: Optional[int] = None
+
+  @classmethod
+  def FromJson(cls, line: str) -> 'Variant':
+    values = json.loads(line)
+    return cls(values.get('name', ''), values.get('overrides', {}), values.get('seed'))
+
+@dataclass
+class Probe:
+  """Where a player would be, to count how often bullets reach it."""
+  x: float = 640
+  y: float = 600
+  radius: float = 8
+
+@dataclass
+class VariantStats:
+  name: str
+  index: int
+  peak_live: int = 0
+  mean_live: float = 0
+  # Most entities in any cell_size x cell_size square in a single frame.
+  peak_cell: int = 0
+  # Frames with at least one entity within the probe radius.
+  hit_frames: int = 0
+  # Entities within the probe radius, summed over every frame.
+  hits: int = 0
+  wall_seconds: float = 0
+  error: str = ''
+
+def _SetField(message: Message, path: list[str], value: Any):
+  for name in path[:-1]:
+    message = getattr(message, name)
+  name = path[-1]
+  if name not in message.DESCRIPTOR.fields_by_name:
+    raise KeyError(f'{message.DESCRIPTOR.name} has no field "{name}"')
+  current = getattr(message, name)
+  if hasattr(current, 'extend'):
+    # Repeated fields can't be assigned, e.g. Movement.lifetime.
+    del current[:]
+    current.extend(value if isinstance(value, list) else [value])
+  else:
+    setattr(message, name, value)
+
+def ApplyOverrides(
+    defined: spawner_pb2.DefinedUnits,
+    overrides: dict[str, Any]) -> spawner_pb2.DefinedUnits:
+  """The units of defined changed by overrides, defined itself is left alone.
+
+  Raises:
+    KeyError: if an override refers to a unit or field that doesn't exist.
+  """
+  changed: dict[tuple[str, str], Message] = {}
+  for key, value in overrides.items():
+    kind, unit_id, *path = key.split('.')
+    if kind not in UNIT_KINDS or not path:
+      raise KeyError(f'Invalid override "{key}"')
+    units_field = UNIT_KINDS[kind]
+    unit = changed.get((units_field, unit_id))
+    if unit is None:
+      source = next(
+        (u for u in getattr(defined, units_field) if u.id.id == unit_id), None)
+      if source is None:
+        raise KeyError(f'No {units_field} "{unit_id}" to override')
+      unit = changed[(units_field, unit_id)] = type(source)()
+      unit.CopyFrom(source)
+    _SetField(unit, path, value)
+
+  res = spawner_pb2.DefinedUnits()
+  for (units_field, _), unit in changed.items():
+    getattr(res, units_field).add().CopyFrom(unit)
+  return res
+
+def SimulateVariant(
+    templates: Templates,
+    defined: spawner_pb2.DefinedUnits,
+    variant: Variant,
+    index: int,
+    entity_ids: list[str],
+    seconds: float,
+    dt: float = 1 / 60,
+    probe: Probe = Probe(),
+    cell_size: float = 64) -> VariantStats:
+  """Runs variant headless for seconds and collects its statistics."""
+  stats = VariantStats(variant.name, index)
+  start = time.perf_counter()
+  try:
+    world = World(templates, seed=variant.seed)
+    with world:
+      ApplyDefinedUnits(ApplyOverrides(defined, variant.overrides), world.root)
+    for entity_id in entity_ids:
+      world.Add(entity_id)
+
+    frames = round(seconds / dt)
+    total_live = 0
+    radius_squared = probe.radius * probe.radius
+    with world:
+      for _ in range(frames):
+        world.root.Update(world.globals, dt)
+        ResolveAbsolutePositions(world.root)
+        cells: dict[tuple[int, int], int] = {}
+        live = hits = 0
+        for entity in world.root.Walk():
+          if entity is world.root:
+            continue
+          live += 1
+          position = entity.AbsolutePosition()
+          cell = (int(position.x // cell_size), int(position.y // cell_size))
+          cells[cell] = cells.get(cell, 0) + 1
+          dx = position.x - probe.x
+          dy = position.y - probe.y
+          if dx * dx + dy * dy <= radius_squared:
+            hits += 1
+        total_live += live
+        stats.peak_live = max(stats.peak_live, live)
+        stats.peak_cell = max(stats.peak_cell, max(cells.values(), default=0))
+        stats.hits += hits
+        stats.hit_frames += hits > 0
+    stats.mean_live = total_live / frames if frames else 0
+  except Exception as e:
+    stats.error = f'{type(e).__name__}: {e}'
+  stats.wall_seconds = time.perf_counter() - start
+  return stats
+
+@dataclass
+class _Job:
+  templates: Templates
+  defined: spawner_pb2.DefinedUnits
+  entity_ids: list[str]
+  seconds: float
+  dt: float
+  probe: Probe
+  cell_size: float
+
+# Set in the parent before forking so workers inherit it instead of unpickling it.
+_JOB: Optional[_Job] = None
+
+def _RunIndexed(indexed: tuple[int, Variant]) -> VariantStats:
+  index, variant = indexed
+  job = _JOB
+  return SimulateVariant(
+    job.templates, job.defined, variant, index, job.entity_ids,
+    job.seconds, job.dt, job.probe, job.cell_size)
+
+def RunBatch(
+    defined: spawner_pb2.DefinedUnits,
+    variants: Iterable[Variant],
+    entity_ids: list[str],
+    seconds: float,
+    dt: float = 1 / 60,
+    processes: int = 1,
+    probe: Probe = Probe(),
+    cell_size: float = 64) -> Iterator[VariantStats]:
+  """Simulates every variant, yielding results in the order they finish.
+
+  With processes > 1 variants run on a pool of forked processes.
+  """
+  global _JOB
+  _JOB = _Job(
+    Templates.Compile(defined), defined, entity_ids, seconds, dt, probe, cell_size)
+  try:
+    indexed = enumerate(variants)
+    if processes <= 1:
+      yield from map(_RunIndexed, indexed)
+      return
+    # Compiled templates are never modified, so keep the GC from touching
+    # (and un-sharing) their pages in the workers.
+    FreezeLoadedUnits()
+    try:
+      with multiprocessing.get_context('fork').Pool(processes) as pool:
+        yield from pool.imap_unordered(_RunIndexed, indexed)
+    finally:
+      UnfreezeLoadedUnits()
+  finally:
+    _JOB = None
+
+def Main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--units', required=True, help='Base DefinedUnits textproto.')
+  parser.add_argument(
+    '--variants', required=True, help='JSON lines of variants, "-" for stdin.')
+  parser.add_argument(
+    '--entity', action='append', required=True,
+    help='Ids of the entities to add to each world.')
+  parser.add_argument('--seconds', type=float, default=30)
+  parser.add_argument('--dt', type=float, default=1 / 60)
+  parser.add_argument('--processes', type=int, default=multiprocessing.cpu_count())
+  parser.add_argument('--probe_x', type=float, default=Probe.x)
+  parser.add_argument('--probe_y', type=float, default=Probe.y)
+  parser.add_argument('--probe_radius', type=float, default=Probe.radius)
+  parser.add_argument('--cell_size', type=float, default=64)
+  args = parser.parse_args()
+
+  with open(args.units, 'r') as f:
+    defined = ParseDefinedUnits(f.read())
+  variants_file = sys.stdin if args.variants == '-' else open(args.variants, 'r')
+  with variants_file:
+    variants = [Variant.FromJson(line) for line in variants_file if line.strip()]
+  results = RunBatch(
+    defined, variants, args.entity, args.seconds, args.dt, args.processes,
+    Probe(args.probe_x, args.probe_y, args.probe_radius), args.cell_size)
+  for stats in results:
+    print(json.dumps(asdict(stats)), flush=True)
+
+if __name__ == '__main__':
+  Main()
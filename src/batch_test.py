@@ -0,0 +1,96 @@
+import unittest
+
+from src import batch
+from src.loader import ParseDefinedUnits
+
+UNITS_PB_TXT = """
+  polar_function {
+    id { id: 'batch_out' }
+    r: '100 * t'
+    theta: 'tau * idx / 8'
+  }
+
+  entity {
+    id { id: 'batch_bullet' }
+    movement {
+      state_fn { id { id: 'batch_out' } }
+      lifetime: 1
+      loop: false
+    }
+  }
+
+  spawner {
+    id { id: 'batch_ring' }
+    spawn_entity { id { id: 'batch_bullet' } }
+    spawn_count: 8
+    spawn_time_fn: '0'
+    period: 0.5
+    follow_center: true
+  }
+
+  entity {
+    id { id: 'batch_emitter' }
+    movement {
+      state_fn { cartesian { x: '640' y: '360' } }
+      lifetime: 0
+    }
+    spawner { id { id: 'batch_ring' } }
+  }
+"""
+
+class TestApplyOverrides(unittest.TestCase):
+  def setUp(self):
+    self.defined = ParseDefinedUnits(UNITS_PB_TXT)
+
+  def test_onlyReturnsChangedUnits(self):
+    changed = batch.ApplyOverrides(self.defined, {
+      'spawner.batch_ring.spawn_count': 16,
+      'entity.batch_bullet.movement.lifetime': 2,
+    })
+
+    self.assertEqual(len(changed.spawner), 1)
+    self.assertEqual(changed.spawner[0].spawn_count, 16)
+    self.assertEqual(list(changed.entity[0].movement.lifetime), [2])
+    self.assertEqual(len(changed.polar_function), 0)
+    self.assertEqual(self.defined.spawner[0].spawn_count, 8)
+
+  def test_unknownUnitOrField_raises(self):
+    with self.assertRaises(KeyError):
+      batch.ApplyOverrides(self.defined, {'spawner.missing.period': 1})
+    with self.assertRaises(KeyError):
+      batch.ApplyOverrides(self.defined, {'spawner.batch_ring.missing': 1})
+
+class TestRunBatch(unittest.TestCase):
+  def setUp(self):
+    self.defined = ParseDefinedUnits(UNITS_PB_TXT)
+    self.variants = [
+      batch.Variant('base'),
+      batch.Variant('dense', {'spawner.batch_ring.spawn_count': 32}),
+      batch.Variant('broken', {'polar.batch_out.missing': '1'}),
+    ]
+
+  def Run(self, processes: int) -> dict[str, batch.VariantStats]:
+    results = batch.RunBatch(
+      self.defined, self.variants, ['batch_emitter'], seconds=2, processes=processes,
+      probe=batch.Probe(640, 360, 30))
+    return {stats.name: stats for stats in results}
+
+  def test_variants_applyOverrides(self):
+    results = self.Run(processes=1)
+
+    self.assertEqual(results['base'].peak_live, 1 + 2 * 8)
+    self.assertEqual(results['dense'].peak_live, 1 + 2 * 32)
+    self.assertGreater(results['dense'].hits, results['base'].hits)
+    self.assertIn('KeyError', results['broken'].error)
+
+  def test_processPool_matchesInline(self):
+    inline = self.Run(processes=1)
+    forked = self.Run(processes=2)
+
+    for name, stats in inline.items():
+      self.assertEqual(forked[name].peak_live, stats.peak_live)
+      self.assertEqual(forked[name].hits, stats.hits)
+      self.assertEqual(forked[name].peak_cell, stats.peak_cell)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,621 @@
+"""Benchmarks for spawn-heavy scenarios.
+
+Run with:
+  bazel run //src:benchmark
+"""
+import gc
+import os
+import subprocess
+import sys
+import time
+
+from proto import spawner_pb2
+from src.entity import Entity
+from src.entity import Spawner
+from src.gc_policy import FrameGcPolicy
+from src.gc_policy import FreezeLoadedUnits
+from src.gc_policy import UnfreezeLoadedUnits
+from src.headless import LiveCount
+from src.headless import RunHeadless
+from src.instrumentation import INSTRUMENTATION
+from src.loader import ParseDefinedUnits
+from src.loader import RegisterDefinedUnits
+from src.parallel_update import IsFreeThreaded
+from src.parallel_update import ParallelUpdater
+from src.snapshot import RestoreSnapshot
+from src.snapshot import TakeSnapshot
+from src.spawn_queue import SpawnQueue
+from src.spectator import Broadcaster
+from src.state_function import EXPRESSION_CACHE
+from src.state_function import GetGlobals
+from src.transforms import ResolveAbsolutePositions
+
+GLOBALS_ = GetGlobals()
+
+# A single emitter that fires a dense ring of short lived bullets every period.
+SPAWN_HEAVY_PB_TXT = """
+  polar_function {
+    id { id: 'benchmark_ring_out' }
+    r: '200 * t'
+    theta: 'tau * idx / 200'
+    angle: 'tau * idx / 200'
+  }
+
+  entity {
+    id { id: 'benchmark_bullet' }
+    movement {
+      state_fn { id { id: 'benchmark_ring_out' } }
+      lifetime: 1.5
+      loop: false
+    }
+  }
+
+  spawner {
+    id { id: 'benchmark_ring' }
+    spawn_entity { id { id: 'benchmark_bullet' } }
+    spawn_count: 200
+    spawn_time_fn: 'idx / 400'
+    period: 0.5
+    follow_center: true
+  }
+
+  entity {
+    id { id: 'benchmark_emitter' }
+    movement {
+      state_fn { cartesian { x: '640' y: '360' } }
+      lifetime: 0
+    }
+    spawner { id { id: 'benchmark_ring' } }
+  }
+
+  entity {
+    id { id: 'benchmark_world_space_emitter' }
+    movement {
+      state_fn { cartesian { x: '640' y: '360' } }
+      lifetime: 0
+    }
+    spawner {
+      spawn_entity { id { id: 'benchmark_bullet' } }
+      spawn_count: 200
+      spawn_time_fn: 'idx / 400'
+      period: 0.5
+      offset_fn { cartesian { x: '640' y: '360' } }
+    }
+  }
+
+  entity {
+    id { id: 'benchmark_idle_emitter' }
+    movement {
+      state_fn { cartesian { x: '640 + idx % 100' y: '360' } }
+      lifetime: 0
+    }
+    spawner {
+      spawn_entity { id { id: 'benchmark_bullet' } }
+      spawn_count: 1
+      spawn_time_fn: '5 + idx / 1000'
+      period: 0
+      follow_center: true
+    }
+  }
+
+  entity {
+    id { id: 'benchmark_orbit_sun' }
+    movement {
+      state_fn { cartesian { x: '640 + 200 * cos(t + idx)' y: '360 + 200 * sin(t + idx)' angle: 't' } }
+      lifetime: 0
+    }
+    spawner {
+      spawn_entity {
+        movement {
+          state_fn { polar { r: '40 + 5 * sin(t)' theta: 'tau * idx / 180' angle: 'tau * idx / 180' } }
+          lifetime: 0
+        }
+      }
+      spawn_count: 180
+      spawn_time_fn: '0'
+      follow_center: true
+      follow_angle: true
+    }
+  }
+
+  entity {
+    id { id: 'benchmark_target' }
+    hit_radius: 8
+    alignment: 1
+    movement {
+      state_fn { cartesian { x: '640 + 500 * cos(t + idx)' y: '360 + 300 * sin(t + 2 * idx)' } }
+      lifetime: 0
+    }
+  }
+
+  entity {
+    id { id: 'benchmark_homing' }
+    alignment: 2
+    movement {
+      state_fn { delta { dx: '(tx - x) * 0.5' dy: '(ty - y) * 0.5' } }
+      lifetime: 0
+    }
+  }
+
+  entity {
+    id { id: 'benchmark_flower' }
+    movement {
+      state_fn { cartesian { x: '640' y: '360' } }
+      lifetime: 0
+    }
+    spawner {
+      spawn_entity {
+        movement {
+          state_fn { polar {
+            r: '100 + (40 * sin(t) * cos(t / 3) + 10 * sin(5 * t)) * cos(6 * tau * idx / 360)'
+            theta: 'tau * idx / 360 + 0.25 * sin(t) * cos(t / 2)'
+            angle: 'tau * idx / 360'
+          } }
+          lifetime: 0
+        }
+      }
+      spawn_count: 360
+      spawn_time_fn: '0'
+      follow_center: true
+    }
+  }
+"""
+
+SOLAR_SYSTEM_PATH = os.path.join(
+  os.path.dirname(__file__), 'simple_solar_system.textproto')
+
+_LOADED = False
+_SOLAR_SYSTEM_LOADED = False
+
+def LoadBenchmarkUnits():
+  global _LOADED
+  if not _LOADED:
+    RegisterDefinedUnits(ParseDefinedUnits(SPAWN_HEAVY_PB_TXT))
+    _LOADED = True
+
+class GcPauseTimer():
+  """Records the duration of every garbage collection while active."""
+  def __init__(self):
+    self.pauses: list[float] = []
+    self.start_ = 0.0
+
+  def Callback_(self, phase: str, info: dict):
+    if phase == 'start':
+      self.start_ = time.perf_counter()
+    else:
+      self.pauses.append(time.perf_counter() - self.start_)
+
+  def __enter__(self) -> 'GcPauseTimer':
+    gc.callbacks.append(self.Callback_)
+    return self
+
+  def __exit__(self, *args):
+    gc.callbacks.remove(self.Callback_)
+
+  def Stats(self) -> dict[str, float]:
+    return {
+      'gc_count': len(self.pauses),
+      'gc_total_ms': sum(self.pauses) * 1000,
+      'gc_max_ms': max(self.pauses, default=0) * 1000,
+    }
+
+def RunSpawnHeavy(
+    frames: int = 600,
+    dt: float = 1 / 60,
+    pooled: bool = True,
+    world_space: bool = False) -> dict[str, float]:
+  """Runs the spawn heavy emitter and reports frame, GC, and pool stats.
+
+  With world_space, bullets don't follow the emitter and are added to the
+  world directly.
+  """
+  LoadBenchmarkUnits()
+  Entity.POOL_.Clear()
+  Entity.POOL_.enabled = pooled
+  Entity.CreateWorld()
+
+  emitter_pb = spawner_pb2.Entity()
+  emitter_pb.id.id = (
+    'benchmark_world_space_emitter' if world_space else 'benchmark_emitter')
+  Entity.ZA_WARUDO.AddChild(Entity(emitter_pb))
+
+  frame_times = []
+  gc.collect()
+  with GcPauseTimer() as gc_timer:
+    for _ in range(frames):
+      start = time.perf_counter()
+      Entity.ZA_WARUDO.Update(GLOBALS_, dt)
+      frame_times.append(time.perf_counter() - start)
+
+  Entity.ZA_WARUDO.children_.clear()
+  Entity.POOL_.enabled = True
+  frame_times.sort()
+  res = {
+    'pooled': pooled,
+    'world_space': world_space,
+    'frame_mean_ms': sum(frame_times) / len(frame_times) * 1000,
+    'frame_p99_ms': frame_times[int(len(frame_times) * 0.99)] * 1000,
+    'frame_max_ms': frame_times[-1] * 1000,
+  }
+  res |= gc_timer.Stats()
+  if pooled:
+    res['pool_hit_rate'] = Entity.POOL_.HitRate()
+  return res
+
+def RunIdleEmitters(
+    frames: int = 600,
+    dt: float = 1 / 60,
+    emitter_count: int = 3000,
+    queued: bool = True) -> dict[str, float]:
+  """Many emitters that rarely spawn, polled every frame or driven by a SpawnQueue."""
+  LoadBenchmarkUnits()
+  Spawner.QUEUE_ = SpawnQueue() if queued else None
+  Entity.CreateWorld()
+  emitter_pb = spawner_pb2.Entity()
+  emitter_pb.id.id = 'benchmark_idle_emitter'
+  for i in range(emitter_count):
+    Entity.ZA_WARUDO.AddChild(Entity(emitter_pb, idx=i))
+
+  frame_times = RunHeadless(frames, dt)
+
+  Spawner.QUEUE_ = None
+  Entity.ZA_WARUDO.children_.clear()
+  frame_times.sort()
+  return {
+    'queued': queued,
+    'frame_mean_ms': sum(frame_times) / len(frame_times) * 1000,
+    'frame_p99_ms': frame_times[int(len(frame_times) * 0.99)] * 1000,
+  }
+
+def RunOrbitingSatellites(
+    frames: int = 300,
+    dt: float = 1 / 60,
+    sun_count: int = 20,
+    batched: bool = True) -> dict[str, float]:
+  """Rotating suns with 180 satellites each, resolving every absolute position per frame.
+
+  This is what rendering does after every update. With batched, the
+  positions of each sun's satellites are computed as one array operation.
+  """
+  LoadBenchmarkUnits()
+  Entity.CreateWorld()
+  sun_pb = spawner_pb2.Entity()
+  sun_pb.id.id = 'benchmark_orbit_sun'
+  for i in range(sun_count):
+    Entity.ZA_WARUDO.AddChild(Entity(sun_pb, idx=i))
+  # Spawn every satellite before measuring.
+  Entity.ZA_WARUDO.Update(GLOBALS_, dt)
+
+  update_times = []
+  transform_times = []
+  for _ in range(frames):
+    start = time.perf_counter()
+    Entity.ZA_WARUDO.Update(GLOBALS_, dt)
+    updated = time.perf_counter()
+    if batched:
+      ResolveAbsolutePositions(Entity.ZA_WARUDO)
+    else:
+      for entity in Entity.ZA_WARUDO.Walk():
+        entity.AbsolutePosition()
+    transform_times.append(time.perf_counter() - updated)
+    update_times.append(updated - start)
+
+  live = LiveCount()
+  Entity.ZA_WARUDO.children_.clear()
+  return {
+    'batched': batched,
+    'live': live,
+    'update_mean_ms': sum(update_times) / len(update_times) * 1000,
+    'transform_mean_ms': sum(transform_times) / len(transform_times) * 1000,
+  }
+
+def RunSharedTimeFlower(
+    frames: int = 300,
+    dt: float = 1 / 60,
+    flower_count: int = 10,
+    cached: bool = True) -> dict[str, float]:
+  """Rings of 360 petals spawned together, so every petal of a ring has the same t.
+
+  With cached, the t only parts of the petal expressions are evaluated once
+  per ring per frame through EXPRESSION_CACHE.
+  """
+  LoadBenchmarkUnits()
+  Entity.CreateWorld()
+  EXPRESSION_CACHE.enabled = cached
+  hits = EXPRESSION_CACHE.hits
+  misses = EXPRESSION_CACHE.misses
+  flower_pb = spawner_pb2.Entity()
+  flower_pb.id.id = 'benchmark_flower'
+  for i in range(flower_count):
+    Entity.ZA_WARUDO.AddChild(Entity(flower_pb, idx=i))
+  Entity.ZA_WARUDO.Update(GLOBALS_, dt)
+
+  frame_times = []
+  try:
+    for _ in range(frames):
+      start = time.perf_counter()
+      Entity.ZA_WARUDO.Update(GLOBALS_, dt)
+      frame_times.append(time.perf_counter() - start)
+  finally:
+    EXPRESSION_CACHE.enabled = True
+  hits = EXPRESSION_CACHE.hits - hits
+  misses = EXPRESSION_CACHE.misses - misses
+
+  live = LiveCount()
+  Entity.ZA_WARUDO.children_.clear()
+  return {
+    'cached': cached,
+    'live': live,
+    'frame_mean_ms': sum(frame_times) / len(frame_times) * 1000,
+    'hit_rate': hits / (hits + misses) if hits + misses else 0.0,
+  }
+
+def RunHoming(
+    frames: int = 120,
+    dt: float = 1 / 60,
+    homing_count: int = 3000,
+    target_count: int = 10) -> dict[str, float]:
+  """Homing bullets that each need their nearest target every frame."""
+  LoadBenchmarkUnits()
+  world = Entity.CreateWorld()
+  for kind, count in (('benchmark_target', target_count), ('benchmark_homing', homing_count)):
+    entity_pb = spawner_pb2.Entity()
+    entity_pb.id.id = kind
+    for i in range(count):
+      world.AddChild(Entity(entity_pb, idx=i))
+  builds = Entity.TARGETS_.builds
+
+  frame_times = []
+  for _ in range(frames):
+    start = time.perf_counter()
+    world.Update(GLOBALS_, dt)
+    frame_times.append(time.perf_counter() - start)
+
+  world.children_.clear()
+  return {
+    'homing': homing_count,
+    'targets': target_count,
+    'frame_mean_ms': sum(frame_times) / len(frame_times) * 1000,
+    'builds_per_frame': (Entity.TARGETS_.builds - builds) / frames,
+  }
+
+def LoadDenseSolarSystem(flare_count: int):
+  """Loads the solar system with flares sped up to reach flare_count quickly."""
+  global _SOLAR_SYSTEM_LOADED
+  if _SOLAR_SYSTEM_LOADED:
+    return
+  with open(SOLAR_SYSTEM_PATH, 'r') as f:
+    defined = ParseDefinedUnits(f.read())
+  for spawner_pb in defined.spawner:
+    if spawner_pb.id.id == 'create_second_flares':
+      spawner_pb.spawn_count = flare_count
+      spawner_pb.spawn_time_fn = f'5 * idx / {flare_count}'
+  RegisterDefinedUnits(defined)
+  _SOLAR_SYSTEM_LOADED = True
+
+def RunSolarSystem(
+    frames: int = 480,
+    dt: float = 1 / 60,
+    flare_count: int = 10000,
+    frame_gc: bool = True,
+    flare_interval: int = 1) -> dict[str, float]:
+  """Runs the solar system up to flare_count bullets and reports GC pauses.
+
+  With frame_gc, loaded units are frozen and collections are only run at
+  frame boundaries through FrameGcPolicy. Flares are treated as cosmetic and
+  only simulated every flare_interval frames.
+  """
+  LoadDenseSolarSystem(flare_count)
+  flare_pb = Entity.SAVED_['solar_flare']
+  if flare_interval > 1:
+    lod_flare_pb = spawner_pb2.Entity()
+    lod_flare_pb.CopyFrom(flare_pb)
+    lod_flare_pb.update_policy.interval = flare_interval
+    Entity.Save(lod_flare_pb, replace=True)
+  Entity.CreateWorld()
+  sun_pb = spawner_pb2.Entity()
+  sun_pb.id.id = 'sun'
+  Entity.ZA_WARUDO.AddChild(Entity(sun_pb))
+
+  INSTRUMENTATION.Reset()
+  gc.collect()
+  if frame_gc:
+    FreezeLoadedUnits()
+    with FrameGcPolicy() as policy:
+      frame_times = RunHeadless(frames, dt, policy)
+    UnfreezeLoadedUnits()
+    gc_stats = INSTRUMENTATION.Summary()
+    res = {
+      'gc_count': sum(v for k, v in gc_stats.items() if k.endswith('.count')),
+      'gc_total_ms': sum(v for k, v in gc_stats.items() if k.endswith('.total_ms')),
+      'gc_max_ms': max(
+        (v for k, v in gc_stats.items() if k.endswith('.max_ms')), default=0),
+    }
+  else:
+    with GcPauseTimer() as gc_timer:
+      frame_times = RunHeadless(frames, dt)
+    res = gc_timer.Stats()
+
+  live = LiveCount()
+  Entity.ZA_WARUDO.children_.clear()
+  if flare_interval > 1:
+    Entity.Save(flare_pb, replace=True)
+  frame_times.sort()
+  return {
+    'frame_gc': frame_gc,
+    'flare_interval': flare_interval,
+    'live': live,
+    'frame_mean_ms': sum(frame_times) / len(frame_times) * 1000,
+    'frame_p99_ms': frame_times[int(len(frame_times) * 0.99)] * 1000,
+    'frame_max_ms': frame_times[-1] * 1000,
+  } | res
+
+def RunParallelScaling(
+    threads: int,
+    frames: int = 240,
+    dt: float = 1 / 60,
+    flare_count: int = 10000) -> dict[str, float]:
+  """Runs the dense solar system with its flares updated on threads threads.
+
+  Threads are forced on so the overhead under the GIL shows as well.
+  """
+  LoadDenseSolarSystem(flare_count)
+  Entity.CreateWorld()
+  sun_pb = spawner_pb2.Entity()
+  sun_pb.id.id = 'sun'
+  Entity.ZA_WARUDO.AddChild(Entity(sun_pb))
+
+  frame_times = []
+  gc.collect()
+  with ParallelUpdater(threads, force=True) as updater:
+    for _ in range(frames):
+      start = time.perf_counter()
+      updater.Update(GLOBALS_, dt)
+      frame_times.append(time.perf_counter() - start)
+
+  live = LiveCount()
+  Entity.ZA_WARUDO.children_.clear()
+  frame_times.sort()
+  return {
+    'threads': threads,
+    'free_threaded': IsFreeThreaded(),
+    'live': live,
+    'frame_mean_ms': sum(frame_times) / len(frame_times) * 1000,
+    'frame_p99_ms': frame_times[int(len(frame_times) * 0.99)] * 1000,
+  }
+
+def RunSpectatorStream(
+    frames: int = 480,
+    dt: float = 1 / 60,
+    flare_count: int = 10000) -> dict[str, float]:
+  """Streams the dense solar system, comparing frame sizes with full snapshots."""
+  LoadDenseSolarSystem(flare_count)
+  Entity.CreateWorld()
+  sun_pb = spawner_pb2.Entity()
+  sun_pb.id.id = 'sun'
+  Entity.ZA_WARUDO.AddChild(Entity(sun_pb))
+
+  broadcaster = Broadcaster()
+  frame_bytes = []
+  encode_times = []
+  for _ in range(frames):
+    Entity.ZA_WARUDO.Update(GLOBALS_, dt)
+    start = time.perf_counter()
+    frame_bytes.append(len(broadcaster.Frame(dt)))
+    encode_times.append(time.perf_counter() - start)
+  keyframe_bytes = len(broadcaster.KeyFrame())
+
+  live = LiveCount()
+  Entity.ZA_WARUDO.children_.clear()
+  last_second = frame_bytes[-round(1 / dt):]
+  return {
+    'live': live,
+    'frame_mean_bytes': sum(frame_bytes) / len(frame_bytes),
+    'last_second_mean_bytes': sum(last_second) / len(last_second),
+    'keyframe_bytes': keyframe_bytes,
+    'streamed_states': broadcaster.states,
+    'encode_mean_ms': sum(encode_times) / len(encode_times) * 1000,
+  }
+
+def RunSnapshotRestore(
+    frames: int = 240,
+    dt: float = 1 / 60,
+    flare_count: int = 10000,
+    repeat: int = 10) -> dict[str, float]:
+  """Checkpoints the dense solar system and rewinds it, compared with a frame."""
+  LoadDenseSolarSystem(flare_count)
+  Entity.CreateWorld()
+  sun_pb = spawner_pb2.Entity()
+  sun_pb.id.id = 'sun'
+  Entity.ZA_WARUDO.AddChild(Entity(sun_pb))
+  for _ in range(frames):
+    Entity.ZA_WARUDO.Update(GLOBALS_, dt)
+
+  snapshot_times = []
+  restore_times = []
+  update_times = []
+  with FrameGcPolicy() as policy:
+    for _ in range(repeat):
+      start = time.perf_counter()
+      checkpoint = TakeSnapshot()
+      snapshot_times.append(time.perf_counter() - start)
+      start = time.perf_counter()
+      Entity.ZA_WARUDO.Update(GLOBALS_, dt)
+      update_times.append(time.perf_counter() - start)
+      start = time.perf_counter()
+      RestoreSnapshot(checkpoint)
+      restore_times.append(time.perf_counter() - start)
+      policy.OnFrameEnd()
+
+  live = LiveCount()
+  Entity.ZA_WARUDO.children_.clear()
+  return {
+    'live': live,
+    'snapshot_bytes': len(checkpoint),
+    'snapshot_mean_ms': sum(snapshot_times) / repeat * 1000,
+    'restore_mean_ms': sum(restore_times) / repeat * 1000,
+    'update_mean_ms': sum(update_times) / repeat * 1000,
+  }
+
+# Cumulative milliseconds each module may take to import in a fresh process.
+# Tools like headless validation import these before doing anything else.
+IMPORT_BUDGETS_MS = {
+  'src.state_function': 75,
+  'src.entity': 100,
+  'src.loader': 110,
+  'src.headless': 100,
+}
+
+def MeasureImportTime(module: str, repeat: int = 5) -> float:
+  """Fastest cumulative milliseconds to import module, from python -X importtime."""
+  env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+  best = float('inf')
+  for _ in range(repeat):
+    stderr = subprocess.run(
+      [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+      env=env, capture_output=True, text=True, check=True).stderr
+    for line in stderr.splitlines():
+      # import time: self [us] | cumulative | imported package
+      fields = line.split('|')
+      if len(fields) == 3 and fields[2].strip() == module:
+        best = min(best, int(fields[1]) / 1000)
+  return best
+
+def RunImportTimes() -> dict[str, dict[str, float]]:
+  return {
+    module: {
+      'import_ms': MeasureImportTime(module),
+      'budget_ms': budget,
+    } for module, budget in IMPORT_BUDGETS_MS.items()}
+
+def FormatResult(name: str, result: dict) -> str:
+  values = ' '.join(
+    f'{k}={v:.3f}' if isinstance(v, float) else f'{k}={v}'
+    for k, v in result.items())
+  return f'{name}: {values}'
+
+def Main():
+  for module, result in RunImportTimes().items():
+    over_budget = result['import_ms'] > result['budget_ms']
+    print(FormatResult(f'import_{module}', result | {'over_budget': over_budget}))
+  print(FormatResult('spawn_heavy_unpooled', RunSpawnHeavy(pooled=False)))
+  print(FormatResult('spawn_heavy_pooled', RunSpawnHeavy(pooled=True)))
+  print(FormatResult('spawn_heavy_world_space', RunSpawnHeavy(world_space=True)))
+  print(FormatResult('idle_emitters_polled', RunIdleEmitters(queued=False)))
+  print(FormatResult('idle_emitters_queued', RunIdleEmitters(queued=True)))
+  print(FormatResult('solar_system_default_gc', RunSolarSystem(frame_gc=False)))
+  print(FormatResult('solar_system_frame_gc', RunSolarSystem(frame_gc=True)))
+  print(FormatResult('solar_system_lod', RunSolarSystem(flare_interval=4)))
+  print(FormatResult('orbiting_per_entity', RunOrbitingSatellites(batched=False)))
+  print(FormatResult('orbiting_batched', RunOrbitingSatellites(batched=True)))
+  print(FormatResult('flower_uncached', RunSharedTimeFlower(cached=False)))
+  print(FormatResult('flower_cached', RunSharedTimeFlower(cached=True)))
+  print(FormatResult('homing_few_targets', RunHoming(target_count=10)))
+  print(FormatResult('homing_many_targets', RunHoming(target_count=500)))
+  print(FormatResult('spectator_stream', RunSpectatorStream()))
+  print(FormatResult('snapshot_restore', RunSnapshotRestore()))
+  for threads in (1, 2, 4, 8):
+    print(FormatResult(f'parallel_{threads}', RunParallelScaling(threads)))
+
+if __name__ == '__main__':
+  Main()
@@ -0,0 +1,235 @@
+"""Estimates how expensive patterns are without running them.
+
+Walks Spawner.spawn_entity -> Entity.spawner recursively over DefinedUnits
+and estimates, per live instance of an entity:
+  peak_live: Most entities alive at once in its subtree, including itself.
+  spawns_per_second: Sustained spawns of periodic spawners in its subtree.
+  evals_per_frame: Expressions evaluated per frame at peak_live, counting
+    expressions that only depend on idx or constants as free.
+
+Spawn times are evaluated like Spawner does, so the peak of each spawner is
+the most spawns alive within any window of the spawned entity's lifetime.
+Entities that never despawn spawned periodically, or patterns that spawn
+themselves, are unbounded (inf).
+
+Run with:
+  bazel run //src:complexity -- --units=path/to/units.textproto --max_live=5000
+"""
+import argparse
+from dataclasses import dataclass
+from dataclasses import field
+from math import ceil
+from math import inf
+import sys
+from typing import Optional
+
+from google.protobuf.message import Message
+from proto import spawner_pb2
+from src.entity import Entity
+from src.entity import Spawner
+from src import state_function
+from src.loader import ParseDefinedUnits
+from src.state_function import ExpressionVariables
+from src.state_function import GetGlobals
+from src.state_function import MakeFn
+
+GLOBALS_ = GetGlobals()
+FRAME_DT = 1 / 60
+
+@dataclass
+class ComplexityEstimate:
+  peak_live: float = 1
+  spawns_per_second: float = 0
+  evals_per_frame: float = 0
+  # Seconds until the entity despawns, inf if never.
+  lifetime: float = inf
+  warnings: list[str] = field(default_factory=list)
+
+def _Scale(count: float, value: float) -> float:
+  # Avoids inf * 0 = nan for spawners that never spawn anything.
+  return count * value if count and value else 0
+
+def PeakConcurrent(
+    spawn_times: list[float],
+    period: float,
+    lifetime: float,
+    owner_lifetime: float = inf) -> float:
+  """Most spawns alive at once, if each lives for lifetime seconds.
+
+  Spawns only happen before owner_lifetime.
+  """
+  times = sorted(max(t, 0) for t in spawn_times)
+  if not times:
+    return 0
+  if period > 0:
+    if lifetime == inf:
+      return inf if owner_lifetime == inf else len(times) * ceil(owner_lifetime / period)
+    # Enough waves to see every spawn that can overlap the last one.
+    waves = ceil(lifetime / period) + 1
+    if owner_lifetime != inf:
+      waves = min(waves, ceil(owner_lifetime / period))
+    times = [t + wave * period for wave in range(waves) for t in times]
+  times = [t for t in times if t < owner_lifetime]
+  if lifetime == inf:
+    return len(times)
+  peak = 0
+  start = 0
+  for end, t in enumerate(times):
+    # Spawns live for [spawn time, spawn time + lifetime).
+    while times[start] + lifetime <= t + 1e-9:
+      start += 1
+    peak = max(peak, end - start + 1)
+  return peak
+
+class ComplexityEstimator():
+  """Estimates entities from a DefinedUnits, falling back to saved units."""
+  def __init__(self, defined: Optional[spawner_pb2.DefinedUnits] = None):
+    defined = defined or spawner_pb2.DefinedUnits()
+    self.entities_: dict[str, spawner_pb2.Entity] = dict(Entity.SAVED_)
+    self.entities_.update((e.id.id, e) for e in defined.entity)
+    self.spawners_: dict[str, spawner_pb2.Spawner] = dict(Spawner.SAVED_)
+    self.spawners_.update((s.id.id, s) for s in defined.spawner)
+    self.functions_: dict[str, Message] = dict(state_function.DEFINED_FUNCTION_SOURCES_)
+    for functions in (
+        defined.cartesian_function, defined.polar_function, defined.delta_function):
+      self.functions_.update((f.id.id, f) for f in functions)
+    self.cache_: dict[str, ComplexityEstimate] = {}
+
+  def ExpressionEvals_(self, state_fn_pb: spawner_pb2.StateFn) -> int:
+    """Expressions of a StateFn that are evaluated every time it is used."""
+    if state_fn_pb.HasField('id'):
+      fn_pb = self.functions_.get(state_fn_pb.id.id)
+    else:
+      kind = state_fn_pb.WhichOneof('state_fn')
+      fn_pb = getattr(state_fn_pb, kind) if kind else None
+    if fn_pb is None:
+      return 0
+    evals = 0
+    for fd, value in fn_pb.ListFields():
+      if fd.type != fd.TYPE_STRING or not value:
+        continue
+      try:
+        if ExpressionVariables(value) - {'idx'}:
+          evals += 1
+      except SyntaxError:
+        evals += 1
+    return evals
+
+  def Lifetime_(self, movement_pb: spawner_pb2.Movement) -> float:
+    if movement_pb.loop or not movement_pb.lifetime:
+      return inf
+    if any(lifetime <= 0 for lifetime in movement_pb.lifetime):
+      return inf
+    return sum(movement_pb.lifetime)
+
+  def SpawnTimes_(self, spawner_pb: spawner_pb2.Spawner) -> list[float]:
+    spawn_time_fn = MakeFn(spawner_pb.spawn_time_fn or '0')
+    times = []
+    for i in range(spawner_pb.spawn_count):
+      try:
+        times.append(spawn_time_fn(GLOBALS_ | {'idx': i, 'parent': None}))
+      except Exception:
+        times.append(0)
+    return times
+
+  def Estimate(self, entity_id: str) -> ComplexityEstimate:
+    """Estimate for a single live instance of the saved entity entity_id."""
+    entity_pb = self.entities_.get(entity_id)
+    if entity_pb is None:
+      return ComplexityEstimate(warnings=[f'Unknown entity "{entity_id}"'])
+    return self.EstimateEntity_(entity_pb, entity_id, [])
+
+  def EstimateEntity_(
+      self,
+      entity_pb: spawner_pb2.Entity,
+      template_id: str,
+      stack: list[str]) -> ComplexityEstimate:
+    if entity_pb.id.id:
+      template_id = entity_pb.id.id
+      entity_pb = self.entities_.get(template_id, entity_pb)
+    cached = self.cache_.get(template_id)
+    if cached is not None:
+      return cached
+    if template_id in stack:
+      return ComplexityEstimate(
+        inf, inf, inf,
+        warnings=[f'{" -> ".join(stack + [template_id])} spawns itself'])
+
+    res = ComplexityEstimate(lifetime=self.Lifetime_(entity_pb.movement))
+    res.evals_per_frame = max(
+      (self.ExpressionEvals_(fn) for fn in entity_pb.movement.state_fn), default=0)
+    for i, spawner_pb in enumerate(entity_pb.spawner):
+      if spawner_pb.id.id:
+        spawner_pb = self.spawners_.get(spawner_pb.id.id, spawner_pb)
+      spawn_pb = spawner_pb.spawn_entity
+      child = self.EstimateEntity_(
+        spawn_pb, f'{template_id}/spawner[{i}]', stack + [template_id])
+      res.warnings.extend(child.warnings)
+
+      concurrent = PeakConcurrent(
+        self.SpawnTimes_(spawner_pb), spawner_pb.period, child.lifetime, res.lifetime)
+      if spawner_pb.max_live:
+        concurrent = min(concurrent, spawner_pb.max_live)
+      elif concurrent == inf:
+        res.warnings.append(
+          f'{template_id}/spawner[{i}] spawns entities that never despawn every period')
+      rate = spawner_pb.spawn_count / spawner_pb.period if spawner_pb.period > 0 else 0
+      offset_evals = self.ExpressionEvals_(spawner_pb.offset_fn)
+
+      res.peak_live += _Scale(concurrent, child.peak_live)
+      res.spawns_per_second += rate + _Scale(concurrent, child.spawns_per_second)
+      res.evals_per_frame += (
+        _Scale(concurrent, child.evals_per_frame) +
+        _Scale(rate * FRAME_DT, offset_evals))
+
+    self.cache_[template_id] = res
+    return res
+
+def CheckBudget(
+    estimate: ComplexityEstimate,
+    max_live: float = inf,
+    max_spawns_per_second: float = inf,
+    max_evals_per_frame: float = inf) -> list[str]:
+  """Describes every way estimate goes over budget."""
+  res = []
+  if estimate.peak_live > max_live:
+    res.append(f'peak_live {estimate.peak_live:g} > {max_live:g}')
+  if estimate.spawns_per_second > max_spawns_per_second:
+    res.append(
+      f'spawns_per_second {estimate.spawns_per_second:g} > {max_spawns_per_second:g}')
+  if estimate.evals_per_frame > max_evals_per_frame:
+    res.append(
+      f'evals_per_frame {estimate.evals_per_frame:g} > {max_evals_per_frame:g}')
+  return res
+
+def Main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--units', required=True, help='DefinedUnits textproto.')
+  parser.add_argument(
+    '--entity', action='append',
+    help='Entity ids to check, defaults to every entity in --units.')
+  parser.add_argument('--max_live', type=float, default=inf)
+  parser.add_argument('--max_spawns_per_second', type=float, default=inf)
+  parser.add_argument('--max_evals_per_frame', type=float, default=inf)
+  args = parser.parse_args()
+
+  with open(args.units, 'r') as f:
+    defined = ParseDefinedUnits(f.read())
+  estimator = ComplexityEstimator(defined)
+  over_budget = False
+  for entity_id in args.entity or [e.id.id for e in defined.entity]:
+    estimate = estimator.Estimate(entity_id)
+    print(
+      f'{entity_id}: peak_live={estimate.peak_live:g} '
+      f'spawns_per_second={estimate.spawns_per_second:g} '
+      f'evals_per_frame={estimate.evals_per_frame:g}')
+    for warning in dict.fromkeys(estimate.warnings):
+      print(f'  warning: {warning}')
+    for problem in CheckBudget(
+        estimate, args.max_live, args.max_spawns_per_second, args.max_evals_per_frame):
+      print(f'  over budget: {problem}')
+      over_budget = True
+  sys.exit(1 if over_budget else 0)
+
+if __name__ == '__main__':
+  Main()
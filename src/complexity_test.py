@@ -0,0 +1,126 @@
+import math
+import unittest
+
+from src import complexity
+from src.loader import ParseDefinedUnits
+
+UNITS_PB_TXT = """
+  delta_function {
+    id { id: 'complexity_test_forward' }
+    dx: '20 * cos(anglea)'
+    dy: '20 * sin(anglea)'
+  }
+  entity {
+    id { id: 'complexity_test_bullet' }
+    movement {
+      state_fn { id { id: 'complexity_test_forward' } }
+      lifetime: 10
+    }
+  }
+  entity {
+    id { id: 'complexity_test_turret' }
+    movement {
+      state_fn { cartesian { x: '100' y: '10 * idx' } }
+      lifetime: 5
+    }
+    spawner {
+      spawn_entity { id { id: 'complexity_test_bullet' } }
+      spawn_count: 4
+      spawn_time_fn: 'idx / 4'
+      period: 1
+      offset_fn { polar { r: '10' theta: 'tau * idx / 4 + t' } }
+    }
+  }
+  entity {
+    id { id: 'complexity_test_boss' }
+    movement {
+      state_fn { cartesian { x: '100 * sin(t)' } }
+      lifetime: 0
+    }
+    spawner {
+      spawn_entity { id { id: 'complexity_test_turret' } }
+      spawn_count: 180
+      spawn_time_fn: '0'
+      period: 2
+    }
+  }
+  entity {
+    id { id: 'complexity_test_loop' }
+    movement { state_fn { cartesian {} } lifetime: 1 }
+    spawner {
+      spawn_entity { id { id: 'complexity_test_loop' } }
+      spawn_count: 1
+      spawn_time_fn: '0'
+    }
+  }
+  entity {
+    id { id: 'complexity_test_forever' }
+    movement { state_fn { cartesian {} } lifetime: 0 }
+    spawner {
+      spawn_entity { movement { state_fn { cartesian { x: 't' } } lifetime: 0 } }
+      spawn_count: 1
+      spawn_time_fn: '0'
+      period: 1
+    }
+  }
+"""
+
+class TestPeakConcurrent(unittest.TestCase):
+  def testPeakConcurrent_oneShot_countsOverlappingLifetimes(self):
+    self.assertEqual(complexity.PeakConcurrent([0, 1, 2, 3], 0, 1.5), 2)
+
+  def testPeakConcurrent_periodic_countsOverlappingWaves(self):
+    self.assertEqual(complexity.PeakConcurrent([0, 0.5], 1, 2.5), 5)
+
+  def testPeakConcurrent_ownerDespawns_stopsSpawning(self):
+    self.assertEqual(complexity.PeakConcurrent([0], 1, 100, owner_lifetime=3), 3)
+
+  def testPeakConcurrent_periodicNeverDespawning_isUnbounded(self):
+    self.assertEqual(complexity.PeakConcurrent([0], 1, math.inf), math.inf)
+
+class TestComplexityEstimator(unittest.TestCase):
+  def setUp(self):
+    self.estimator = complexity.ComplexityEstimator(ParseDefinedUnits(UNITS_PB_TXT))
+
+  def testEstimate_leaf_countsNonConstantExpressions(self):
+    res = self.estimator.Estimate('complexity_test_bullet')
+
+    self.assertEqual(res.peak_live, 1)
+    self.assertEqual(res.evals_per_frame, 2)
+    self.assertEqual(res.lifetime, 10)
+
+  def testEstimate_nestedSpawners_multiplies(self):
+    turret = self.estimator.Estimate('complexity_test_turret')
+    boss = self.estimator.Estimate('complexity_test_boss')
+
+    # The turret lives for 5 seconds, firing 4 bullets a second that live for 10.
+    self.assertEqual(turret.peak_live, 1 + 20)
+    self.assertEqual(turret.spawns_per_second, 4)
+    # The turret's position is fixed once spawned, and only theta of the offset
+    # depends on t.
+    self.assertAlmostEqual(turret.evals_per_frame, 20 * 2 + 4 / 60)
+    # 3 waves of 180 turrets are alive at once.
+    self.assertEqual(boss.peak_live, 1 + 540 * 21)
+    self.assertEqual(boss.spawns_per_second, 90 + 540 * 4)
+    self.assertEqual(complexity.CheckBudget(boss, max_live=10000), [
+      'peak_live 11341 > 10000'])
+
+  def testEstimate_spawnsItself_isUnbounded(self):
+    res = self.estimator.Estimate('complexity_test_loop')
+
+    self.assertEqual(res.peak_live, math.inf)
+    self.assertIn('spawns itself', res.warnings[0])
+
+  def testEstimate_periodicallySpawnsForever_isUnboundedUnlessCapped(self):
+    forever = self.estimator.Estimate('complexity_test_forever')
+    self.assertEqual(forever.peak_live, math.inf)
+    self.assertEqual(len(forever.warnings), 1)
+
+    defined = ParseDefinedUnits(UNITS_PB_TXT)
+    defined.entity[-1].spawner[0].max_live = 50
+    capped = complexity.ComplexityEstimator(defined).Estimate('complexity_test_forever')
+    self.assertEqual(capped.peak_live, 51)
+    self.assertEqual(capped.warnings, [])
+
+if __name__ == '__main__':
+  unittest.main()
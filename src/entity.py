@@ -1,32 +1,53 @@
 
 from proto import spawner_pb2
-from google.protobuf import text_format
+from src.lod_policy import LodPolicy
+from src.movement_timeline import MovementTimeline
+from src.pool import ObjectPool
+from src.spawn_queue import SpawnQueue
+from src.spawn_schedule import SpawnSchedule
+from src.state_function import ABSOLUTE_VARIABLES
 from src.state_function import CompiledStateFn
+from src.state_function import EXPRESSION_CACHE
 from src.state_function import GenerateCompiledStateFn
 from src.state_function import GetGlobals
 from src.state_function import MakeFn
 from src.state_function import PositionState
+from src.state_function import TARGET_VARIABLES
+from src.targeting import TargetIndex
 from dataclasses import dataclass
 from dataclasses import replace as CopyDataclass
+from typing import Any
+from typing import Callable
+from typing import Iterator
 from typing import Optional
 import logging
-from math import sin, cos
+import threading
+from math import sin, cos, floor
 from typing import Optional
 
 GLOBALS_ = GetGlobals()
 
 class Movement():
-  def __init__(self, movement_pb: spawner_pb2.Movement):
+  def __init__(self, movement_pb: spawner_pb2.Movement, idx: int = 0):
     self.movement_pb_: spawner_pb2.Movement
-    self.state_fns: list[CompiledStateFn] = [
+    # StateFns as compiled, before anything only depending on idx is precomputed.
+    self.unbound_state_fns_: list[CompiledStateFn] = [
         GenerateCompiledStateFn(state_fn)
         for state_fn in movement_pb.state_fn]
-    assert self.state_fns, "Needs at least one specified movement!"
+    # Ids of predefined StateFns used, so they can be swapped out on reload.
+    self.state_fn_ids: list[str] = [
+        state_fn.id.id for state_fn in movement_pb.state_fn]
+    assert self.unbound_state_fns_, "Needs at least one specified movement!"
     self.loop = movement_pb.loop or False
 
     self.lifetimes = list(movement_pb.lifetime)
 
-    assert len(self.state_fns) == len(self.lifetimes), 'Movements and Lifetimes lengths must match! ${movement_pb}'
+    assert len(self.unbound_state_fns_) == len(self.lifetimes), 'Movements and Lifetimes lengths must match! ${movement_pb}'
+    # Shared between all movements with the same lifetimes.
+    self.timeline_ = MovementTimeline.Get(self.lifetimes, self.loop)
+
+    self.idx = idx
+    self.Bind_()
 
     # Which movement to use.
     # If current_idx is above state_fns.length and loops, resets to 0
@@ -39,39 +60,113 @@ class Movement():
     # This should be fetched and cleared before Calc is called again.
     self.transition_position_: Optional[PositionState] = None
 
+  def Reset(self, idx: int = 0):
+    """Restarts this movement from its first state_fn for reuse."""
+    self.current_idx = 0
+    self.current_time = 0
+    self.is_active = True
+    self.transition_position_ = None
+    if idx != self.idx:
+      self.idx = idx
+      if any(state_fn.NeedsBinding() for state_fn in self.unbound_state_fns_):
+        self.Bind_()
+
+  def Bind_(self):
+    """Precomputes the StateFns for self.idx and checks whether this ever moves."""
+    self.state_fns: list[CompiledStateFn] = [
+        state_fn.Bind(self.idx) for state_fn in self.unbound_state_fns_]
+    self.variables = self.Variables_()
+    # Set when the first state_fn is constant and lasts forever, in which
+    # case Calc never needs to be called.
+    self.static_position: Optional[PositionState] = None
+    if self.lifetimes[0] <= 0:
+      self.static_position = self.state_fns[0].ConstantPosition()
+
+  def Variables_(self) -> Optional[frozenset[str]]:
+    """Every variable any state_fn reads, or None if unknown."""
+    res = frozenset()
+    for state_fn in self.state_fns:
+      variables = state_fn.Variables()
+      if variables is None:
+        return None
+      res |= variables
+    return res
+
+  def ReplaceStateFn(self, fn_id: str, state_fn: CompiledStateFn) -> bool:
+    """Swaps in a recompiled StateFn wherever fn_id is used.
+
+    Returns:
+      True if this movement used fn_id.
+    """
+    replaced = False
+    for i, state_fn_id in enumerate(self.state_fn_ids):
+      if state_fn_id == fn_id:
+        self.unbound_state_fns_[i] = CopyDataclass(state_fn)
+        replaced = True
+    if replaced:
+      self.Bind_()
+    return replaced
+
   def Calc(self, fn_vars: dict[str, float], dt: float) -> Optional[PositionState]:
     if self.transition_position_:
       raise Exception("Trying to Calculate new state without first calling GetAndClearTransitionPosition")
     next_time = self.current_time + dt
     lifetime = self.lifetimes[self.current_idx]
-    # self.current_time += dt
     # Handle end of lifetime for current movement. Only applicable if lifetime > 0
-    if (lifetime > 0 and next_time > lifetime):
-      # Handle transitions by pushing towards the end of the lifetime and
-      # Storing the final position temporarily.
-      first_dt = lifetime - self.current_time
+    if not (lifetime > 0 and next_time > lifetime):
+      self.current_time = next_time
       state_fn = self.state_fns[self.current_idx]
-      transition_globals = fn_vars | {'t': lifetime, 'dt': first_dt}
-      self.transition_position_ = state_fn.Calc(transition_globals)
-
-      # The remaining dt to be used
-      dt = next_time - lifetime
-
-      self.current_time = dt
-      self.current_idx += 1
-      if (self.current_idx >= len(self.state_fns)):
-        if self.loop:
-          self.current_idx = 0
-        # Reached end of loop, we should no longer be active or returning anything.
-        else:
-          self.is_active = False
-          return None
+      passed_globals = fn_vars | {'t': self.current_time, 'dt': dt}
+      return state_fn.Calc(passed_globals)
+
+    # Handle transitions by pushing towards the end of every lifetime that dt
+    # passes over, and storing the sum of final positions temporarily.
+    location = self.timeline_.Locate(self.timeline_.starts[self.current_idx] + next_time)
+    transition = self.EndPosition_(fn_vars, self.current_idx, lifetime - self.current_time)
+    last_idx = len(self.timeline_.ends)
+    if location is None:
+      # Reached end of loop, we should no longer be active or returning anything.
+      for i in range(self.current_idx + 1, last_idx):
+        transition += self.EndPosition_(fn_vars, i)
+      self.transition_position_ = transition
+      self.is_active = False
+      return None
+
+    loops, idx, local_time = location
+    if loops:
+      # The rest of this loop, any full loops, then up to idx in the last one.
+      for i in range(self.current_idx + 1, last_idx):
+        transition += self.EndPosition_(fn_vars, i)
+      if loops > 1:
+        full_loop = PositionState()
+        for i in range(last_idx):
+          full_loop += self.EndPosition_(fn_vars, i)
+        transition += PositionState(
+          full_loop.x * (loops - 1),
+          full_loop.y * (loops - 1),
+          full_loop.angle * (loops - 1))
+      skipped = range(idx)
     else:
-      self.current_time = next_time
-    state_fn = self.state_fns[self.current_idx]
-    passed_globals = fn_vars | {'t': self.current_time, 'dt': dt}
+      skipped = range(self.current_idx + 1, idx)
+    for i in skipped:
+      transition += self.EndPosition_(fn_vars, i)
+    self.transition_position_ = transition
+
+    self.current_idx = idx
+    self.current_time = local_time
+    state_fn = self.state_fns[idx]
+    passed_globals = fn_vars | {'t': local_time, 'dt': local_time}
     return state_fn.Calc(passed_globals)
 
+  def EndPosition_(self,
+      fn_vars: dict[str, float],
+      idx: int,
+      dt: Optional[float] = None) -> PositionState:
+    """Position of state_fns[idx] at the end of its lifetime."""
+    lifetime = self.lifetimes[idx]
+    transition_globals = fn_vars | {'t': lifetime, 'dt': lifetime if dt is None else dt}
+    return self.state_fns[idx].Calc(transition_globals)
+
   def GetAndClearTransitionPosition(self) -> Optional[PositionState]:
     """Readies this movement to be Calc'd again after state_fn transitions
 
@@ -90,32 +185,118 @@ class Movement():
     self.transition_position_ = None
     return res
 
-WORLD_PB_TXT = """
-  id { id: 'world' }
-  image: ''
-  movement {
-    state_fn { cartesian {} }
-    lifetime: 0
-    loop: true
-  }
-"""
-WORLD_ENTITY_PB = text_format.Parse(WORLD_PB_TXT, spawner_pb2.Entity())
+# Never moves and never ends, built directly so importing doesn't need text_format.
+WORLD_ENTITY_PB = spawner_pb2.Entity(
+  id=spawner_pb2.EntityId(id='world'),
+  image='',
+  movement=spawner_pb2.Movement(
+    state_fn=[spawner_pb2.StateFn(cartesian=spawner_pb2.CartesianStateFn())],
+    lifetime=[0],
+    loop=True))
 
 class Entity():
   SAVED_: dict[str, spawner_pb2.Entity] = {
     'world': WORLD_ENTITY_PB,
   }
-  ZA_WARUDO: 'Entity'
+  # How many times each saved entity has been (re)defined.
+  VERSIONS_: dict[str, int] = {}
+  # The root everything is added to. Not created on import, see CreateWorld.
+  ZA_WARUDO: Optional['Entity'] = None
+  # Recycled Entities keyed by template_id.
+  POOL_ = ObjectPool()
+  # While the world's children are updated on several threads, children added
+  # to the world are collected in WORLD_ADDS_.children of the adding thread
+  # instead, and changes to shared counters in WORLD_ADDS_.counts. See
+  # parallel_update.py.
+  WORLD_ADDS_: Optional[threading.local] = None
+  # Resolves tx and ty, see targeting.py.
+  TARGETS_ = TargetIndex()
+
+  @classmethod
+  def CreateWorld(cls) -> 'Entity':
+    """Replaces ZA_WARUDO with a new, empty world and returns it."""
+    if cls.ZA_WARUDO is not None and Spawner.QUEUE_ is not None:
+      # Otherwise QUEUE_ keeps updating the replaced world's spawners.
+      for entity in cls.ZA_WARUDO.Walk():
+        for spawner in entity.spawners:
+          spawner.Cancel()
+    cls.ZA_WARUDO = Entity(WORLD_ENTITY_PB)
+    return cls.ZA_WARUDO
+
+  @classmethod
+  def World(cls) -> 'Entity':
+    """ZA_WARUDO, created if nothing has created it yet."""
+    if cls.ZA_WARUDO is None:
+      return cls.CreateWorld()
+    return cls.ZA_WARUDO
 
   @classmethod
-  def Save(cls, entity_pb: spawner_pb2.Entity):
+  def Save(cls, entity_pb: spawner_pb2.Entity, replace: bool = False) -> bool:
+    """Saves entity_pb as a template to be referenced by id.
+
+    Existing definitions are only overwritten with replace. Live entities keep
+    the version they were created with, new spawns use the latest one.
+
+    Returns:
+      True if entity_pb was saved.
+    """
     name = entity_pb.id.id
     if not name:
       raise Exception('No entity_pb id value set when trying to save.')
-    if name in Entity.SAVED_:
+    if name in Entity.SAVED_ and not replace:
       logging.warn(f'Entity already defined for id: {name} - Not creating')
-    else:
-      cls.SAVED_[name] = entity_pb    
+      return False
+    cls.SAVED_[name] = entity_pb
+    cls.VERSIONS_[name] = cls.VERSIONS_.get(name, 0) + 1
+    # Pooled entities were built from the previous definition.
+    cls.POOL_.Discard(name)
+    return True
+
+  @classmethod
+  def Spawn(cls,
+      entity_pb: spawner_pb2.Entity,
+      template_id: str,
+      parent: 'Entity' = None,
+      offset: PositionState = None,
+      idx: int = 0,
+      follow_center: bool = False,
+      follow_angle: bool = False,
+      pool_key: Optional[str] = None) -> 'Entity':
+    """Create an Entity, reusing a despawned one of the same template if possible.
+
+    pool_key defaults to template_id, and separates entities of the same
+    template that shouldn't be mixed, e.g. baked ones.
+    """
+    pool_key = pool_key or template_id
+    spawn = cls.POOL_.Acquire(pool_key) if pool_key else None
+    if spawn is None:
+      spawn = Entity(
+        entity_pb, parent, offset, idx, follow_center, follow_angle, template_id)
+      spawn.pool_key_ = pool_key
+      return spawn
+    spawn.Reset(parent, offset, idx, follow_center, follow_angle)
+    return spawn
+
+  @classmethod
+  def Release(cls, entity: 'Entity'):
+    """Hand a despawned Entity and all of its descendants back to the pool."""
+    for child in entity.children_:
+      cls.Release(child)
+    for spawner in entity.spawners:
+      spawner.Cancel()
+    spawned_by = entity.spawned_by_
+    # Spawns from before spawned_by was pooled and Reset count toward nothing.
+    if spawned_by is not None and entity.spawned_resets_ == spawned_by.resets_:
+      pending = PendingCounts.Active()
+      if pending is None:
+        spawned_by.live_count -= 1
+      else:
+        pending.AddLive(spawned_by, -1)
+    entity.spawned_by_ = None
+    entity.children_.clear()
+    entity.parent = None
+    if entity.pool_key_:
+      cls.POOL_.Release(entity.pool_key_, entity)
 
   def __init__(self,
       entity_pb: spawner_pb2.Entity,
@@ -123,9 +304,14 @@ class Entity():
       offset: PositionState = None,
       idx: int = 0,
       follow_center: bool = False,
-      follow_angle: bool = False):
+      follow_angle: bool = False,
+      template_id: str = ''):
     self.pb_ = entity_pb
     name = entity_pb.id.id
+    # Identifies which template this was created from, for pooling.
+    # Inline entities are identified by the spawner that creates them.
+    self.template_id = name or template_id
+    self.pool_key_ = self.template_id
     if name:
       if name in Entity.SAVED_:
         self.pb_ = spawner_pb2.Entity()
@@ -136,6 +322,18 @@ class Entity():
     self.image: str = self.pb_.image
     self.hit_radius = self.pb_.hit_radius
     self.alignment = self.pb_.alignment
+    self.lod_: Optional[LodPolicy] = None
+    if self.pb_.HasField('update_policy'):
+      self.lod_ = LodPolicy.FromPb(self.pb_.update_policy)
+    # Time and frames not simulated yet because of lod_.
+    self.skipped_dt_ = 0.0
+    self.skipped_frames_ = 0
+    # The Spawner that created this, for its live count.
+    self.spawned_by_: Optional['Spawner'] = None
+    # spawned_by_.resets_ at the time of the spawn.
+    self.spawned_resets_ = 0
+    # Incremented whenever this is reused from the pool.
+    self.generation_ = 0
 
     # The parent 
     self.parent: Optional[Entity] = parent
@@ -145,46 +343,125 @@ class Entity():
 
     # Spawners to create children
     self.spawners: list['Spawner'] = []
-    for spawner_pb in self.pb_.spawner:
-      self.spawners.append(Spawner(spawner_pb, self))
+    for i, spawner_pb in enumerate(self.pb_.spawner):
+      self.spawners.append(Spawner(spawner_pb, self, i))
+    # Nothing to update but its position, e.g. bullets. Its parent skips
+    # straight to UpdatePosition_ as long as nothing was added below it.
+    self.leaf_ = not self.spawners and self.lod_ is None
 
     # The children
     self.children_: list[Entity] = []
 
     # Positional Fields
-    self.movement = Movement(self.pb_.movement)
+    self.movement = Movement(self.pb_.movement, idx)
     # positional data relative to the parent.
     # If no parent, the absolute center.
     self.offset: PositionState = offset or PositionState()
-    self.position = PositionState()
+    self.position = self.movement.static_position or PositionState()
     self.recalc_absolute_ = True
+    # Cached by Transform.
+    self.transform_: Optional[tuple[PositionState, float, float]] = None
     self.absolute_position_ = self.AbsolutePosition()
 
+  def Reset(self,
+      parent: 'Entity' = None,
+      offset: PositionState = None,
+      idx: int = 0,
+      follow_center: bool = False,
+      follow_angle: bool = False):
+    """Reinitialize a pooled Entity as if it were freshly constructed."""
+    self.generation_ += 1
+    self.parent = parent
+    self.follow_center = follow_center
+    self.follow_angle = follow_angle
+    self.idx = idx
+    self.skipped_dt_ = 0.0
+    self.skipped_frames_ = 0
+    for spawner in self.spawners:
+      spawner.Reset()
+    self.children_.clear()
+    self.movement.Reset(idx)
+    self.offset = offset or PositionState()
+    self.position = self.movement.static_position or PositionState()
+    self.recalc_absolute_ = True
+    self.absolute_position_ = self.AbsolutePosition()
+
+  def Walk(self) -> Iterator['Entity']:
+    """Iterates over this entity and all of its descendants."""
+    to_visit = [self]
+    while to_visit:
+      entity = to_visit.pop()
+      yield entity
+      to_visit.extend(entity.children_)
+
+  def OwnsSpawner_(self) -> Callable[['Spawner'], bool]:
+    """Whether a spawner's entity is still under this one, for SpawnQueue.Run."""
+    # Children don't point back at the world, so they're looked up here.
+    top_level: Optional[set['Entity']] = None
+    def OwnsSpawner(spawner: 'Spawner') -> bool:
+      nonlocal top_level
+      owner = spawner.owner_
+      if owner is None:
+        return True
+      while owner.parent is not None:
+        owner = owner.parent
+      if owner is self:
+        return True
+      if top_level is None:
+        top_level = set(self.children_)
+      return owner in top_level
+    return OwnsSpawner
+
   def AddChild(self, child: 'Entity'):
+    if Entity.WORLD_ADDS_ is not None and self is Entity.ZA_WARUDO:
+      Entity.WORLD_ADDS_.children.append(child)
+      return
     self.children_.append(child)
 
   def UpdateSpawners_(self, global_vals: dict[str, float], dt: float):
+    if Spawner.QUEUE_ is not None:
+      # Every spawner is driven by the queue instead, once per world update.
+      if self is Entity.ZA_WARUDO:
+        Spawner.QUEUE_.Run(global_vals, dt, self.OwnsSpawner_())
+      return
     for spawner in self.spawners:
       spawner.Update(global_vals, dt)
  
   def UpdateChildren_(self, global_vals: dict[str, float], dt: float):
+    # Children may be added while iterating, so these are picked up as well.
+    alive = []
     for child in self.children_:
       if not child.movement.is_active:
-        self.children_.remove(child)
+        Entity.Release(child)
         continue
-      child.Update(global_vals, dt)
+      if child.leaf_ and not child.children_:
+        child.UpdatePosition_(global_vals, dt)
+      else:
+        child.Update(global_vals, dt)
+      alive.append(child)
+    self.children_[:] = alive
 
   def UpdatePosition_(self, global_vals: dict[str, float], dt: float):
-    absolute = self.AbsolutePosition()
+    if self.movement.static_position is not None:
+      # Nothing to calculate, but the parent may have moved.
+      self.position = self.movement.static_position
+      self.recalc_absolute_ = True
+      return
     vals = {
       'x':     self.position.x,
       'y':     self.position.y,
       'angle': self.position.angle,
       'idx':   self.idx,
-      'xa':     absolute.x,
-      'ya':     absolute.y,
-      'anglea': absolute.angle,
     }
+    needed = self.movement.variables
+    # Walking up the parents is only worth it if something reads the result.
+    if needed is None or needed & ABSOLUTE_VARIABLES:
+      absolute = self.AbsolutePosition()
+      vals['xa'] = absolute.x
+      vals['ya'] = absolute.y
+      vals['anglea'] = absolute.angle
+    if needed is None or needed & TARGET_VARIABLES:
+      vals['tx'], vals['ty'] = Entity.TARGETS_.Target(self)
     self.position = self.movement.Calc(global_vals | vals, dt)
     if not self.position:
       # TODO: Handle empty?
@@ -197,6 +474,29 @@ class Entity():
     self.recalc_absolute_ = True
 
   def Update(self, global_vals: dict[str, float], dt: float):
+    if self is Entity.ZA_WARUDO:
+      EXPRESSION_CACHE.NextFrame()
+      Entity.TARGETS_.NextFrame(self)
+    if self.lod_ is not None:
+      self.skipped_dt_ += dt
+      self.skipped_frames_ += 1
+      if self.skipped_frames_ < self.lod_.Interval(self.AbsolutePosition):
+        # Nothing below moves on its own, but an ancestor might have.
+        self.recalc_absolute_ = True
+        if self.children_:
+          for entity in self.Walk():
+            entity.recalc_absolute_ = True
+        return
+      # Movements seek to the exact time, so one big step catches up. Until it
+      # is done, skipped_dt_ is the part of it before dt, see Spawner.Lag_.
+      caught_up = self.skipped_dt_
+      self.skipped_dt_ -= dt
+      self.skipped_frames_ = 0
+      self.UpdateSpawners_(global_vals, caught_up)
+      self.UpdateChildren_(global_vals, caught_up)
+      self.UpdatePosition_(global_vals, caught_up)
+      self.skipped_dt_ = 0.0
+      return
     self.UpdateSpawners_(global_vals, dt)
     self.UpdateChildren_(global_vals, dt)
     self.UpdatePosition_(global_vals, dt)
@@ -236,54 +536,131 @@ class Entity():
     centered = self.position + self.offset
     if not self.parent:
       self.absolute_position_ = centered
+      self.recalc_absolute_ = False
       return centered
 
-    parent = CopyDataclass(self.parent.AbsolutePosition())
-
     # Position relative to the center not accounting for parent.
     if self.follow_center and self.follow_angle:
+      parent, cos_angle, sin_angle = self.parent.Transform()
       transformed = PositionState(
-        parent.x + centered.y * sin(parent.angle) + centered.x * cos(parent.angle),
-        parent.y + centered.y * cos(parent.angle) - centered.x * sin(parent.angle),
+        parent.x + centered.y * sin_angle + centered.x * cos_angle,
+        parent.y + centered.y * cos_angle - centered.x * sin_angle,
         parent.angle + centered.angle
       )
     elif self.follow_center and not self.follow_angle:
+      parent = self.parent.AbsolutePosition()
       transformed = PositionState(
         parent.x + centered.x,
         parent.y + centered.y,
         centered.angle,
       )
     elif self.follow_angle:
+      parent, cos_angle, sin_angle = self.parent.Transform()
       transformed = PositionState(
-        centered.y * sin(parent.angle) + centered.x * cos(parent.angle),
-        centered.y * cos(parent.angle) - centered.x * sin(parent.angle),
+        centered.y * sin_angle + centered.x * cos_angle,
+        centered.y * cos_angle - centered.x * sin_angle,
         centered.angle + parent.angle,
       )
     else:
-      transformed = CopyDataclass(centered)
+      transformed = centered
 
     self.absolute_position_ = transformed
     self.recalc_absolute_ = False
     return self.absolute_position_
 
-Entity.ZA_WARUDO = Entity(WORLD_ENTITY_PB)
+  def Transform(self) -> tuple[PositionState, float, float]:
+    """AbsolutePosition with the cos and sin of its angle, for children to apply.
+
+    Cached until the absolute position changes, so children following the
+    angle share a single sin and cos per frame.
+    """
+    absolute = self.AbsolutePosition()
+    transform = self.transform_
+    if transform is None or transform[0] is not absolute:
+      transform = self.transform_ = (absolute, cos(absolute.angle), sin(absolute.angle))
+    return transform
 
 class Spawner():
   SAVED_: dict[str, spawner_pb2.Spawner] = {}
+  # When set, spawners are only updated when due instead of every frame.
+  QUEUE_: Optional[SpawnQueue] = None
+  # Baked trajectories (see baked.py) keyed by bake_key.
+  BAKED_: dict[str, Any] = {}
+  # How many spawns were skipped because of max_live, keyed by bake_key.
+  CAPPED_: dict[str, int] = {}
+  # How many entities were spawned, keyed by bake_key.
+  SPAWNED_: dict[str, int] = {}
+
+  VERSIONS_: dict[str, int] = {}
 
   @classmethod
-  def Save(cls, spawner_pb: spawner_pb2.Spawner):
+  def Save(cls, spawner_pb: spawner_pb2.Spawner, replace: bool = False) -> bool:
+    """Saves spawner_pb to be referenced by id.
+
+    Existing definitions are only overwritten with replace, in which case
+    live Spawners should be updated through Reload.
+
+    Returns:
+      True if spawner_pb was saved.
+    """
     name = spawner_pb.id.id
     if not name:
       raise Exception('Cannot save Spawner without an id')
-    if name in Spawner.SAVED_:
+    if name in Spawner.SAVED_ and not replace:
       logging.warn(f'Spawner already defined: {name} - Not creating')
-    else:
-      Spawner.SAVED_[name] = spawner_pb
+      return False
+    Spawner.SAVED_[name] = spawner_pb
+    Spawner.VERSIONS_[name] = Spawner.VERSIONS_.get(name, 0) + 1
+    return True
 
   def __init__(self,
       spawner_pb: spawner_pb2.Spawner,
-      parent: Optional[Entity] = None):
+      parent: Optional[Entity] = None,
+      index: int = 0):
+    # The entity this spawner belongs to.
+    self.owner_ = parent
+    self.index_ = index
+    self.Load_(spawner_pb)
+
+    self.current_time = 0
+    self.current_spawn_pos = 0
+    # How many periods have fully elapsed.
+    self.period_index = 0
+    # How many entities from this spawner are alive, for max_live.
+    self.live_count = 0
+
+    # Incremented by Reset only, so spawns can tell whether live_count still counts them.
+    self.resets_ = 0
+    # Bookkeeping for QUEUE_
+    self.generation_ = 0
+    self.last_update_time_ = 0.0
+    self.Register_()
+
+  def Register_(self):
+    if Spawner.QUEUE_ is not None:
+      self.last_update_time_ = Spawner.QUEUE_.now
+      self.ScheduleNext_(Spawner.QUEUE_)
+
+  def ScheduleNext_(self, queue: SpawnQueue):
+    next_time = self.schedule_.NextSpawnTime(self.current_time, -self.period_index)
+    if next_time is not None:
+      queue.Schedule(self, self.last_update_time_ + next_time - self.current_time)
+
+  def Cancel(self):
+    """Removes this spawner from QUEUE_, e.g. when its entity despawns."""
+    self.generation_ += 1
+
+  def Reload(self):
+    """Picks up a redefinition of this spawner while keeping its timing."""
+    self.Load_(self.spawner_pb_)
+    self.current_spawn_pos = self.schedule_.Position(self.current_time)
+    self.generation_ += 1
+    if Spawner.QUEUE_ is not None:
+      self.ScheduleNext_(Spawner.QUEUE_)
+
+  def Load_(self, spawner_pb: spawner_pb2.Spawner):
+    parent = self.owner_
+    index = self.index_
     self.spawner_pb_ = spawner_pb
 
     name = spawner_pb.id.id
@@ -294,23 +671,101 @@ class Spawner():
         logging.warn(f'Spawner not defined for id {name}, defaulting to using proto.')
 
     self.spawned_entity_pb_ = self.spawner_pb_.spawn_entity
+    # Inline entities do not have an id, so name them after where they're defined.
+    # Entities of anonymous owners can't be told apart, so they have no id.
+    owner_id = parent.template_id if parent else ''
+    self.template_id = self.spawned_entity_pb_.id.id or (
+      f'{owner_id}/spawner[{index}]' if owner_id else '')
+    # Identifies what this spawner creates including its offsets, for baking.
+    self.bake_key = self.spawner_pb_.id.id or self.template_id
+    self.baked_ = Spawner.BAKED_.get(self.bake_key)
 
     self.follow_center = parent and self.spawner_pb_.follow_center
     self.follow_angle = parent and self.spawner_pb_.follow_angle
     self.parent = parent if self.follow_center or self.follow_angle else None
-    if not self.spawner_pb_.HasField('offset_fn'):
-      self.spawner_pb_.offset_fn.cartesian.x = '0'
-    self.offset_fn_ = GenerateCompiledStateFn(self.spawner_pb_.offset_fn)
+    if self.spawner_pb_.HasField('offset_fn'):
+      self.offset_fn_ = GenerateCompiledStateFn(self.spawner_pb_.offset_fn)
+    else:
+      self.offset_fn_ = CompiledStateFn()
+    self.offset_fn_id = self.spawner_pb_.offset_fn.id.id
 
     self.spawn_count = self.spawner_pb_.spawn_count
+    self.max_live = self.spawner_pb_.max_live
     self.spawn_time_fn = MakeFn(self.spawner_pb_.spawn_time_fn)
     # These are ordered times to spawn and indexes to spawn at.
     self.zipped_spawn_times_idx: list[tuple[float, int]] = []
     self.period = self.spawner_pb_.period or 0
     self.InitializeSpawnTimes()
 
+  def Reset(self):
     self.current_time = 0
     self.current_spawn_pos = 0
+    self.period_index = 0
+    self.live_count = 0
+    self.resets_ += 1
+    self.generation_ += 1
+    self.Register_()
+
+  def Count_(self, spawned: int, capped: int, pending: Optional['PendingCounts']):
+    key = self.bake_key or '<anonymous>'
+    if capped and not Spawner.CAPPED_.get(key) and not (pending and pending.capped.get(key)):
+      logging.warning(
+        f'Spawner {key} reached max_live={self.max_live}, skipping spawns.')
+    if pending is not None:
+      pending.AddLive(self, spawned)
+      pending.Add(pending.spawned, key, spawned)
+      pending.Add(pending.capped, key, capped)
+      return
+    self.live_count += spawned
+    if spawned:
+      Spawner.SPAWNED_[key] = Spawner.SPAWNED_.get(key, 0) + spawned
+    if capped:
+      Spawner.CAPPED_[key] = Spawner.CAPPED_.get(key, 0) + capped
+
+  def Lag_(self) -> float:
+    """How far the next step of parent starts before the current frame.
+
+    Nonzero within a subtree skipped by an UpdatePolicy, where the next step
+    of parent catches up on every frame skipped so far.
+    """
+    lag = 0.0
+    entity = self.parent
+    while entity is not None:
+      lag += entity.skipped_dt_
+      entity = entity.parent
+    return lag
+
+  def Delay_(self, spawn: Entity, lag: float, spawn_time: float):
+    """Starts spawn as late into the next step of parent as it was spawned.
+
+    With polling, spawns in skipped frames get their exact phase from
+    spawn_time, relative to the start of this update. Spawns in the current
+    frame, and every spawn of QUEUE_, start with the frame like they would
+    without an UpdatePolicy.
+    """
+    if Spawner.QUEUE_ is None:
+      lag = min(lag, spawn_time)
+    spawn.movement.current_time = -lag
+    if Spawner.QUEUE_ is None:
+      for spawner in spawn.spawners:
+        spawner.current_time = -lag
+
+  def SpawnBaked_(self, idx: int) -> Entity:
+    """Spawns an entity replaying baked positions, which already include the offset."""
+    spawn = Entity.Spawn(
+      self.spawned_entity_pb_,
+      self.template_id,
+      self.parent,
+      None,
+      idx,
+      self.follow_center,
+      self.follow_angle,
+      f'{self.bake_key}#baked')
+    if spawn.movement.__class__ is Movement:
+      # Newly constructed rather than reused from the pool.
+      spawn.movement = self.baked_.NewMovement(idx)
+      spawn.position = PositionState()
+    return spawn
 
   def InitializeSpawnTimes(self):
     result = []
@@ -320,34 +775,110 @@ class Spawner():
       spawn_time = self.spawn_time_fn(global_vals)
       result.append((spawn_time, i))
     self.zipped_spawn_times_idx = sorted(result, key=lambda pair: pair[0])
+    self.schedule_ = SpawnSchedule(self.zipped_spawn_times_idx, self.period)
 
   def Update(self, global_vals: dict[str, float], dt: float):
-    next_time = self.current_time + dt
-
-    # Time has passed over the spawn time, 
-    while (self.current_spawn_pos < self.spawn_count and 
-      next_time > self.zipped_spawn_times_idx[self.current_spawn_pos][0]):
-      t, idx = self.zipped_spawn_times_idx[self.current_spawn_pos]
-      local_vals = { 't': t, 'idx': idx }
-
-      spawn = Entity(
-        self.spawned_entity_pb_,
-        self.parent,
-        self.offset_fn_.Calc(global_vals | local_vals),
-        idx, # idx
-        self.follow_center,
-        self.follow_angle
-      )
-
+    pending = PendingCounts.Active()
+    live_count = self.live_count
+    if pending is not None:
+      live_count += pending.live.get((self, self.resets_), 0)
+    spawned = 0
+    capped = 0
+    # Everything with a spawn time that dt passes over, over any number of periods.
+    lag = None
+    for wave, t, idx in self.schedule_.Due(self.current_time, dt, -self.period_index):
+      if self.max_live and live_count >= self.max_live:
+        capped += 1
+        continue
+      if self.baked_:
+        spawn = self.SpawnBaked_(idx)
+      else:
+        local_vals = { 't': t, 'idx': idx }
+        spawn = Entity.Spawn(
+          self.spawned_entity_pb_,
+          self.template_id,
+          self.parent,
+          self.offset_fn_.Calc(global_vals | local_vals),
+          idx, # idx
+          self.follow_center,
+          self.follow_angle
+        )
+
+      spawn.spawned_by_ = self
+      spawn.spawned_resets_ = self.resets_
+      live_count += 1
+      spawned += 1
       if self.parent:
+        if lag is None:
+          lag = self.Lag_()
+        if lag:
+          self.Delay_(spawn, lag, wave * self.period + max(t, 0) - self.current_time)
         self.parent.AddChild(spawn)
       else:
-        Entity.ZA_WARUDO.AddChild(spawn)
-
-      self.current_spawn_pos += 1
-
-    self.current_time = next_time
+        Entity.World().AddChild(spawn)
+    if spawned or capped:
+      self.Count_(spawned, capped, pending)
 
+    next_time = self.current_time + dt
     if self.period > 0 and next_time >= self.period:
-      self.current_time = next_time - self.period
-      self.current_spawn_pos = 0
+      wraps = floor(next_time / self.period)
+      self.period_index += wraps
+      next_time -= wraps * self.period
+    self.current_time = next_time
+    self.current_spawn_pos = self.schedule_.Position(next_time)
+
+class PendingCounts():
+  """Changes to counters shared between threads, made by one of them.
+
+  While ParallelUpdater updates on several threads, each work item counts
+  spawns, skipped spawns, live entities and EXPRESSION_CACHE lookups here
+  instead, and the calling thread Applies them in partition order once every
+  thread is done. A spawner sees its own changes from the same work item, but
+  entities released in other work items only count from the next frame on.
+  """
+  def __init__(self):
+    # Keyed by (Spawner, Spawner.resets_), so a Reset in the same frame drops them.
+    self.live: dict[tuple[Spawner, int], int] = {}
+    self.spawned: dict[str, int] = {}
+    self.capped: dict[str, int] = {}
+    # [hits, misses, evictions], see ExpressionCache.Defer.
+    self.expressions = [0, 0, 0]
+    self.previous_: Optional[tuple[Optional['PendingCounts'], Optional[list[int]]]] = None
+
+  @staticmethod
+  def Active() -> Optional['PendingCounts']:
+    """The counts of the calling thread, None when counting directly."""
+    adds = Entity.WORLD_ADDS_
+    return None if adds is None else adds.__dict__.get('counts')
+
+  @staticmethod
+  def Add(counts: dict[str, int], key: str, n: int):
+    if n:
+      counts[key] = counts.get(key, 0) + n
+
+  def AddLive(self, spawner: Spawner, n: int):
+    if n:
+      key = (spawner, spawner.resets_)
+      self.live[key] = self.live.get(key, 0) + n
+
+  def __enter__(self) -> 'PendingCounts':
+    """Counts in self on the calling thread, which must be in WORLD_ADDS_."""
+    adds = Entity.WORLD_ADDS_
+    self.previous_ = (adds.__dict__.get('counts'), EXPRESSION_CACHE.Defer(self.expressions))
+    adds.counts = self
+    return self
+
+  def __exit__(self, *args):
+    previous, expressions = self.previous_
+    Entity.WORLD_ADDS_.counts = previous
+    EXPRESSION_CACHE.Defer(expressions)
+
+  def Apply(self):
+    for (spawner, resets), n in self.live.items():
+      if spawner.resets_ == resets:
+        spawner.live_count += n
+    for key, n in self.spawned.items():
+      Spawner.SPAWNED_[key] = Spawner.SPAWNED_.get(key, 0) + n
+    for key, n in self.capped.items():
+      Spawner.CAPPED_[key] = Spawner.CAPPED_.get(key, 0) + n
+    EXPRESSION_CACHE.AddCounts(self.expressions)
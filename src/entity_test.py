@@ -5,6 +5,7 @@ from dataclasses import replace as CopyDataclass
 from google.protobuf import text_format
 from proto import spawner_pb2
 from src import entity
+from src import spawn_queue
 from src.state_function import GenerateCartesianStateFn
 from src.state_function import PositionState
 
@@ -188,6 +189,89 @@ class MovementTest(unittest.TestCase):
     self.assertEqual(pos, PositionState(1, 0, 0))
     self.assertEqual(transition_pos, PositionState(0, 5, 0))
 
+  def testCalc_dtPassingSeveralLifetimes_accumulatesEveryTransition(self):
+    movement_pb = text_format.Parse("""
+        state_fn { cartesian { x: "t" } }
+        lifetime: 1
+        state_fn { cartesian { y: "t" } }
+        lifetime: 1
+        state_fn { cartesian { x: "-t" } }
+        lifetime: 1
+        state_fn { cartesian { y: "-t" } }
+        lifetime: 1
+      """, spawner_pb2.Movement())
+    movement = entity.Movement(movement_pb)
+
+    pos = movement.Calc({}, 3.5)
+    transition_pos = movement.GetAndClearTransitionPosition()
+
+    self.assertEqual(movement.current_idx, 3)
+    self.assertAlmostEqual(movement.current_time, 0.5)
+    self.assertEqual(transition_pos, PositionState(0, 1, 0))
+    self.assertEqual(pos, PositionState(0, -0.5, 0))
+
+  def testCalc_dtPassingSeveralLoops_addsEachLoop(self):
+    movement_pb = text_format.Parse("""
+        state_fn { cartesian { x: "t" } }
+        lifetime: 1
+        state_fn { cartesian { y: "t" } }
+        lifetime: 1
+        loop: true
+      """, spawner_pb2.Movement())
+    movement = entity.Movement(movement_pb)
+    movement.current_time = 0.5
+
+    pos = movement.Calc({}, 6)
+    transition_pos = movement.GetAndClearTransitionPosition()
+
+    # Finishes 3 loops, then ends half way into the first state_fn.
+    self.assertEqual(movement.current_idx, 0)
+    self.assertAlmostEqual(movement.current_time, 0.5)
+    self.assertEqual(transition_pos, PositionState(3, 3, 0))
+    self.assertEqual(pos, PositionState(0.5, 0, 0))
+
+  def testInit_variables_unionOfStateFns(self):
+    movement_pb = text_format.Parse("""
+        state_fn { cartesian { x: "t" } }
+        lifetime: 1
+        state_fn { delta { dy: "cos(anglea)" } }
+        lifetime: 1
+      """, spawner_pb2.Movement())
+
+    movement = entity.Movement(movement_pb)
+
+    self.assertEqual(movement.variables, {'t', 'y', 'dt', 'anglea'})
+
+  def testInit_constantForeverMovement_isStatic(self):
+    movement_pb = text_format.Parse("""
+        state_fn { cartesian { x: "600" y: "400" } }
+        lifetime: 0
+      """, spawner_pb2.Movement())
+
+    movement = entity.Movement(movement_pb)
+
+    self.assertEqual(movement.static_position, PositionState(600, 400, 0))
+
+  def testInit_idxOnlyMovement_isStaticPerIdx(self):
+    movement_pb = text_format.Parse("""
+        state_fn { cartesian { x: "10 * idx" } }
+        lifetime: 0
+      """, spawner_pb2.Movement())
+
+    movement = entity.Movement(movement_pb, idx=2)
+    self.assertEqual(movement.static_position, PositionState(20, 0, 0))
+
+    movement.Reset(idx=3)
+    self.assertEqual(movement.static_position, PositionState(30, 0, 0))
+
+  def testInit_constantWithLifetime_isNotStatic(self):
+    movement_pb = text_format.Parse("""
+        state_fn { cartesian { x: "600" } }
+        lifetime: 5
+      """, spawner_pb2.Movement())
+
+    self.assertIsNone(entity.Movement(movement_pb).static_position)
+
 class TestEntity(unittest.TestCase):
   GenerateCartesianStateFn(text_format.Parse("""
       id { id: 'x_and_angle_move' }
@@ -300,6 +384,35 @@ class TestEntity(unittest.TestCase):
     self.assertEqual(child_t1, PositionState(2, -5, math.pi))
     self.assertEqual(parent_t1, PositionState(2, 0, math.pi))
 
+  def testUpdate_noAbsoluteVariables_skipsAbsolutePosition(self):
+    self.parent_entity.AbsolutePosition()
+    calls = []
+    original = self.child_entity.AbsolutePosition
+    self.child_entity.AbsolutePosition = lambda: calls.append(1) or original()
+
+    self.child_entity.Update({}, dt=1)
+
+    self.assertEqual(calls, [])
+
+  def testUpdate_leafChild_onlyUpdatesPosition(self):
+    self.assertTrue(self.child_entity.leaf_)
+    calls = []
+    original = self.child_entity.Update
+    self.child_entity.Update = lambda *args: calls.append(1) or original(*args)
+
+    self.parent_entity.Update({}, dt=1)
+
+    self.assertEqual(calls, [])
+    self.assertEqual(self.child_entity.AbsolutePosition(), PositionState(0, 5, 0))
+
+  def testUpdate_leafWithAddedChild_updatesGrandchild(self):
+    grandchild = entity.Entity(self.child_entity_pb, self.child_entity)
+    self.child_entity.AddChild(grandchild)
+
+    self.parent_entity.Update({}, dt=1)
+
+    self.assertEqual(grandchild.AbsolutePosition(), PositionState(0, 5, 0))
+
   def test_followAngle_rotatesChildAngle(self):
     self.child_entity.follow_center = False
     self.child_entity.follow_angle = True
@@ -313,6 +426,131 @@ class TestEntity(unittest.TestCase):
     self.assertEqual(parent_t1, PositionState(2, 0, math.pi))
 
 
+class TestUpdatePolicy(unittest.TestCase):
+  def tearDown(self):
+    entity.LodPolicy.VIEW_ = None
+
+  def MakeEntity(self, policy_pb_txt: str) -> entity.Entity:
+    return entity.Entity(text_format.Parse(f"""
+        movement {{
+          state_fn {{ polar {{ r: "10" theta: "t" angle: "t" }} }}
+          lifetime: 2
+          state_fn {{ cartesian {{ x: "3 * t" }} }}
+          lifetime: 0
+        }}
+        {policy_pb_txt}
+      """, spawner_pb2.Entity()))
+
+  def testUpdate_interval_onlyMovesEveryIntervalFrames(self):
+    lod = self.MakeEntity('update_policy { interval: 3 }')
+
+    lod.Update({}, 0.5)
+    lod.Update({}, 0.5)
+    self.assertEqual(lod.position, PositionState())
+
+    lod.Update({}, 0.5)
+    self.assertAlmostEqual(lod.position.x, 10 * math.cos(1.5))
+    self.assertAlmostEqual(lod.position.y, 10 * math.sin(1.5))
+
+  def testUpdate_interval_matchesEveryFrameAcrossTransitions(self):
+    lod = self.MakeEntity('update_policy { interval: 4 }')
+    full = self.MakeEntity('')
+
+    for _ in range(12):
+      lod.Update({}, 0.25)
+      full.Update({}, 0.25)
+
+    self.assertAlmostEqual(lod.AbsolutePosition().x, full.AbsolutePosition().x)
+    self.assertAlmostEqual(lod.AbsolutePosition().y, full.AbsolutePosition().y)
+    self.assertAlmostEqual(lod.AbsolutePosition().angle, full.AbsolutePosition().angle)
+
+  def testUpdate_skippedFrame_stillFollowsParent(self):
+    parent = entity.Entity(text_format.Parse("""
+        movement { state_fn { cartesian { x: "t" } } lifetime: 0 }
+      """, spawner_pb2.Entity()))
+    child = self.MakeEntity('update_policy { interval: 2 }')
+    child.parent = parent
+    child.follow_center = True
+    parent.AddChild(child)
+
+    parent.Update({}, 1)
+
+    self.assertEqual(child.position, PositionState())
+    self.assertEqual(child.AbsolutePosition(), PositionState(1, 0, 0))
+
+  def testUpdate_offscreen_usesOffscreenInterval(self):
+    entity.LodPolicy.VIEW_ = (-5, -5, 5, 5)
+    lod = self.MakeEntity(
+      'update_policy { interval: 1 offscreen_interval: 2 offscreen_margin: 1 }')
+
+    lod.Update({}, 0.5)
+    self.assertNotEqual(lod.position, PositionState())
+    moved = lod.position
+
+    # Now 10 away from the center, which is off-screen.
+    lod.Update({}, 0.5)
+    self.assertEqual(lod.position, moved)
+    lod.Update({}, 0.5)
+    self.assertAlmostEqual(lod.position.x, 10 * math.cos(1.5))
+
+  def MakeEmitter(self, policy_pb_txt: str, spawn_time_fn: str) -> entity.Entity:
+    return entity.Entity(text_format.Parse(f"""
+        movement {{ state_fn {{ cartesian {{ x: "t" }} }} lifetime: 0 }}
+        spawner {{
+          spawn_entity {{
+            movement {{ state_fn {{ polar {{ r: "10 * t" theta: "t" }} }} lifetime: 0 }}
+          }}
+          spawn_count: 1
+          spawn_time_fn: "{spawn_time_fn}"
+          follow_center: true
+        }}
+        {policy_pb_txt}
+      """, spawner_pb2.Entity()))
+
+  def AssertSameSpawns(self, lod: entity.Entity, full: entity.Entity):
+    self.assertEqual(len(lod.children_), 1)
+    self.assertEqual(len(full.children_), 1)
+    lod_spawn = lod.children_[0].AbsolutePosition()
+    full_spawn = full.children_[0].AbsolutePosition()
+    self.assertAlmostEqual(lod_spawn.x, full_spawn.x)
+    self.assertAlmostEqual(lod_spawn.y, full_spawn.y)
+
+  def testUpdate_interval_spawnInSkippedFrame_matchesEveryFrame(self):
+    lod = self.MakeEmitter('update_policy { interval: 4 }', '0.5')
+    full = self.MakeEmitter('', '0.5')
+
+    for _ in range(12):
+      lod.Update({}, 0.25)
+      full.Update({}, 0.25)
+
+    self.AssertSameSpawns(lod, full)
+
+  def testUpdate_interval_spawnInSkippedFrame_startsAtItsSpawnTime(self):
+    lod = self.MakeEmitter('update_policy { interval: 4 }', '2.5 / 60')
+
+    for _ in range(4):
+      lod.Update({}, 1 / 60)
+
+    self.assertAlmostEqual(lod.children_[0].movement.current_time, 1.5 / 60)
+
+  def testUpdate_intervalWithQueue_spawnInSkippedFrame_matchesEveryFrame(self):
+    entity.Spawner.QUEUE_ = spawn_queue.SpawnQueue()
+    self.addCleanup(setattr, entity.Spawner, 'QUEUE_', None)
+    world = entity.Entity.CreateWorld()
+    lod = self.MakeEmitter('update_policy { interval: 4 }', '0.6')
+    full = self.MakeEmitter('', '0.6')
+    world.AddChild(lod)
+    world.AddChild(full)
+
+    for _ in range(12):
+      world.Update({}, 0.25)
+
+    self.AssertSameSpawns(lod, full)
+
+  def testInit_everyFramePolicy_hasNoLod(self):
+    self.assertIsNone(self.MakeEntity('update_policy { interval: 1 }').lod_)
+
+
 class TestSpawner(unittest.TestCase):
   def setUp(self):
     self.entity_pb = text_format.Parse("""
@@ -340,7 +578,7 @@ class TestSpawner(unittest.TestCase):
       """, spawner_pb2.Entity())
     self.parent_entity = entity.Entity(self.parent_entity_pb)
 
-    entity.Entity.ZA_WARUDO.children_.clear()
+    entity.Entity.CreateWorld()
 
   def testInit_createsOrderedSpawnTimes(self):
     spawner_pb = text_format.Parse("""
@@ -429,5 +667,179 @@ class TestSpawner(unittest.TestCase):
     self.assertAlmostEqual(parent.spawners[0].current_time, 0.01)
     self.assertEqual(parent.spawners[0].current_spawn_pos, 0)
 
+  def testUpdate_dtSpanningSeveralPeriods_spawnsEveryWave(self):
+    spawner_pb = text_format.Parse("""
+        spawn_entity { id { id: "spawn_entity" } }
+        spawn_count: 2
+        spawn_time_fn: "idx"
+        period: 3
+      """, spawner_pb2.Spawner())
+    parent_pb = self.parent_entity_pb
+    parent_pb.spawner.append(spawner_pb)
+    parent = entity.Entity(parent_pb)
+
+    parent.Update({}, 10)
+
+    # Spawns at 0, 1, 3, 4, 6, 7, and 9
+    self.assertEqual(len(entity.Entity.ZA_WARUDO.children_), 7)
+    self.assertEqual(parent.spawners[0].period_index, 3)
+    self.assertAlmostEqual(parent.spawners[0].current_time, 1)
+
+  def testUpdate_despawnedEntity_isReusedFromPool(self):
+    bullet_pb = text_format.Parse("""
+        id { id: "short_lived" }
+        movement {
+          state_fn { cartesian { x: "t" } }
+          lifetime: 1
+          loop: false
+        }
+      """, spawner_pb2.Entity())
+    entity.Entity.Save(bullet_pb)
+    spawner_pb = text_format.Parse("""
+        spawn_entity { id { id: "short_lived" } }
+        spawn_count: 1
+        spawn_time_fn: "0"
+        period: 2
+        follow_center: true
+      """, spawner_pb2.Spawner())
+    parent_pb = self.parent_entity_pb
+    parent_pb.spawner.append(spawner_pb)
+    parent = entity.Entity(parent_pb)
+    entity.Entity.POOL_.Clear()
+
+    parent.Update({}, 0.5)
+    first = parent.children_[0]
+    # Runs past the lifetime, then gets removed on the following update.
+    parent.Update({}, 1)
+    parent.Update({}, 0.1)
+    self.assertEqual(len(parent.children_), 0)
+    self.assertEqual(entity.Entity.POOL_.Size('short_lived'), 1)
+
+    # Wraps the period, then spawns again.
+    parent.Update({}, 0.5)
+    parent.Update({}, 0.1)
+    self.assertIs(parent.children_[0], first)
+    self.assertTrue(first.movement.is_active)
+    self.assertEqual(first.movement.current_idx, 0)
+    self.assertEqual(entity.Entity.POOL_.hits, 1)
+
+  def testInit_inlineSpawnEntity_namedAfterSpawner(self):
+    self.parent_entity_pb.spawner.append(text_format.Parse("""
+        spawn_entity { movement { state_fn { cartesian {} } lifetime: 0 } }
+        spawn_count: 1
+        spawn_time_fn: "0"
+      """, spawner_pb2.Spawner()))
+    parent = entity.Entity(self.parent_entity_pb)
+
+    self.assertEqual(parent.spawners[0].template_id, 'parent_entity/spawner[0]')
+
+  def testUpdate_maxLive_skipsSpawnsUntilOneDespawns(self):
+    spawner_pb = text_format.Parse("""
+        id { id: "capped_spawner" }
+        spawn_entity { movement { state_fn { cartesian {} } lifetime: 1 } }
+        spawn_count: 3
+        spawn_time_fn: "idx / 10"
+        period: 0.5
+        max_live: 2
+        follow_center: true
+      """, spawner_pb2.Spawner())
+    self.parent_entity_pb.spawner.append(spawner_pb)
+    parent = entity.Entity(self.parent_entity_pb)
+    entity.Spawner.CAPPED_.clear()
+
+    with self.assertLogs(level='WARNING'):
+      parent.Update({}, 0.25)
+    self.assertEqual(len(parent.children_), 2)
+    self.assertEqual(parent.spawners[0].live_count, 2)
+    self.assertEqual(entity.Spawner.CAPPED_, {'capped_spawner': 1})
+
+    # The next two waves are skipped while the first one is still alive.
+    parent.Update({}, 1)
+    self.assertEqual(entity.Spawner.CAPPED_, {'capped_spawner': 7})
+    # Releasing the expired spawns makes room again.
+    parent.Update({}, 0.1)
+    self.assertEqual(parent.spawners[0].live_count, 0)
+    parent.Update({}, 0.2)
+    self.assertEqual(parent.spawners[0].live_count, 1)
+    self.assertEqual(entity.Spawner.CAPPED_, {'capped_spawner': 7})
+
+  def testUpdate_maxLiveOfPooledEmitter_ignoresSpawnsOfPreviousUse(self):
+    emitter_pb = text_format.Parse("""
+        id { id: "pooled_emitter" }
+        movement { state_fn { cartesian {} } lifetime: 0 }
+        spawner {
+          spawn_entity { movement { state_fn { cartesian { x: "t" } } lifetime: 0 } }
+          spawn_count: 1
+          spawn_time_fn: "0"
+          period: 0.05
+          max_live: 5
+        }
+      """, spawner_pb2.Entity())
+    entity.Entity.POOL_.Clear()
+    world = entity.Entity.World()
+
+    emitter = entity.Entity.Spawn(emitter_pb, 'pooled_emitter', world)
+    world.AddChild(emitter)
+    emitter.Update({}, 1)
+    spawner = emitter.spawners[0]
+    old_bullets = [child for child in world.children_ if child.spawned_by_ is spawner]
+    self.assertEqual(len(old_bullets), 5)
+    world.children_.remove(emitter)
+    entity.Entity.Release(emitter)
+
+    reused = entity.Entity.Spawn(emitter_pb, 'pooled_emitter', world)
+    self.assertIs(reused, emitter)
+    world.AddChild(reused)
+    reused.Update({}, 1)
+    # The bullets of the previous use die off without making room for more.
+    for bullet in old_bullets:
+      world.children_.remove(bullet)
+      entity.Entity.Release(bullet)
+    reused.Update({}, 1)
+
+    new_bullets = [child for child in world.children_ if child.spawned_by_ is spawner]
+    self.assertEqual(len(new_bullets), 5)
+    self.assertEqual(spawner.live_count, 5)
+
+  def testInit_inlineSpawnEntityOfAnonymousOwner_isNotPooled(self):
+    self.parent_entity_pb.ClearField('id')
+    self.parent_entity_pb.spawner.append(text_format.Parse("""
+        spawn_entity { movement { state_fn { cartesian {} } lifetime: 1 } }
+        spawn_count: 1
+        spawn_time_fn: "0"
+        follow_center: true
+      """, spawner_pb2.Spawner()))
+    parent = entity.Entity(self.parent_entity_pb)
+    entity.Entity.POOL_.Clear()
+
+    parent.Update({}, 0.5)
+    parent.Update({}, 1)
+    parent.Update({}, 0.1)
+
+    self.assertEqual(parent.spawners[0].template_id, '')
+    self.assertEqual(entity.Entity.POOL_.Size(), 0)
+
+class TestWorld(unittest.TestCase):
+  def tearDown(self):
+    entity.Entity.CreateWorld()
+
+  def test_world_createdOnFirstUse(self):
+    entity.Entity.ZA_WARUDO = None
+
+    world = entity.Entity.World()
+
+    self.assertIs(entity.Entity.ZA_WARUDO, world)
+    self.assertIs(entity.Entity.World(), world)
+    self.assertEqual(world.template_id, 'world')
+
+  def test_createWorld_replacesWorld(self):
+    old = entity.Entity.World()
+    old.AddChild(entity.Entity(entity.WORLD_ENTITY_PB))
+
+    world = entity.Entity.CreateWorld()
+
+    self.assertIsNot(world, old)
+    self.assertEqual(world.children_, [])
+
 if __name__ == '__main__':
   unittest.main()
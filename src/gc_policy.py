@@ -0,0 +1,114 @@
+import gc
+import time
+from typing import Optional
+
+from src.instrumentation import Instrumentation
+from src.instrumentation import INSTRUMENTATION
+
+def FreezeLoadedUnits():
+  """Moves everything alive into the permanent generation.
+
+  Call this once after LoadDefinedUnits and world construction. The saved
+  protos, compiled StateFns and their code objects live for the whole
+  process, so there is no reason for the cyclic GC to rescan them on every
+  collection during gameplay.
+  """
+  gc.collect()
+  gc.freeze()
+
+def UnfreezeLoadedUnits():
+  gc.unfreeze()
+
+class FrameGcPolicy():
+  """Runs the cyclic garbage collector only at frame boundaries.
+
+  Automatic collection is disabled while the policy is active. At the end of
+  each frame OnFrameEnd decides which generation (if any) to collect based on
+  the allocation counts, and full collections are deferred until a frame has
+  enough spare time left or max_full_deferral frames have passed.
+
+  Every pause is reported to the instrumentation as gc.gen<N>, and pauses
+  longer than frame_budget are counted as gc.over_budget.
+  """
+  def __init__(self,
+      instrumentation: Instrumentation = INSTRUMENTATION,
+      young_threshold: int = 2000,
+      middle_threshold: int = 10,
+      full_interval_frames: int = 600,
+      max_full_deferral: int = 600,
+      frame_budget: float = 1 / 60):
+    self.instrumentation = instrumentation
+    self.young_threshold = young_threshold
+    self.middle_threshold = middle_threshold
+    self.full_interval_frames = full_interval_frames
+    self.max_full_deferral = max_full_deferral
+    self.frame_budget = frame_budget
+
+    self.frames_since_full_ = 0
+    self.last_full_pause_ = 0.0
+    self.was_enabled_ = True
+    self.started_ = False
+    self.collection_start_ = 0.0
+
+  def Start(self):
+    if self.started_:
+      return
+    self.was_enabled_ = gc.isenabled()
+    gc.disable()
+    gc.callbacks.append(self.Callback_)
+    self.started_ = True
+
+  def Stop(self):
+    if not self.started_:
+      return
+    gc.callbacks.remove(self.Callback_)
+    if self.was_enabled_:
+      gc.enable()
+    self.started_ = False
+
+  def __enter__(self) -> 'FrameGcPolicy':
+    self.Start()
+    return self
+
+  def __exit__(self, *args):
+    self.Stop()
+
+  def Callback_(self, phase: str, info: dict):
+    if phase == 'start':
+      self.collection_start_ = time.perf_counter()
+      return
+    pause = time.perf_counter() - self.collection_start_
+    generation = info.get('generation', 0)
+    self.instrumentation.Record(f'gc.gen{generation}', pause)
+    if pause > self.frame_budget:
+      self.instrumentation.Count('gc.over_budget')
+    if generation == 2:
+      self.last_full_pause_ = pause
+
+  def OnFrameEnd(self, remaining: Optional[float] = None) -> Optional[int]:
+    """Collect garbage at the end of a frame if needed.
+
+    Args:
+      remaining: Seconds left in this frame's budget, if known.
+    Returns:
+      The generation that was collected, or None if nothing was collected.
+    """
+    self.frames_since_full_ += 1
+    young, middle, _ = gc.get_count()
+
+    if self.frames_since_full_ >= self.full_interval_frames:
+      has_time = remaining is None or remaining > self.last_full_pause_
+      if has_time or self.frames_since_full_ >= (
+          self.full_interval_frames + self.max_full_deferral):
+        gc.collect(2)
+        self.frames_since_full_ = 0
+        return 2
+      self.instrumentation.Count('gc.full_deferred')
+
+    if middle >= self.middle_threshold:
+      gc.collect(1)
+      return 1
+    if young >= self.young_threshold:
+      gc.collect(0)
+      return 0
+    return None
@@ -0,0 +1,57 @@
+import gc
+import unittest
+
+from src import gc_policy
+from src.instrumentation import Instrumentation
+
+class TestFrameGcPolicy(unittest.TestCase):
+  def tearDown(self):
+    gc.enable()
+
+  def testStart_disablesAutomaticCollection_restoredOnStop(self):
+    policy = gc_policy.FrameGcPolicy(Instrumentation())
+
+    with policy:
+      self.assertFalse(gc.isenabled())
+    self.assertTrue(gc.isenabled())
+
+  def testOnFrameEnd_fullIntervalReached_collectsAndRecordsPause(self):
+    instrumentation = Instrumentation()
+    policy = gc_policy.FrameGcPolicy(instrumentation, full_interval_frames=2)
+
+    with policy:
+      self.assertNotEqual(policy.OnFrameEnd(), 2)
+      self.assertEqual(policy.OnFrameEnd(), 2)
+
+    self.assertEqual(instrumentation.timings['gc.gen2'].count, 1)
+
+  def testOnFrameEnd_noTimeRemaining_defersFullCollection(self):
+    instrumentation = Instrumentation()
+    policy = gc_policy.FrameGcPolicy(
+      instrumentation, full_interval_frames=1, max_full_deferral=2)
+    policy.last_full_pause_ = 0.005
+
+    with policy:
+      self.assertNotEqual(policy.OnFrameEnd(remaining=0.001), 2)
+      self.assertNotEqual(policy.OnFrameEnd(remaining=0.001), 2)
+      # Deferred for too long, so collects regardless.
+      self.assertEqual(policy.OnFrameEnd(remaining=0.001), 2)
+
+    self.assertEqual(instrumentation.counters['gc.full_deferred'], 2)
+
+class TestInstrumentation(unittest.TestCase):
+  def testSummary_includesCountersAndTimings(self):
+    instrumentation = Instrumentation()
+
+    instrumentation.Count('spawns', 3)
+    instrumentation.Record('update', 0.002)
+    instrumentation.Record('update', 0.004)
+
+    summary = instrumentation.Summary()
+    self.assertEqual(summary['spawns'], 3)
+    self.assertEqual(summary['update.count'], 2)
+    self.assertAlmostEqual(summary['update.mean_ms'], 3)
+    self.assertAlmostEqual(summary['update.max_ms'], 4)
+
+if __name__ == '__main__':
+  unittest.main()
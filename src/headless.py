@@ -0,0 +1,49 @@
+"""Runs the simulation at a fixed step without any rendering."""
+import time
+from typing import Callable
+from typing import Optional
+
+from src.entity import Entity
+from src.gc_policy import FrameGcPolicy
+from src.state_function import GetGlobals
+
+GLOBALS_ = GetGlobals()
+
+def LiveCount(entity: Optional[Entity] = None) -> int:
+  """Number of live entities below (not including) entity, defaulting to the world."""
+  entity = entity or Entity.World()
+  count = 0
+  to_count = list(entity.children_)
+  while to_count:
+    child = to_count.pop()
+    count += 1
+    to_count.extend(child.children_)
+  return count
+
+def RunHeadless(
+    frames: int,
+    dt: float = 1 / 60,
+    gc_policy: Optional[FrameGcPolicy] = None,
+    on_frame: Optional[Callable[[int, float], None]] = None) -> list[float]:
+  """Steps the world frames times by dt.
+
+  Args:
+    frames: Number of fixed steps to simulate.
+    dt: Simulated seconds per step.
+    gc_policy: If given, garbage is only collected between frames.
+    on_frame: Called after each frame with (frame index, seconds spent).
+  Returns:
+    Wall clock seconds spent on each frame, including any GC at its end.
+  """
+  world = Entity.World()
+  frame_times = []
+  for frame in range(frames):
+    start = time.perf_counter()
+    world.Update(GLOBALS_, dt)
+    if gc_policy:
+      gc_policy.OnFrameEnd(dt - (time.perf_counter() - start))
+    elapsed = time.perf_counter() - start
+    frame_times.append(elapsed)
+    if on_frame:
+      on_frame(frame, elapsed)
+  return frame_times
@@ -0,0 +1,130 @@
+"""Reloads DefinedUnits textprotos into a running simulation.
+
+Only the units that actually changed are recompiled. Changed StateFns are
+swapped into live Movements and Spawners, changed Spawners are reloaded in
+place keeping their timing, and changed Entity templates apply to new spawns.
+"""
+import logging
+import os
+from dataclasses import dataclass
+from dataclasses import field
+from typing import Optional
+
+from google.protobuf import text_format
+from proto import spawner_pb2
+from src.entity import Entity
+from src.entity import Spawner
+from src import state_function
+from src.loader import ParseDefinedUnits
+from src.state_function import GenerateCartesianStateFn
+from src.state_function import GenerateDeltaStateFn
+from src.state_function import GeneratePolarStateFn
+
+@dataclass
+class UnitsDiff:
+  """Ids of units that are new or differ from what is registered."""
+  functions: set[str] = field(default_factory=set)
+  entities: set[str] = field(default_factory=set)
+  spawners: set[str] = field(default_factory=set)
+
+  def IsEmpty(self) -> bool:
+    return not (self.functions or self.entities or self.spawners)
+
+def DiffDefinedUnits(defined: spawner_pb2.DefinedUnits) -> UnitsDiff:
+  """Compares defined against the registries without modifying anything."""
+  diff = UnitsDiff()
+  for function_pb in (
+      list(defined.cartesian_function) +
+      list(defined.polar_function) +
+      list(defined.delta_function)):
+    name = function_pb.id.id
+    if state_function.DEFINED_FUNCTION_SOURCES_.get(name) != function_pb:
+      diff.functions.add(name)
+
+  for entity_pb in defined.entity:
+    if Entity.SAVED_.get(entity_pb.id.id) != entity_pb:
+      diff.entities.add(entity_pb.id.id)
+
+  for spawner_pb in defined.spawner:
+    if Spawner.SAVED_.get(spawner_pb.id.id) != spawner_pb:
+      diff.spawners.add(spawner_pb.id.id)
+  return diff
+
+def ApplyDefinedUnits(
+    defined: spawner_pb2.DefinedUnits,
+    world: Optional[Entity] = None) -> UnitsDiff:
+  """Registers the changed units in defined and updates live entities.
+
+  Returns:
+    The units that were changed.
+  """
+  diff = DiffDefinedUnits(defined)
+  if diff.IsEmpty():
+    return diff
+
+  for cartesian_pb in defined.cartesian_function:
+    if cartesian_pb.id.id in diff.functions:
+      GenerateCartesianStateFn(cartesian_pb, True)
+  for polar_pb in defined.polar_function:
+    if polar_pb.id.id in diff.functions:
+      GeneratePolarStateFn(polar_pb, True)
+  for delta_pb in defined.delta_function:
+    if delta_pb.id.id in diff.functions:
+      GenerateDeltaStateFn(delta_pb, True)
+
+  for entity_pb in defined.entity:
+    if entity_pb.id.id in diff.entities:
+      Entity.Save(entity_pb, replace=True)
+  for spawner_pb in defined.spawner:
+    if spawner_pb.id.id in diff.spawners:
+      Spawner.Save(spawner_pb, replace=True)
+
+  # Pooled entities may hold onto old StateFns or inline templates.
+  Entity.POOL_.Flush()
+
+  for entity in (world or Entity.World()).Walk():
+    for fn_id in diff.functions:
+      entity.movement.ReplaceStateFn(fn_id, state_function.DEFINED_FUNCTIONS_[fn_id])
+    for spawner in entity.spawners:
+      if spawner.spawner_pb_.id.id in diff.spawners:
+        spawner.Reload()
+      elif spawner.offset_fn_id in diff.functions:
+        spawner.Reload()
+  return diff
+
+class PatternWatcher():
+  """Polls a DefinedUnits textproto and applies it whenever it changes."""
+  def __init__(self, path: str):
+    self.path = path
+    self.mtime_ = self.ModifiedTime_()
+
+  def ModifiedTime_(self) -> Optional[float]:
+    try:
+      return os.stat(self.path).st_mtime
+    except OSError:
+      return None
+
+  def Poll(self) -> Optional[UnitsDiff]:
+    """Reloads the file if it was modified since the last Poll.
+
+    Parse errors are logged and the previous definitions are kept, so a
+    half-saved file does not stop the simulation.
+
+    Returns:
+      The applied diff, or None if nothing was reloaded.
+    """
+    mtime = self.ModifiedTime_()
+    if mtime is None or mtime == self.mtime_:
+      return None
+    self.mtime_ = mtime
+    try:
+      with open(self.path, 'r') as f:
+        defined = ParseDefinedUnits(f.read())
+    except (OSError, text_format.ParseError) as e:
+      logging.warning(f'Not reloading {self.path}: {e}')
+      return None
+    diff = ApplyDefinedUnits(defined)
+    logging.info(
+      f'Reloaded {self.path}: functions={sorted(diff.functions)} '
+      f'entities={sorted(diff.entities)} spawners={sorted(diff.spawners)}')
+    return diff
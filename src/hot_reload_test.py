@@ -0,0 +1,132 @@
+import os
+import tempfile
+import unittest
+
+from proto import spawner_pb2
+from src import entity
+from src import hot_reload
+from src.loader import ParseDefinedUnits
+from src.loader import RegisterDefinedUnits
+from src.state_function import PositionState
+
+UNITS_PB_TXT = """
+  cartesian_function {
+    id { id: 'reload_move' }
+    x: '10 * t'
+  }
+
+  entity {
+    id { id: 'reload_bullet' }
+    movement {
+      state_fn { id { id: 'reload_move' } }
+      lifetime: 0
+    }
+  }
+
+  spawner {
+    id { id: 'reload_spawner' }
+    spawn_entity { id { id: 'reload_bullet' } }
+    spawn_count: 2
+    spawn_time_fn: 'idx'
+    period: 10
+    follow_center: true
+  }
+
+  entity {
+    id { id: 'reload_emitter' }
+    movement {
+      state_fn { cartesian {} }
+      lifetime: 0
+    }
+    spawner { id { id: 'reload_spawner' } }
+  }
+"""
+
+class TestHotReload(unittest.TestCase):
+  @classmethod
+  def setUpClass(cls):
+    RegisterDefinedUnits(ParseDefinedUnits(UNITS_PB_TXT))
+
+  def setUp(self):
+    emitter_pb = spawner_pb2.Entity()
+    emitter_pb.id.id = 'reload_emitter'
+    self.world = entity.Entity(emitter_pb)
+
+  def tearDown(self):
+    hot_reload.ApplyDefinedUnits(ParseDefinedUnits(UNITS_PB_TXT), self.world)
+
+  def testDiff_unchangedUnits_isEmpty(self):
+    diff = hot_reload.DiffDefinedUnits(ParseDefinedUnits(UNITS_PB_TXT))
+
+    self.assertTrue(diff.IsEmpty())
+
+  def testApply_changedFunction_swapsIntoLiveEntities(self):
+    self.world.Update({}, 0.5)
+    bullet = self.world.children_[0]
+
+    diff = hot_reload.ApplyDefinedUnits(ParseDefinedUnits(
+      UNITS_PB_TXT.replace("x: '10 * t'", "y: '10 * t'")), self.world)
+    self.world.Update({}, 0.5)
+
+    self.assertEqual(diff.functions, {'reload_move'})
+    self.assertEqual(diff.entities, set())
+    self.assertEqual(bullet.position, PositionState(0, 10, 0))
+
+  def testApply_changedSpawner_reloadsAndKeepsTiming(self):
+    self.world.Update({}, 1.5)
+    self.assertEqual(len(self.world.children_), 2)
+
+    diff = hot_reload.ApplyDefinedUnits(ParseDefinedUnits(
+      UNITS_PB_TXT.replace('spawn_count: 2', 'spawn_count: 4')), self.world)
+    spawner = self.world.spawners[0]
+
+    self.assertEqual(diff.spawners, {'reload_spawner'})
+    self.assertEqual(spawner.spawn_count, 4)
+    self.assertAlmostEqual(spawner.current_time, 1.5)
+    self.assertEqual(spawner.current_spawn_pos, 2)
+    self.world.Update({}, 2)
+    self.assertEqual(len(self.world.children_), 4)
+
+  def testApply_changedEntity_replacesTemplateAndBumpsVersion(self):
+    version = entity.Entity.VERSIONS_['reload_bullet']
+
+    hot_reload.ApplyDefinedUnits(ParseDefinedUnits(
+      UNITS_PB_TXT.replace("id { id: 'reload_bullet' }", "id { id: 'reload_bullet' } image: 'new.png'")),
+      self.world)
+
+    self.assertEqual(entity.Entity.VERSIONS_['reload_bullet'], version + 1)
+    self.assertEqual(entity.Entity.SAVED_['reload_bullet'].image, 'new.png')
+
+class TestPatternWatcher(unittest.TestCase):
+  def testPoll_onlyReloadsWhenModified(self):
+    with tempfile.TemporaryDirectory() as tmp:
+      path = os.path.join(tmp, 'units.textproto')
+      with open(path, 'w') as f:
+        f.write("cartesian_function { id { id: 'watched' } x: '1' }")
+      watcher = hot_reload.PatternWatcher(path)
+
+      self.assertIsNone(watcher.Poll())
+
+      with open(path, 'w') as f:
+        f.write("cartesian_function { id { id: 'watched' } x: '2' }")
+      os.utime(path, (0, 12345))
+      diff = watcher.Poll()
+
+      self.assertEqual(diff.functions, {'watched'})
+      self.assertIsNone(watcher.Poll())
+
+  def testPoll_invalidFile_keepsRunning(self):
+    with tempfile.TemporaryDirectory() as tmp:
+      path = os.path.join(tmp, 'units.textproto')
+      with open(path, 'w') as f:
+        f.write('')
+      watcher = hot_reload.PatternWatcher(path)
+
+      with open(path, 'w') as f:
+        f.write('not { valid')
+      os.utime(path, (0, 12345))
+
+      self.assertIsNone(watcher.Poll())
+
+if __name__ == '__main__':
+  unittest.main()
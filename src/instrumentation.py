@@ -0,0 +1,63 @@
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Iterator
+import time
+
+@dataclass
+class TimingStats:
+  """Aggregated durations (in seconds) for a single named measurement."""
+  count: int = 0
+  total: float = 0
+  max: float = 0
+
+  def Add(self, seconds: float):
+    self.count += 1
+    self.total += seconds
+    if seconds > self.max:
+      self.max = seconds
+
+  def Mean(self) -> float:
+    return self.total / self.count if self.count else 0.0
+
+class Instrumentation():
+  """Cheap named counters and timings collected while the game runs.
+
+  Everything is aggregated in place so recording stays O(1) in memory
+  regardless of how long the simulation runs.
+  """
+  def __init__(self):
+    self.counters: dict[str, int] = {}
+    self.timings: dict[str, TimingStats] = {}
+
+  def Count(self, name: str, n: int = 1):
+    self.counters[name] = self.counters.get(name, 0) + n
+
+  def Record(self, name: str, seconds: float):
+    stats = self.timings.get(name)
+    if stats is None:
+      stats = self.timings[name] = TimingStats()
+    stats.Add(seconds)
+
+  @contextmanager
+  def Timer(self, name: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+      yield
+    finally:
+      self.Record(name, time.perf_counter() - start)
+
+  def Reset(self):
+    self.counters.clear()
+    self.timings.clear()
+
+  def Summary(self) -> dict[str, float]:
+    """Flattens all values into a single dict, with timings in milliseconds."""
+    res: dict[str, float] = dict(self.counters)
+    for name, stats in self.timings.items():
+      res[f'{name}.count'] = stats.count
+      res[f'{name}.total_ms'] = stats.total * 1000
+      res[f'{name}.mean_ms'] = stats.Mean() * 1000
+      res[f'{name}.max_ms'] = stats.max * 1000
+    return res
+
+INSTRUMENTATION = Instrumentation()
@@ -0,0 +1,32 @@
+from proto import spawner_pb2
+from google.protobuf import text_format
+from src.entity import Entity
+from src.entity import Spawner
+from src.state_function import GenerateCartesianStateFn
+from src.state_function import GenerateDeltaStateFn
+from src.state_function import GeneratePolarStateFn
+
+def ParseDefinedUnits(text: str) -> spawner_pb2.DefinedUnits:
+  return text_format.Parse(text, spawner_pb2.DefinedUnits())
+
+def RegisterDefinedUnits(defined: spawner_pb2.DefinedUnits):
+  """Compiles and saves all StateFns, Entities, and Spawners for later use."""
+  for cartesian_pb in defined.cartesian_function:
+    GenerateCartesianStateFn(cartesian_pb, True)
+  for polar_pb in defined.polar_function:
+    GeneratePolarStateFn(polar_pb, True)
+  for delta_pb in defined.delta_function:
+    GenerateDeltaStateFn(delta_pb, True)
+
+  for entity_pb in defined.entity:
+    Entity.Save(entity_pb)
+
+  for spawner_pb in defined.spawner:
+    Spawner.Save(spawner_pb)
+
+def LoadDefinedUnitsFile(path: str) -> spawner_pb2.DefinedUnits:
+  """Parses and registers a DefinedUnits textproto from a file path."""
+  with open(path, 'r') as f:
+    defined = ParseDefinedUnits(f.read())
+  RegisterDefinedUnits(defined)
+  return defined
@@ -0,0 +1,47 @@
+from typing import Callable
+from typing import Optional
+
+from proto import spawner_pb2
+from src.state_function import PositionState
+
+class LodPolicy():
+  """How many frames an Entity subtree waits between updates, from its UpdatePolicy.
+
+  Skipped frames are made up for with one larger step, see Entity.Update.
+  """
+  # (left, top, right, bottom) of what is visible, None if everything is.
+  VIEW_: Optional[tuple[float, float, float, float]] = None
+
+  @classmethod
+  def FromPb(cls, policy_pb: spawner_pb2.UpdatePolicy) -> Optional['LodPolicy']:
+    """Returns None if the policy simulates every frame anyways."""
+    policy = LodPolicy(policy_pb)
+    if policy.interval == 1 and policy.offscreen_interval == 1:
+      return None
+    return policy
+
+  def __init__(self, policy_pb: spawner_pb2.UpdatePolicy):
+    self.interval = max(1, policy_pb.interval)
+    self.offscreen_interval = (
+      max(1, policy_pb.offscreen_interval) if policy_pb.offscreen_interval
+      else self.interval)
+    self.offscreen_margin = policy_pb.offscreen_margin
+
+  def IsOffscreen(self, position: PositionState) -> bool:
+    if LodPolicy.VIEW_ is None:
+      return False
+    left, top, right, bottom = LodPolicy.VIEW_
+    margin = self.offscreen_margin
+    return (
+      position.x < left - margin or position.x > right + margin or
+      position.y < top - margin or position.y > bottom + margin)
+
+  def Interval(self, absolute_position: Callable[[], PositionState]) -> int:
+    """Frames between updates for an entity.
+
+    absolute_position is only called if the interval depends on it.
+    """
+    if (self.offscreen_interval != self.interval and
+        self.IsOffscreen(absolute_position())):
+      return self.offscreen_interval
+    return self.interval
@@ -1,16 +1,25 @@
-import pygame
-from queue import Queue
+import argparse
+import asyncio
 import time
+from typing import Optional
 
 from proto.spawner_pb2 import Entity
 from proto import spawner_pb2
-from google.protobuf import text_format
-from src.state_function import GenerateCartesianStateFn
-from src.state_function import GenerateDeltaStateFn
-from src.state_function import GeneratePolarStateFn
+from src.async_loop import AssetLoader
+from src.async_loop import AsyncGameLoop
+from src.attribution import CostAttribution
+from src.baked import LoadBakedDir
 from src.state_function import GetGlobals
 from src.entity import Entity
 from src.entity import Spawner
+from src.gc_policy import FrameGcPolicy
+from src.gc_policy import FreezeLoadedUnits
+from src.hot_reload import PatternWatcher
+from src.loader import LoadDefinedUnitsFile
+from src.lod_policy import LodPolicy
+from src.mmap_store import ResolveResource
+from src.render import DrawWorld
+from src.spawn_queue import SpawnQueue
 
 # https://stackoverflow.com/a/77572870
 # from rules_python.python.runfiles import runfiles
@@ -19,6 +28,7 @@ from python.runfiles import Runfiles
 GLOBALS_ = GetGlobals()
 
 def TestEntityLoad():
+  from google.protobuf import text_format
   resource = "__main__/src/my_first_entity.textproto"
   r = Runfiles.Create()
 
@@ -32,21 +42,7 @@ def TestEntityLoad():
 
 def LoadDefinedUnits(resource: str):
   r = Runfiles.Create()
-  with open(r.Rlocation(resource), 'r') as f:
-    defined = text_format.Parse(f.read(), spawner_pb2.DefinedUnits())
-
-    for cartesian_pb in defined.cartesian_function:
-      GenerateCartesianStateFn(cartesian_pb, True)
-    for polar_pb in defined.polar_function:
-      GeneratePolarStateFn(polar_pb, True)
-    for delta_pb in defined.delta_function:
-      GenerateDeltaStateFn(delta_pb, True)
-
-    for entity_pb in defined.entity:
-      Entity.Save(entity_pb)
-
-    for spawner_pb in defined.spawner:
-      Spawner.Save(spawner_pb)
+  return LoadDefinedUnitsFile(r.Rlocation(resource))
 
 def LoadSun():
   sun_pb = spawner_pb2.Entity()
@@ -55,12 +51,46 @@ def LoadSun():
 
   Entity.ZA_WARUDO.AddChild(sun)
 
+async def RunAsyncPyGameLoop(
+    watch_path: str = None,
+    attribution: Optional[CostAttribution] = None):
+  """Like StartPyGameLoop, but with simulation, rendering and loading as separate tasks."""
+  # Only imported when rendering, it takes longer to import than everything else.
+  import pygame
+  pygame.init()
+  screen = pygame.display.set_mode((1280, 720))
+  r = Runfiles.Create()
+  assets = AssetLoader(lambda path: pygame.image.load(r.Rlocation(f'__main__/src/{path}')))
+  gc_policy = FrameGcPolicy()
+
+  def Render():
+    for event in pygame.event.get():
+      if event.type == pygame.QUIT:
+        game_loop.Stop()
+    DrawWorld(screen, assets)
+    pygame.display.flip()
+
+  def Step(dt: float):
+    Entity.ZA_WARUDO.Update(GLOBALS_, dt)
+    if attribution:
+      attribution.OnFrame()
+
+  game_loop = AsyncGameLoop(Step, Render, gc_policy=gc_policy)
+  if watch_path:
+    game_loop.AddPeriodic(PatternWatcher(watch_path).Poll, 0.5)
+  with gc_policy:
+    await game_loop.Run()
+  pygame.quit()
+
 def StartPyGameLoop():
+  import pygame
   pygame.init()
   screen = pygame.display.set_mode((1280, 720))
   clock = pygame.time.Clock()
   running = True
   current_time = time.time()
+  gc_policy = FrameGcPolicy()
+  gc_policy.Start()
 
   while running:
       # poll for events
@@ -74,33 +104,52 @@ def StartPyGameLoop():
       current_time = next_time
       Entity.ZA_WARUDO.Update(GLOBALS_, dt)
 
-      # fill the screen with a color to wipe away anything from last frame
-      screen.fill("black")
-
-      # RENDER YOUR GAME HERE
-      to_render = Queue()
-      for child in Entity.ZA_WARUDO.children_:
-        to_render.put(child)
-
-      while not to_render.empty():
-        entity_to_draw = to_render.get()
-        pos = entity_to_draw.AbsolutePosition()
-        pygame.draw.circle(screen, "red", (pos.x, pos.y), 5)
-        for child in entity_to_draw.children_:
-          to_render.put(child)
+      DrawWorld(screen)
 
       # flip() the display to put your work on screen
       pygame.display.flip()
 
+      # Collect garbage with whatever is left of this frame's budget.
+      gc_policy.OnFrameEnd(1 / 60 - (time.time() - current_time))
       clock.tick(60)  # limits FPS to 60
 
+  gc_policy.Stop()
   pygame.quit()
 
 def Main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument(
+    '--watch', action='store_true',
+    help='Reload the pattern file into the running game whenever it changes.')
+  parser.add_argument(
+    '--baked', default='',
+    help='Directory (or runfiles path) of trajectories written by bake.py to replay.')
+  parser.add_argument(
+    '--attribution', default='',
+    help='Write the cost of every template and spawner to this path on exit, '
+    'as CSV if it ends with .csv and as folded stacks for flame graphs otherwise.')
+  args = parser.parse_args()
+
   resource = "__main__/src/simple_solar_system.textproto"
   LoadDefinedUnits(resource)
+  Entity.CreateWorld()
+  Spawner.QUEUE_ = SpawnQueue()
+  LodPolicy.VIEW_ = (0, 0, 1280, 720)
+  if args.baked:
+    LoadBakedDir(ResolveResource(args.baked))
   LoadSun()
-  StartPyGameLoop()
+  # Loaded units live for the whole game, so stop the GC from rescanning them.
+  FreezeLoadedUnits()
+  watch_path = Runfiles.Create().Rlocation(resource) if args.watch else None
+  attribution = CostAttribution() if args.attribution else None
+  if attribution:
+    attribution.Start()
+  try:
+    asyncio.run(RunAsyncPyGameLoop(watch_path, attribution))
+  finally:
+    if attribution:
+      attribution.Stop()
+      attribution.Write(args.attribution)
 
 
 if __name__ == '__main__':
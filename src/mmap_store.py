@@ -0,0 +1,129 @@
+"""A file of named arrays that is opened with numpy.memmap instead of read.
+
+Layout:
+  MAGIC (4 bytes) | version (uint32) | header length (uint32) | JSON header
+  followed by each array, every one starting at a multiple of ALIGNMENT.
+
+The JSON header holds free form metadata and the dtype, shape and offset of
+each array. Arrays are little endian float32 or int32. Opening a store only
+reads the header, the arrays are views onto the mapped file so the OS pages
+them in on demand and every process mapping the same file shares the pages.
+"""
+import json
+import os
+import struct
+from typing import Any
+from typing import Optional
+
+import numpy as np
+
+MAGIC = b'PGMS'
+VERSION = 1
+ALIGNMENT = 64
+STORE_EXTENSION = '.pgms'
+
+_PREFIX = struct.Struct('<4sII')
+_DTYPES = {
+  'float32': np.dtype('<f4'),
+  'int32': np.dtype('<i4'),
+}
+
+def _Align(offset: int) -> int:
+  return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+def _StoreDtype(array: np.ndarray) -> str:
+  if np.issubdtype(array.dtype, np.integer):
+    return 'int32'
+  return 'float32'
+
+def WriteStore(
+    path: str,
+    arrays: dict[str, np.ndarray],
+    metadata: Optional[dict[str, Any]] = None):
+  """Writes arrays to path, converting them to float32 or int32.
+
+  The file is written next to path and renamed over it, so processes that
+  already mapped an older version keep reading consistent data.
+  """
+  entries = {}
+  converted = {}
+  for name, array in arrays.items():
+    dtype = _StoreDtype(array)
+    converted[name] = np.ascontiguousarray(array, dtype=_DTYPES[dtype])
+    entries[name] = {'dtype': dtype, 'shape': list(array.shape)}
+
+  # Offsets depend on the header length, which depends on the offsets, so
+  # lay out the data until the header fits in front of it.
+  header: dict[str, Any] = {'metadata': metadata or {}, 'arrays': entries}
+  data_start = 0
+  while True:
+    offset = data_start
+    for name, array in converted.items():
+      entries[name]['offset'] = offset
+      offset = _Align(offset + array.nbytes)
+    header_bytes = json.dumps(header).encode()
+    if _PREFIX.size + len(header_bytes) <= data_start:
+      break
+    data_start = _Align(_PREFIX.size + len(header_bytes))
+
+  tmp_path = path + '.tmp'
+  with open(tmp_path, 'wb') as f:
+    f.write(_PREFIX.pack(MAGIC, VERSION, len(header_bytes)))
+    f.write(header_bytes)
+    for name, array in converted.items():
+      f.seek(entries[name]['offset'])
+      f.write(array.tobytes())
+    f.truncate(max(offset, data_start))
+  os.replace(tmp_path, path)
+
+class MappedStore():
+  """Read only view of a file written by WriteStore.
+
+  Arrays returned by Array are zero copy views of the mapping and stay valid
+  for as long as they are referenced, even after the store is dropped.
+  """
+  def __init__(self, path: str):
+    self.path = path
+    with open(path, 'rb') as f:
+      magic, version, header_length = _PREFIX.unpack(f.read(_PREFIX.size))
+      if magic != MAGIC:
+        raise ValueError(f'"{path}" is not a pattern store')
+      if version != VERSION:
+        raise ValueError(f'"{path}" has unsupported store version {version}')
+      header = json.loads(f.read(header_length))
+    self.metadata: dict[str, Any] = header['metadata']
+    self.entries_: dict[str, dict[str, Any]] = header['arrays']
+    self.mapping_ = np.memmap(path, dtype=np.uint8, mode='r') if self.entries_ else None
+    self.arrays_: dict[str, np.ndarray] = {}
+
+  def Names(self) -> list[str]:
+    return list(self.entries_)
+
+  def Array(self, name: str) -> np.ndarray:
+    array = self.arrays_.get(name)
+    if array is None:
+      entry = self.entries_[name]
+      dtype = _DTYPES[entry['dtype']]
+      shape = tuple(entry['shape'])
+      count = int(np.prod(shape, dtype=np.int64))
+      start = entry['offset']
+      array = self.arrays_[name] = (
+        self.mapping_[start:start + count * dtype.itemsize].view(dtype).reshape(shape))
+    return array
+
+def ResolveResource(path: str) -> str:
+  """Finds path on disk, falling back to the Bazel runfiles of the binary.
+
+  This lets stores be listed as data dependencies and referred to the same
+  way as the textprotos in main.py, e.g. "__main__/src/baked/sun.pgms".
+  """
+  if os.path.exists(path):
+    return path
+  from python.runfiles import Runfiles
+  location = Runfiles.Create().Rlocation(path)
+  if not location or not os.path.exists(location):
+    raise FileNotFoundError(path)
+  return location
+
+def OpenStore(path: str) -> MappedStore:
+  return MappedStore(ResolveResource(path))
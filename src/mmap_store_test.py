@@ -0,0 +1,52 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from src import mmap_store
+
+class TestMappedStore(unittest.TestCase):
+  def setUp(self):
+    self.tmp = tempfile.TemporaryDirectory()
+    self.path = os.path.join(self.tmp.name, 'test' + mmap_store.STORE_EXTENSION)
+
+  def tearDown(self):
+    self.tmp.cleanup()
+
+  def testWriteStore_roundTripsArraysAndMetadata(self):
+    positions = np.arange(24, dtype=np.float64).reshape(2, 4, 3)
+    lengths = np.array([4, 3])
+    mmap_store.WriteStore(
+      self.path, {'positions': positions, 'lengths': lengths}, {'dt': 0.5})
+
+    store = mmap_store.OpenStore(self.path)
+
+    self.assertEqual(store.metadata, {'dt': 0.5})
+    self.assertEqual(store.Names(), ['positions', 'lengths'])
+    self.assertEqual(store.Array('positions').dtype, np.float32)
+    self.assertEqual(store.Array('lengths').dtype, np.int32)
+    np.testing.assert_array_equal(store.Array('positions'), positions)
+    np.testing.assert_array_equal(store.Array('lengths'), lengths)
+
+  def testArray_isAlignedReadOnlyViewOfTheFile(self):
+    mmap_store.WriteStore(self.path, {'a': np.ones(3), 'b': np.zeros((5, 7))})
+
+    store = mmap_store.OpenStore(self.path)
+
+    for name in store.Names():
+      array = store.Array(name)
+      self.assertIsInstance(array.base, np.memmap)
+      self.assertEqual(array.ctypes.data % mmap_store.ALIGNMENT, 0)
+      self.assertFalse(array.flags.writeable)
+    self.assertIs(store.Array('a'), store.Array('a'))
+
+  def testOpenStore_notAStore_raises(self):
+    with open(self.path, 'wb') as f:
+      f.write(b'\0' * 64)
+
+    with self.assertRaises(ValueError):
+      mmap_store.OpenStore(self.path)
+
+if __name__ == '__main__':
+  unittest.main()
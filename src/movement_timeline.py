@@ -0,0 +1,57 @@
+from bisect import bisect_left
+from math import ceil
+from math import inf
+from typing import Optional
+
+class MovementTimeline():
+  """Cumulative lifetimes of a Movement's state_fns, for locating a time by bisect.
+
+  Times are measured from the start of the first state_fn in the current
+  loop. A lifetime that is 0 or negative lasts forever, so nothing after it
+  is ever reached and such movements never loop.
+
+  Timelines only depend on the lifetimes and loop, so they are shared between
+  every Movement created from the same template through Get.
+  """
+  CACHE_: dict[tuple[tuple[float, ...], bool], 'MovementTimeline'] = {}
+
+  @classmethod
+  def Get(cls, lifetimes: list[float], loop: bool) -> 'MovementTimeline':
+    key = (tuple(lifetimes), bool(loop))
+    timeline = cls.CACHE_.get(key)
+    if timeline is None:
+      timeline = cls.CACHE_[key] = MovementTimeline(lifetimes, loop)
+    return timeline
+
+  def __init__(self, lifetimes: list[float], loop: bool):
+    self.starts: list[float] = []
+    self.ends: list[float] = []
+    total = 0
+    for lifetime in lifetimes:
+      self.starts.append(total)
+      if lifetime <= 0:
+        self.ends.append(inf)
+        break
+      total += lifetime
+      self.ends.append(total)
+    # Length of one loop through every reachable state_fn.
+    self.total = total
+    self.loop = bool(loop) and self.ends[-1] != inf
+
+  def Locate(self, t: float) -> Optional[tuple[int, int, float]]:
+    """Finds which state_fn is used at time t.
+
+    A time exactly at the end of a state_fn's lifetime still belongs to it.
+
+    Returns:
+      (full loops completed, state_fn index, time within that state_fn),
+      or None if t is past the end of a movement that doesn't loop.
+    """
+    loops = 0
+    if self.loop and t > self.total:
+      loops = ceil(t / self.total) - 1
+      t -= loops * self.total
+    idx = bisect_left(self.ends, t)
+    if idx >= len(self.ends):
+      return None
+    return loops, idx, t - self.starts[idx]
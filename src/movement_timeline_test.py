@@ -0,0 +1,34 @@
+import unittest
+
+from src import movement_timeline
+
+class TestMovementTimeline(unittest.TestCase):
+  def testLocate_withinLifetimes_findsStateFnAndLocalTime(self):
+    timeline = movement_timeline.MovementTimeline([1, 2, 3], False)
+
+    self.assertEqual(timeline.Locate(0.5), (0, 0, 0.5))
+    self.assertEqual(timeline.Locate(1), (0, 0, 1))
+    self.assertEqual(timeline.Locate(2.5), (0, 1, 1.5))
+    self.assertEqual(timeline.Locate(6), (0, 2, 3))
+    self.assertIsNone(timeline.Locate(6.5))
+
+  def testLocate_loop_countsFullLoops(self):
+    timeline = movement_timeline.MovementTimeline([1, 2], True)
+
+    self.assertEqual(timeline.Locate(3), (0, 1, 2))
+    self.assertEqual(timeline.Locate(10.5), (3, 1, 0.5))
+
+  def testLocate_indefiniteLifetime_neverEndsOrLoops(self):
+    timeline = movement_timeline.MovementTimeline([1, 0, 5], True)
+
+    self.assertFalse(timeline.loop)
+    self.assertEqual(timeline.Locate(100), (0, 1, 99))
+
+  def testGet_sameLifetimes_sharesTimeline(self):
+    first = movement_timeline.MovementTimeline.Get([1.0, 2.0], False)
+
+    self.assertIs(movement_timeline.MovementTimeline.Get([1.0, 2.0], False), first)
+    self.assertIsNot(movement_timeline.MovementTimeline.Get([1.0, 2.0], True), first)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,203 @@
+"""Renders patterns to video frames offline, faster than real time.
+
+The simulation runs headless at a fixed step on the calling thread and hands
+each frame's DrawList to a renderer thread through a bounded queue. When
+rendering falls behind, the simulation blocks instead of buffering frames,
+so memory stays bounded by queue_size frames. Frames are drawn with the same
+render.DrawFrame as the game loops in main.py, onto a pygame Surface that
+needs no display.
+
+Output is either raw RGB frames, e.g. for
+  bazel run //src:offline_render -- --units=... --entity=sun --output=- | \\
+    ffmpeg -f rawvideo -pix_fmt rgb24 -s 1280x720 -r 60 -i - out.mp4
+or PNGs, concatenated when writing to a file or stdout (for ffmpeg's
+image2pipe) and numbered frame_000000.png, ... when --output is a directory.
+"""
+import argparse
+import io
+import os
+import queue
+import sys
+import threading
+from typing import BinaryIO
+from typing import Callable
+from typing import Optional
+
+from src.entity import Entity
+from src.loader import LoadDefinedUnitsFile
+from src.render import CollectDrawList
+from src.render import DrawFrame
+from src.render import DrawList
+from src.state_function import GetGlobals
+
+GLOBALS_ = GetGlobals()
+FORMATS = ('rgb', 'png')
+
+class FramePipeline():
+  """Renders and writes frames on a worker thread, at most queue_size behind.
+
+  Args:
+    render_fn: Encodes a DrawList, called on the worker thread.
+    write_fn: Writes (frame index, encoded frame), called on the worker thread
+      in frame order.
+  """
+  def __init__(self,
+      render_fn: Callable[[DrawList], bytes],
+      write_fn: Callable[[int, bytes], None],
+      queue_size: int = 8):
+    self.render_fn_ = render_fn
+    self.write_fn_ = write_fn
+    self.queue_: queue.Queue = queue.Queue(maxsize=max(1, queue_size))
+    self.error_: Optional[BaseException] = None
+    self.frames = 0
+    self.worker_ = threading.Thread(
+      target=self.Work_, name='offline_render', daemon=True)
+    self.worker_.start()
+
+  def Work_(self):
+    while True:
+      item = self.queue_.get()
+      if item is None:
+        return
+      if self.error_ is not None:
+        # Keep draining so Submit never blocks on a dead worker.
+        continue
+      index, draw_list = item
+      try:
+        self.write_fn_(index, self.render_fn_(draw_list))
+      except BaseException as e:
+        self.error_ = e
+
+  def Submit(self, draw_list: DrawList):
+    """Queues a frame, blocking while queue_size frames are already waiting.
+
+    Raises:
+      The first error raised while rendering or writing an earlier frame.
+    """
+    if self.error_ is not None:
+      raise self.error_
+    self.queue_.put((self.frames, draw_list))
+    self.frames += 1
+
+  def Close(self):
+    """Waits for every submitted frame to be written."""
+    if self.worker_.is_alive():
+      self.queue_.put(None)
+      self.worker_.join()
+    if self.error_ is not None:
+      raise self.error_
+
+  def __enter__(self) -> 'FramePipeline':
+    return self
+
+  def __exit__(self, *args):
+    self.Close()
+
+class SurfaceEncoder():
+  """Draws DrawLists onto an offscreen pygame Surface and encodes them."""
+  def __init__(self,
+      size: tuple[int, int],
+      image_format: str = 'rgb',
+      load_image: Optional[Callable[[str], object]] = None):
+    # Nothing is shown, but pygame still wants a video driver for images.
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    import pygame
+    self.pygame_ = pygame
+    pygame.init()
+    self.surface_ = pygame.Surface(size)
+    self.image_format = image_format
+    self.load_image_ = load_image
+    self.images_: dict[str, object] = {}
+
+  def Get(self, path: str) -> Optional[object]:
+    """Same as AssetLoader.Get, but loads synchronously on the render thread."""
+    if not path or not self.load_image_:
+      return None
+    if path not in self.images_:
+      try:
+        self.images_[path] = self.load_image_(path)
+      except Exception:
+        self.images_[path] = None
+    return self.images_[path]
+
+  def Encode(self, draw_list: DrawList) -> bytes:
+    DrawFrame(self.surface_, draw_list, self)
+    if self.image_format == 'png':
+      buffer = io.BytesIO()
+      self.pygame_.image.save(self.surface_, buffer, 'frame.png')
+      return buffer.getvalue()
+    return self.pygame_.image.tobytes(self.surface_, 'RGB')
+
+def StreamWriter(stream: BinaryIO) -> Callable[[int, bytes], None]:
+  return lambda index, frame: stream.write(frame)
+
+def DirectoryWriter(directory: str, extension: str) -> Callable[[int, bytes], None]:
+  os.makedirs(directory, exist_ok=True)
+  def Write(index: int, frame: bytes):
+    with open(os.path.join(directory, f'frame_{index:06d}.{extension}'), 'wb') as f:
+      f.write(frame)
+  return Write
+
+def RenderFrames(
+    pipeline: FramePipeline,
+    frames: int,
+    fps: float = 60,
+    world: Optional[Entity] = None):
+  """Simulates frames steps of 1 / fps and submits every frame to pipeline."""
+  world = world or Entity.World()
+  dt = 1 / fps
+  for _ in range(frames):
+    world.Update(GLOBALS_, dt)
+    pipeline.Submit(CollectDrawList(world))
+
+def Main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--units', required=True, help='DefinedUnits textproto.')
+  parser.add_argument(
+    '--entity', action='append', required=True,
+    help='Ids of the entities to add to the world.')
+  parser.add_argument('--seconds', type=float, default=10)
+  parser.add_argument('--fps', type=float, default=60)
+  parser.add_argument('--width', type=int, default=1280)
+  parser.add_argument('--height', type=int, default=720)
+  parser.add_argument('--format', choices=FORMATS, default='rgb')
+  parser.add_argument(
+    '--output', default='-',
+    help='File, directory for numbered frames, or "-" for stdout.')
+  parser.add_argument(
+    '--images', default='',
+    help='Directory Entity.image paths are relative to, blank circles if unset.')
+  parser.add_argument(
+    '--queue_size', type=int, default=8,
+    help='Most frames simulated ahead of the renderer.')
+  args = parser.parse_args()
+
+  LoadDefinedUnitsFile(args.units)
+  world = Entity.CreateWorld()
+  for entity_id in args.entity:
+    entity_pb = Entity.SAVED_[entity_id]
+    world.AddChild(Entity(entity_pb))
+
+  load_image = None
+  if args.images:
+    import pygame
+    load_image = lambda path: pygame.image.load(os.path.join(args.images, path))
+  encoder = SurfaceEncoder((args.width, args.height), args.format, load_image)
+
+  output = None
+  if args.output == '-':
+    write_fn = StreamWriter(sys.stdout.buffer)
+  elif os.path.isdir(args.output):
+    write_fn = DirectoryWriter(args.output, args.format)
+  else:
+    output = open(args.output, 'wb')
+    write_fn = StreamWriter(output)
+  try:
+    with FramePipeline(encoder.Encode, write_fn, args.queue_size) as pipeline:
+      RenderFrames(pipeline, round(args.seconds * args.fps), args.fps, world)
+  finally:
+    if output:
+      output.close()
+
+if __name__ == '__main__':
+  Main()
@@ -0,0 +1,53 @@
+import threading
+import unittest
+
+from src import offline_render
+
+class TestFramePipeline(unittest.TestCase):
+  def test_writesEveryFrameInOrder(self):
+    written = []
+    with offline_render.FramePipeline(
+        lambda draw_list: bytes([len(draw_list)]),
+        lambda index, frame: written.append((index, frame)),
+        queue_size=2) as pipeline:
+      for i in range(10):
+        pipeline.Submit([(0, 0, '')] * i)
+
+    self.assertEqual(written, [(i, bytes([i])) for i in range(10)])
+
+  def test_slowRenderer_blocksSubmit(self):
+    release = threading.Event()
+    def Render(draw_list):
+      release.wait()
+      return b''
+    pipeline = offline_render.FramePipeline(Render, lambda index, frame: None, queue_size=2)
+    submitted = []
+    def Produce():
+      for i in range(10):
+        pipeline.Submit([])
+        submitted.append(i)
+    producer = threading.Thread(target=Produce)
+    producer.start()
+
+    producer.join(timeout=0.2)
+    # One frame being rendered plus queue_size waiting.
+    self.assertTrue(producer.is_alive())
+    self.assertLessEqual(len(submitted), 3)
+    release.set()
+    producer.join()
+    pipeline.Close()
+    self.assertEqual(len(submitted), 10)
+
+  def test_renderError_raisedToProducer(self):
+    def Render(draw_list):
+      raise ValueError('bad frame')
+    pipeline = offline_render.FramePipeline(Render, lambda index, frame: None)
+    pipeline.Submit([])
+
+    with self.assertRaises(ValueError):
+      for _ in range(100):
+        pipeline.Submit([])
+      pipeline.Close()
+
+if __name__ == '__main__':
+  unittest.main()
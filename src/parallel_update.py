@@ -0,0 +1,183 @@
+"""Updates independent subtrees of the world on a thread pool.
+
+Entity.Update walks the tree strictly sequentially. Subtrees don't read
+each other's state, so on free-threaded CPython (3.13t and later) the
+children of an entity can be updated concurrently. Under the GIL threads
+only add overhead, so ParallelUpdater falls back to Entity.Update unless
+forced.
+
+An entity with at least split_threshold children is "split": its spawners
+and position are updated on the calling thread and its children are
+partitioned into chunks that are updated on the pool, recursively splitting
+children that are large enough themselves. Spawners only add children to
+their owner, which is in the same work item, or to the world. Children added
+to the world are buffered per work item and merged at the barrier in
+partition order, so AddChild never races and the result doesn't depend on
+thread timing. Shared counters such as Spawner.live_count are buffered the
+same way in a PendingCounts per work item and applied once the update is
+done, see PendingCounts.
+
+The SpawnQueue only runs as part of the world's spawners, on the calling
+thread, and the TargetIndex is built there before any work is dispatched.
+"""
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+import sys
+import threading
+from typing import Optional
+from typing import Union
+
+from src.entity import Entity
+from src.entity import PendingCounts
+from src.state_function import EXPRESSION_CACHE
+
+def IsFreeThreaded() -> bool:
+  """Whether the GIL is disabled in this interpreter."""
+  is_gil_enabled = getattr(sys, '_is_gil_enabled', None)
+  return is_gil_enabled is not None and not is_gil_enabled()
+
+class ParallelUpdater():
+  def __init__(self,
+      threads: int,
+      chunk_size: int = 256,
+      split_threshold: int = 512,
+      force: bool = False):
+    """
+    Args:
+      threads: Worker threads to use. 1 or less always updates serially.
+      chunk_size: Most children to update in a single work item.
+      split_threshold: Fewest children for an entity to be split.
+      force: Use threads even when the GIL is enabled, e.g. for testing.
+    """
+    self.threads = threads
+    self.chunk_size = max(1, chunk_size)
+    self.split_threshold = max(1, split_threshold)
+    self.executor_: Optional[ThreadPoolExecutor] = None
+    if threads > 1 and (force or IsFreeThreaded()):
+      self.executor_ = ThreadPoolExecutor(
+        max_workers=threads, thread_name_prefix='entity_update')
+    self.local_ = threading.local()
+    # Counts of the work items finished this frame, in partition order.
+    self.pending_: list[PendingCounts] = []
+
+  def IsParallel(self) -> bool:
+    return self.executor_ is not None
+
+  def Shutdown(self):
+    if self.executor_:
+      self.executor_.shutdown()
+      self.executor_ = None
+
+  def __enter__(self) -> 'ParallelUpdater':
+    return self
+
+  def __exit__(self, *args):
+    self.Shutdown()
+
+  def Update(self, global_vals: dict[str, float], dt: float, world: Optional[Entity] = None):
+    """Same as world.Update(global_vals, dt), world defaulting to ZA_WARUDO."""
+    world = world or Entity.World()
+    if not self.executor_ or world is not Entity.ZA_WARUDO:
+      world.Update(global_vals, dt)
+      return
+    EXPRESSION_CACHE.NextFrame()
+    # Walking the world for targets while it's being updated isn't safe.
+    Entity.TARGETS_.Build(world)
+    Entity.WORLD_ADDS_ = self.local_
+    EXPRESSION_CACHE.deferring = True
+    pending = self.pending_ = [PendingCounts()]
+    try:
+      with pending[0]:
+        self.UpdateSplit_(world, global_vals, dt)
+    finally:
+      Entity.WORLD_ADDS_ = None
+      EXPRESSION_CACHE.deferring = False
+      self.pending_ = []
+      for counts in pending:
+        counts.Apply()
+
+  def ShouldSplit_(self, entity: Entity) -> bool:
+    # Entities with an UpdatePolicy decide when their children update.
+    return entity.lod_ is None and len(entity.children_) >= self.split_threshold
+
+  def UpdateChunk_(
+      self,
+      children: list[Entity],
+      global_vals: dict[str, float],
+      dt: float) -> tuple[list[Entity], list[Entity], PendingCounts]:
+    """Entity.UpdateChildren_ for part of the children.
+
+    Returns:
+      The children that are still alive, the children added to the world, and
+      the changes to shared counters.
+    """
+    added = self.local_.children = []
+    alive = []
+    try:
+      with PendingCounts() as counts:
+        for child in children:
+          if not child.movement.is_active:
+            Entity.Release(child)
+            continue
+          if child.leaf_ and not child.children_:
+            child.UpdatePosition_(global_vals, dt)
+          else:
+            child.Update(global_vals, dt)
+          alive.append(child)
+    finally:
+      self.local_.children = None
+    return alive, added, counts
+
+  def UpdateSplit_(
+      self,
+      entity: Entity,
+      global_vals: dict[str, float],
+      dt: float) -> list[Entity]:
+    """Entity.Update with the children updated in parallel.
+
+    Returns:
+      The children added to the world while updating, unless entity is the world.
+    """
+    added = self.local_.children = []
+    try:
+      entity.UpdateSpawners_(global_vals, dt)
+    finally:
+      self.local_.children = None
+
+    work: list[Union[Future, Entity]] = []
+    chunk: list[Entity] = []
+    for child in entity.children_:
+      if child.movement.is_active and self.ShouldSplit_(child):
+        if chunk:
+          work.append(self.executor_.submit(self.UpdateChunk_, chunk, global_vals, dt))
+          chunk = []
+        work.append(child)
+        continue
+      chunk.append(child)
+      if len(chunk) >= self.chunk_size:
+        work.append(self.executor_.submit(self.UpdateChunk_, chunk, global_vals, dt))
+        chunk = []
+    if chunk:
+      work.append(self.executor_.submit(self.UpdateChunk_, chunk, global_vals, dt))
+
+    alive = []
+    for item in work:
+      if isinstance(item, Entity):
+        # Split children are handled here while the submitted chunks run.
+        added.extend(self.UpdateSplit_(item, global_vals, dt))
+        alive.append(item)
+      else:
+        chunk_alive, chunk_added, counts = item.result()
+        alive.extend(chunk_alive)
+        added.extend(chunk_added)
+        self.pending_.append(counts)
+
+    if entity is Entity.ZA_WARUDO:
+      # Children added this frame are updated this frame, like in UpdateChildren_.
+      while added:
+        new_alive, added, counts = self.UpdateChunk_(added, global_vals, dt)
+        alive.extend(new_alive)
+        self.pending_.append(counts)
+    entity.children_[:] = alive
+    entity.UpdatePosition_(global_vals, dt)
+    return added
@@ -0,0 +1,128 @@
+import unittest
+from unittest import mock
+
+from google.protobuf import text_format
+from proto import spawner_pb2
+from src import entity
+from src import parallel_update
+from src.state_function import EXPRESSION_CACHE
+from src.state_function import PositionState
+
+# Rings that follow their emitter, and stray bullets that are added to the world.
+EMITTER_PB_TXT = """
+  movement {
+    state_fn { polar { r: '50' theta: 't + idx' angle: 't' } }
+    lifetime: 0
+  }
+  spawner {
+    spawn_entity {
+      movement {
+        state_fn { polar { r: '40 * t' theta: 'tau * idx / 8' angle: 'idx' } }
+        lifetime: 0.5
+      }
+    }
+    spawn_count: 8
+    spawn_time_fn: 'idx / 40'
+    period: 0.25
+    follow_center: true
+    follow_angle: true
+  }
+  spawner {
+    spawn_entity {
+      movement {
+        state_fn { cartesian { x: '30 * t' y: 'idx' } }
+        lifetime: 0.3
+      }
+    }
+    spawn_count: 2
+    spawn_time_fn: 'idx / 10'
+    period: 0.2
+  }
+"""
+
+# Rings of up to 16 live bullets, capped to 12, spinning by a cached term of t.
+CAPPED_EMITTER_PB_TXT = EMITTER_PB_TXT.replace(
+  'follow_angle: true', 'follow_angle: true max_live: 12').replace(
+  "angle: 'idx'", "angle: 'idx + sin(t) * cos(t)'")
+
+class TestParallelUpdater(unittest.TestCase):
+  def setUp(self):
+    entity.Entity.CreateWorld()
+
+  def tearDown(self):
+    entity.Entity.ZA_WARUDO.children_.clear()
+
+  def RunWorld(
+      self,
+      updater: parallel_update.ParallelUpdater,
+      emitter_pb_txt: str = EMITTER_PB_TXT) -> list[PositionState]:
+    entity.Entity.ZA_WARUDO.children_.clear()
+    emitter_pb = text_format.Parse(emitter_pb_txt, spawner_pb2.Entity())
+    for i in range(12):
+      entity.Entity.ZA_WARUDO.AddChild(entity.Entity(emitter_pb, idx=i))
+    for _ in range(30):
+      updater.Update({}, 1 / 30)
+    return [e.AbsolutePosition() for e in entity.Entity.ZA_WARUDO.Walk()]
+
+  def testUpdate_threads_matchesSerialUpdate(self):
+    with parallel_update.ParallelUpdater(1) as serial:
+      expected = self.RunWorld(serial)
+    with parallel_update.ParallelUpdater(
+        4, chunk_size=2, split_threshold=5, force=True) as parallel:
+      self.assertTrue(parallel.IsParallel())
+      actual = self.RunWorld(parallel)
+
+    self.assertGreater(len(expected), 100)
+    key = lambda p: (round(p.x, 6), round(p.y, 6), round(p.angle, 6))
+    self.assertEqual(sorted(map(key, actual)), sorted(map(key, expected)))
+    self.assertIsNone(entity.Entity.WORLD_ADDS_)
+
+  def testUpdate_threads_isDeterministic(self):
+    runs = []
+    for _ in range(2):
+      with parallel_update.ParallelUpdater(
+          4, chunk_size=3, split_threshold=5, force=True) as parallel:
+        runs.append(self.RunWorld(parallel))
+
+    self.assertEqual(runs[0], runs[1])
+
+  def testUpdate_threads_countsLikeSerialUpdate(self):
+    counts = []
+    for updater in (
+        parallel_update.ParallelUpdater(1),
+        parallel_update.ParallelUpdater(4, chunk_size=2, split_threshold=5, force=True)):
+      lookups = EXPRESSION_CACHE.hits + EXPRESSION_CACHE.misses
+      # Only logged the first time a spawner is capped.
+      with (updater, mock.patch.dict(entity.Spawner.SPAWNED_, clear=True),
+            mock.patch.dict(entity.Spawner.CAPPED_, clear=True),
+            self.assertLogs(level='WARNING') as logs):
+        self.RunWorld(updater, CAPPED_EMITTER_PB_TXT)
+        self.assertEqual(updater.pending_, [])
+        counts.append({
+          'live': [
+            spawner.live_count for emitter in entity.Entity.ZA_WARUDO.children_
+            for spawner in emitter.spawners],
+          'spawned': dict(entity.Spawner.SPAWNED_),
+          'capped': dict(entity.Spawner.CAPPED_),
+          'logs': len(logs.output),
+          'lookups': EXPRESSION_CACHE.hits + EXPRESSION_CACHE.misses - lookups,
+        })
+
+    self.assertEqual(list(counts[0]['capped']), ['<anonymous>'])
+    self.assertGreater(counts[0]['lookups'], 0)
+    self.assertEqual(counts[1], counts[0])
+    self.assertFalse(EXPRESSION_CACHE.deferring)
+    # Every live bullet is counted by the spawner that spawned it.
+    for emitter in entity.Entity.ZA_WARUDO.children_:
+      for spawner in emitter.spawners:
+        live = sum(
+          e.spawned_by_ is spawner for e in entity.Entity.ZA_WARUDO.Walk())
+        self.assertEqual(spawner.live_count, live)
+
+  @unittest.skipIf(parallel_update.IsFreeThreaded(), 'GIL is disabled')
+  def testInit_gilEnabled_fallsBackToSerial(self):
+    with parallel_update.ParallelUpdater(8) as updater:
+      self.assertFalse(updater.IsParallel())
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,92 @@
+from typing import Any
+from typing import Optional
+import threading
+
+class ObjectPool():
+  """Recycles despawned objects keyed by their template id.
+
+  Objects are handed back with Release and reused with Acquire. The pool does
+  not reset objects itself, callers are expected to reset the state of an
+  acquired object before using it.
+
+  This is used to avoid reconstructing Entities (and their Movements and
+  Spawners) for every bullet that is spawned, which keeps the allocator and
+  garbage collector quiet during dense patterns.
+  """
+  def __init__(self, max_per_key: int = 4096, enabled: bool = True):
+    self.max_per_key = max_per_key
+    self.enabled = enabled
+    self.free_: dict[str, list[Any]] = {}
+    self.lock_ = threading.Lock()
+
+    # Stats
+    self.hits = 0
+    self.misses = 0
+    self.releases = 0
+    self.discards = 0
+
+  def Acquire(self, key: str) -> Optional[Any]:
+    """Fetch a recycled object for key, or None if one must be constructed."""
+    if not self.enabled:
+      return None
+    with self.lock_:
+      free = self.free_.get(key)
+      if free:
+        self.hits += 1
+        return free.pop()
+      self.misses += 1
+      return None
+
+  def Release(self, key: str, obj: Any) -> bool:
+    """Hand back an object for later reuse.
+
+    Returns:
+      True if the object was kept, False if it was discarded.
+    """
+    if not self.enabled:
+      return False
+    with self.lock_:
+      free = self.free_.setdefault(key, [])
+      if len(free) >= self.max_per_key:
+        self.discards += 1
+        return False
+      free.append(obj)
+      self.releases += 1
+      return True
+
+  def Discard(self, key: str):
+    """Drop all pooled objects for key, e.g. when its template changes."""
+    with self.lock_:
+      self.free_.pop(key, None)
+
+  def Flush(self):
+    """Drop every pooled object, keeping the stats."""
+    with self.lock_:
+      self.free_.clear()
+
+  def Clear(self):
+    with self.lock_:
+      self.free_.clear()
+      self.hits = 0
+      self.misses = 0
+      self.releases = 0
+      self.discards = 0
+
+  def Size(self, key: Optional[str] = None) -> int:
+    if key is not None:
+      return len(self.free_.get(key, []))
+    return sum(len(free) for free in self.free_.values())
+
+  def HitRate(self) -> float:
+    total = self.hits + self.misses
+    return self.hits / total if total else 0.0
+
+  def Stats(self) -> dict[str, float]:
+    return {
+      'hits': self.hits,
+      'misses': self.misses,
+      'releases': self.releases,
+      'discards': self.discards,
+      'pooled': self.Size(),
+      'hit_rate': self.HitRate(),
+    }
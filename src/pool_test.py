@@ -0,0 +1,40 @@
+import unittest
+
+from src import pool
+
+class TestObjectPool(unittest.TestCase):
+  def testAcquire_emptyPool_missesAndReturnsNone(self):
+    object_pool = pool.ObjectPool()
+
+    self.assertIsNone(object_pool.Acquire('bullet'))
+    self.assertEqual(object_pool.misses, 1)
+    self.assertEqual(object_pool.HitRate(), 0)
+
+  def testAcquire_afterRelease_returnsSameObject(self):
+    object_pool = pool.ObjectPool()
+    obj = object()
+
+    object_pool.Release('bullet', obj)
+
+    self.assertIsNone(object_pool.Acquire('other'))
+    self.assertIs(object_pool.Acquire('bullet'), obj)
+    self.assertAlmostEqual(object_pool.HitRate(), 0.5)
+
+  def testRelease_overMaxPerKey_discards(self):
+    object_pool = pool.ObjectPool(max_per_key=1)
+
+    self.assertTrue(object_pool.Release('bullet', object()))
+    self.assertFalse(object_pool.Release('bullet', object()))
+    self.assertEqual(object_pool.Size('bullet'), 1)
+    self.assertEqual(object_pool.discards, 1)
+
+  def testAcquire_disabled_neverReuses(self):
+    object_pool = pool.ObjectPool(enabled=False)
+
+    object_pool.Release('bullet', object())
+
+    self.assertIsNone(object_pool.Acquire('bullet'))
+    self.assertEqual(object_pool.Size(), 0)
+
+if __name__ == '__main__':
+  unittest.main()
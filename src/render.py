@@ -0,0 +1,53 @@
+"""Draws the world, shared by the game loops in main.py and offline rendering.
+
+Drawing is split into collecting what to draw, which reads the live entity
+tree and has to happen between simulation steps, and drawing the collected
+DrawList, which can happen on another thread while the simulation continues.
+"""
+from collections import deque
+from typing import Any
+from typing import Optional
+from typing import Protocol
+from typing import TYPE_CHECKING
+
+from src.entity import Entity
+from src.transforms import ResolveAbsolutePositions
+
+if TYPE_CHECKING:
+  import pygame
+
+# (x, y, image) of every entity below the root, parents before children.
+DrawList = list[tuple[float, float, str]]
+
+class Assets(Protocol):
+  def Get(self, path: str) -> Optional[Any]:
+    ...
+
+def CollectDrawList(root: Optional[Entity] = None) -> DrawList:
+  """Absolute positions and images of everything below root, defaulting to the world."""
+  root = root or Entity.World()
+  ResolveAbsolutePositions(root)
+  res = []
+  to_render = deque(root.children_)
+  while to_render:
+    entity = to_render.popleft()
+    position = entity.AbsolutePosition()
+    res.append((position.x, position.y, entity.image))
+    to_render.extend(entity.children_)
+  return res
+
+def DrawFrame(screen: 'pygame.Surface', draw_list: DrawList, assets: Optional[Assets] = None):
+  """Draws draw_list, using each image once it is loaded."""
+  import pygame
+  # fill the screen with a color to wipe away anything from last frame
+  screen.fill("black")
+  for x, y, image_path in draw_list:
+    image = assets.Get(image_path) if assets else None
+    if image:
+      screen.blit(image, image.get_rect(center=(x, y)))
+    else:
+      pygame.draw.circle(screen, "red", (x, y), 5)
+
+def DrawWorld(screen: 'pygame.Surface', assets: Optional[Assets] = None):
+  """Draws every entity in the world, using its image once it is loaded."""
+  DrawFrame(screen, CollectDrawList(), assets)
@@ -0,0 +1,34 @@
+import unittest
+
+from proto import spawner_pb2
+from src import entity
+from src import render
+
+class TestCollectDrawList(unittest.TestCase):
+  def setUp(self):
+    self.world = entity.Entity.CreateWorld()
+
+  def MakeEntity(
+      self, x: float, y: float, image: str, parent: entity.Entity = None) -> entity.Entity:
+    entity_pb = spawner_pb2.Entity(image=image)
+    state_fn = entity_pb.movement.state_fn.add()
+    state_fn.cartesian.x = str(x)
+    state_fn.cartesian.y = str(y)
+    entity_pb.movement.lifetime.append(0)
+    return entity.Entity(entity_pb, parent, follow_center=parent is not None)
+
+  def test_parentsBeforeChildren_atAbsolutePositions(self):
+    parent = self.MakeEntity(100, 50, 'parent.png')
+    parent.AddChild(self.MakeEntity(10, 0, 'child.png', parent))
+    self.world.AddChild(parent)
+    self.world.AddChild(self.MakeEntity(5, 5, ''))
+    self.world.Update({}, 1 / 60)
+
+    self.assertEqual(render.CollectDrawList(), [
+      (100, 50, 'parent.png'),
+      (5, 5, ''),
+      (110, 50, 'child.png'),
+    ])
+
+if __name__ == '__main__':
+  unittest.main()
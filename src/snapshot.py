@@ -0,0 +1,372 @@
+"""Saves and restores the state of a running world, e.g. to rewind or fork it.
+
+Layout:
+  MAGIC (4 bytes) | version (uint32) | header length (uint32) | JSON header
+  | ENTITY record of every entity | SPAWNER record of every spawner
+
+The JSON header holds the templates entities are recreated from, the RNG
+state and the time of the SpawnQueue, if any. Entities are stored in depth first order with their number of
+children, and spawners in the order of the entities they belong to. Only
+what changes while simulating is stored, everything else comes from the
+templates, so restoring picks up the current definition of every unit.
+
+Restoring reuses the entities currently in the world with the same template
+and idx, which keeps their bound movements and avoids most of the cost of a
+spawn. Rewinding a pattern reuses nearly every entity, usually the very same
+one since children keep their order, and updates its state in place.
+Restoring into an empty world, e.g. a fresh World forked from a checkpoint,
+constructs them.
+"""
+import base64
+import json
+import random
+import struct
+from typing import Any
+from typing import Optional
+
+from proto import spawner_pb2
+from src import entity as entity_module
+from src.entity import Entity
+from src.entity import Movement
+from src.entity import Spawner
+from src.state_function import PositionState
+
+MAGIC = b'PGSN'
+VERSION = 1
+
+_PREFIX = struct.Struct('<4sII')
+
+# flags
+_FOLLOW_CENTER = 1
+_FOLLOW_ANGLE = 2
+_HAS_PARENT = 4
+_ACTIVE = 8
+# (follow_center, follow_angle, active) for every combination of flags.
+_FLAGS = [
+  (bool(flags & _FOLLOW_CENTER), bool(flags & _FOLLOW_ANGLE), bool(flags & _ACTIVE))
+  for flags in range(16)]
+
+# template, flags, idx, children, spawners,
+# spawned_by (index of the entity owning the spawner that spawned this, -1
+# if none), spawned_by_spawner (index of that spawner),
+# offset x, y, angle, position x, y, angle,
+# movement current_idx, current_time, skipped_dt, skipped_frames
+ENTITY = struct.Struct('<IBqIIiI6dIddI')
+# current_time, current_spawn_pos, period_index, live_count,
+# last_update_time (only used with a SpawnQueue)
+SPAWNER = struct.Struct('<dIqId')
+
+def _Template(entity: Entity) -> dict[str, Any]:
+  """What Restore needs to create entity again."""
+  template: dict[str, Any] = {
+    'template_id': entity.template_id,
+    'pool_key': entity.pool_key_ or '',
+  }
+  if not entity.pb_.id.id:
+    # Inline, so only its spawner knows the proto.
+    template['pb'] = base64.b64encode(entity.pb_.SerializeToString()).decode()
+  if entity.movement.__class__ is not Movement:
+    template['bake_key'] = entity.movement.trajectories_.bake_key
+  return template
+
+def TakeSnapshot(root: Optional[Entity] = None, rng: Optional[random.Random] = None) -> bytes:
+  """Everything below root, defaulting to the world, and the state of rng.
+
+  The root itself is not included.
+  """
+  root = root or Entity.World()
+  entities = []
+  to_visit = list(reversed(root.children_))
+  while to_visit:
+    entity = to_visit.pop()
+    entities.append(entity)
+    if entity.children_:
+      to_visit.extend(reversed(entity.children_))
+  # Spawners may belong to entities visited later.
+  indices = {entity: i for i, entity in enumerate(entities)}
+
+  templates: list[dict[str, Any]] = []
+  template_refs: dict[tuple, int] = {}
+  records = []
+  spawners = []
+  queue = Spawner.QUEUE_
+  pack_entity = ENTITY.pack
+  pack_spawner = SPAWNER.pack
+  for entity in entities:
+    movement = entity.movement
+    # Everything with the same template_id shares its proto, except for
+    # anonymous entities.
+    key = (entity.template_id or id(entity.pb_), entity.pool_key_, movement.__class__)
+    template = template_refs.get(key)
+    if template is None:
+      template = template_refs[key] = len(templates)
+      templates.append(_Template(entity))
+    flags = (
+      (_FOLLOW_CENTER if entity.follow_center else 0) |
+      (_FOLLOW_ANGLE if entity.follow_angle else 0) |
+      (_HAS_PARENT if entity.parent is not None else 0) |
+      (_ACTIVE if movement.is_active else 0))
+    spawned_by = entity.spawned_by_
+    owner = -1
+    if spawned_by is not None and entity.spawned_resets_ == spawned_by.resets_:
+      owner = indices.get(spawned_by.owner_, -1)
+    offset = entity.offset
+    position = entity.position
+    records.append(pack_entity(
+      template, flags, entity.idx, len(entity.children_), len(entity.spawners),
+      owner, spawned_by.index_ if owner >= 0 else 0,
+      offset.x, offset.y, offset.angle,
+      position.x, position.y, position.angle,
+      movement.current_idx, movement.current_time,
+      entity.skipped_dt_, entity.skipped_frames_))
+    for spawner in entity.spawners:
+      spawners.append(pack_spawner(
+        spawner.current_time, spawner.current_spawn_pos,
+        spawner.period_index, spawner.live_count,
+        spawner.last_update_time_))
+
+  header: dict[str, Any] = {
+    'templates': templates,
+    'children': len(root.children_),
+    'entities': len(records),
+    'spawners': len(spawners),
+  }
+  if queue is not None:
+    # Queued spawners only catch up on time when they are due.
+    header['queue_now'] = queue.now
+  if rng is not None:
+    version, state, gauss_next = rng.getstate()
+    header['rng'] = [version, list(state), gauss_next]
+  header_bytes = json.dumps(header).encode()
+  return b''.join((
+    _PREFIX.pack(MAGIC, VERSION, len(header_bytes)),
+    header_bytes,
+    b''.join(records),
+    b''.join(spawners)))
+
+def _ReadHeader(data: bytes) -> tuple[dict[str, Any], int]:
+  magic, version, header_length = _PREFIX.unpack_from(data)
+  if magic != MAGIC:
+    raise ValueError('Not a snapshot')
+  if version != VERSION:
+    raise ValueError(f'Unsupported snapshot version {version}')
+  start = _PREFIX.size + header_length
+  return json.loads(data[_PREFIX.size:start]), start
+
+def _ByKey(entities: list[Entity]) -> dict[tuple[str, int], list[Entity]]:
+  """Pooled entities by pool key and idx, the first one last."""
+  by_key: dict[tuple[str, int], list[Entity]] = {}
+  for entity in reversed(entities):
+    if entity.pool_key_:
+      key = (entity.pool_key_, entity.idx)
+      same = by_key.get(key)
+      if same is None:
+        by_key[key] = [entity]
+      else:
+        same.append(entity)
+  return by_key
+
+def _Release(entities: list[Entity]):
+  """Pools entities that aren't in the snapshot, and everything below them."""
+  to_visit = list(entities)
+  while to_visit:
+    entity = to_visit.pop()
+    if entity.children_:
+      to_visit.extend(entity.children_)
+      entity.children_.clear()
+    for spawner in entity.spawners:
+      spawner.Cancel()
+    if entity.pool_key_:
+      Entity.POOL_.Release(entity.pool_key_, entity)
+
+def _ReleaseUnused(
+    old: list[Entity],
+    reused: int,
+    by_key: Optional[dict[tuple[str, int], list[Entity]]]):
+  """Releases the children of a container that weren't reused."""
+  if reused < len(old):
+    _Release(old[reused:])
+  if by_key:
+    for entities in by_key.values():
+      _Release(entities)
+
+def RestoreSnapshot(
+    data: bytes,
+    root: Optional[Entity] = None,
+    rng: Optional[random.Random] = None):
+  """Replaces everything below root, defaulting to the world, with a snapshot.
+
+  Raises:
+    ValueError: if data isn't a snapshot taken by TakeSnapshot.
+  """
+  header, start = _ReadHeader(data)
+  root = root or Entity.World()
+  if rng is not None and 'rng' in header:
+    version, state, gauss_next = header['rng']
+    rng.setstate((version, tuple(state), gauss_next))
+
+  view = memoryview(data)
+  spawner_start = start + header['entities'] * ENTITY.size
+  spawner_records = list(SPAWNER.iter_unpack(
+    view[spawner_start:spawner_start + header['spawners'] * SPAWNER.size]))
+
+  templates = []
+  for template in header['templates']:
+    entity_pb = spawner_pb2.Entity()
+    if 'pb' in template:
+      entity_pb.ParseFromString(base64.b64decode(template['pb']))
+    else:
+      entity_pb.id.id = template['template_id']
+    baked = Spawner.BAKED_[template['bake_key']] if 'bake_key' in template else None
+    templates.append((entity_pb, template['template_id'], template['pool_key'], baked))
+
+  queue = Spawner.QUEUE_
+  queue_now = header.get('queue_now')
+  if queue is not None and queue_now is not None:
+    # Absolute times rather than times relative to queue.now, which would
+    # round differently and move spawns due right on a frame.
+    queue.now = queue_now
+  restored: list[Entity] = []
+  restore = restored.append
+  restored_count = 0
+  # (entity, index of the entity owning its spawner, index of the spawner)
+  # for spawners of entities restored later.
+  spawned_by = []
+  new_state = PositionState
+  # The entity being filled with children and how many are left, its
+  # children from before restoring, how many of those were reused in order
+  # and the rest by key once that failed, and the same for each of its
+  # ancestors.
+  container = root
+  left = header['children']
+  old = root.children_[:]
+  old_count = len(old)
+  root.children_.clear()
+  reused = 0
+  by_key: Optional[dict[tuple[str, int], list[Entity]]] = None
+  containers = []
+  next_spawner = 0
+  for (template, flags, idx, children, spawner_count, owner, spawner_index,
+      offset_x, offset_y, offset_angle, x, y, angle,
+      movement_idx, movement_time, skipped_dt, skipped_frames
+      ) in ENTITY.iter_unpack(view[start:spawner_start]):
+    while not left:
+      _ReleaseUnused(old, reused, by_key)
+      container, left, old, old_count, reused, by_key = containers.pop()
+    left -= 1
+    parent = container if flags & _HAS_PARENT else None
+    follow_center, follow_angle, active = _FLAGS[flags]
+    entity_pb, template_id, pool_key, baked = templates[template]
+
+    # Children keep their order, except that some despawned and new ones were
+    # appended, so the next child not reused yet is usually the same entity.
+    entity = None
+    if not pool_key:
+      pass
+    elif reused < old_count:
+      entity = old[reused]
+      if entity.idx == idx and entity.pool_key_ == pool_key:
+        reused += 1
+      else:
+        by_key = _ByKey(old[reused:])
+        reused = old_count
+        same = by_key.get((pool_key, idx))
+        entity = same.pop() if same else None
+    elif by_key:
+      same = by_key.get((pool_key, idx))
+      if same:
+        entity = same.pop()
+    if entity is not None:
+      # Same template and idx, so the movement is already bound.
+      if entity.parent is not parent:
+        entity.parent = parent
+      entity.follow_center = follow_center
+      entity.follow_angle = follow_angle
+      entity.generation_ += 1
+    else:
+      entity = Entity.Spawn(
+        entity_pb, template_id, parent, None, idx,
+        follow_center, follow_angle, pool_key or None)
+      if baked is not None and entity.movement.__class__ is Movement:
+        entity.movement = baked.NewMovement(idx)
+
+    offset = entity.offset
+    # Usually unchanged since the entity was spawned.
+    if offset.x != offset_x or offset.y != offset_y or offset.angle != offset_angle:
+      entity.offset = new_state(offset_x, offset_y, offset_angle)
+    movement = entity.movement
+    position = entity.position
+    if position is movement.static_position:
+      entity.position = new_state(x, y, angle)
+    else:
+      # Only ever assigned freshly created positions, so nothing else has it.
+      position.x = x
+      position.y = y
+      position.angle = angle
+    entity.recalc_absolute_ = True
+    entity.skipped_dt_ = skipped_dt
+    entity.skipped_frames_ = skipped_frames
+    movement.current_idx = movement_idx
+    movement.current_time = movement_time
+    movement.is_active = active
+
+    spawners = entity.spawners
+    if spawners:
+      # Stops early if the entity was redefined with fewer spawners since.
+      for spawner, record in zip(
+          spawners,
+          spawner_records[next_spawner:next_spawner + spawner_count]):
+        (spawner.current_time, spawner.current_spawn_pos,
+          spawner.period_index, spawner.live_count, last_update_time) = record
+        spawner.generation_ += 1
+        if queue_now is None:
+          last_update_time = queue.now if queue is not None else 0.0
+        elif queue is None and queue_now > last_update_time:
+          # Nothing was due since, so this only catches up on time.
+          spawner.Update(entity_module.GLOBALS_, queue_now - last_update_time)
+        if queue is not None:
+          spawner.last_update_time_ = last_update_time
+          spawner.ScheduleNext_(queue)
+      for spawner in spawners[spawner_count:]:
+        spawner.Cancel()
+    next_spawner += spawner_count
+
+    if owner < 0:
+      if entity.spawned_by_ is not None:
+        entity.spawned_by_ = None
+    elif owner < restored_count:
+      try:
+        spawner = restored[owner].spawners[spawner_index]
+        entity.spawned_by_ = spawner
+        entity.spawned_resets_ = spawner.resets_
+      except IndexError:
+        entity.spawned_by_ = None
+    else:
+      spawned_by.append((entity, owner, spawner_index))
+    container.children_.append(entity)
+    restore(entity)
+    restored_count += 1
+    if children:
+      containers.append((container, left, old, old_count, reused, by_key))
+      container = entity
+      left = children
+      old = entity.children_[:]
+      old_count = len(old)
+      entity.children_.clear()
+      reused = 0
+      by_key = None
+    elif entity.children_:
+      _Release(entity.children_)
+      entity.children_.clear()
+
+  containers.append((container, left, old, old_count, reused, by_key))
+  for _, _, old, _, reused, by_key in containers:
+    _ReleaseUnused(old, reused, by_key)
+
+  for entity, owner, spawner_index in spawned_by:
+    spawners = restored[owner].spawners
+    if spawner_index < len(spawners):
+      entity.spawned_by_ = spawners[spawner_index]
+      entity.spawned_resets_ = spawners[spawner_index].resets_
+    else:
+      entity.spawned_by_ = None
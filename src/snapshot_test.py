@@ -0,0 +1,147 @@
+import unittest
+
+from src import snapshot
+from src.entity import Entity
+from src.loader import ParseDefinedUnits
+from src.world import Templates
+from src.world import World
+
+UNITS_PB_TXT = """
+  entity {
+    id { id: 'snapshot_bullet' }
+    movement {
+      state_fn { polar { r: '80 * t' theta: 'tau * idx / 12' angle: 't' } }
+      state_fn { delta { dx: '30 * cos(angle)' dy: '30 * sin(angle)' } }
+      lifetime: 0.4
+      lifetime: 0.6
+      loop: false
+    }
+    spawner {
+      spawn_entity {
+        movement {
+          state_fn { cartesian { x: '10 * sin(5 * t)' } }
+          lifetime: 0.3
+        }
+      }
+      spawn_count: 2
+      spawn_time_fn: '0.1 * idx'
+      follow_center: true
+      follow_angle: true
+    }
+  }
+
+  entity {
+    id { id: 'snapshot_emitter' }
+    movement {
+      state_fn { cartesian { x: '320 + 50 * sin(t)' y: '240' } }
+      lifetime: 0
+    }
+    spawner {
+      spawn_entity { id { id: 'snapshot_bullet' } }
+      spawn_count: 12
+      spawn_time_fn: 'idx / 60'
+      period: 0.5
+      max_live: 30
+      offset_fn { cartesian { x: 'r.uniform(-5, 5)' } }
+    }
+  }
+"""
+
+DT = 1 / 60
+
+class TestSnapshot(unittest.TestCase):
+  @classmethod
+  def setUpClass(cls):
+    cls.templates = Templates.Compile(ParseDefinedUnits(UNITS_PB_TXT))
+
+  def Run(self, world: World, frames: int) -> list[list[tuple]]:
+    """Absolute positions and spawner state after each of frames updates."""
+    res = []
+    for _ in range(frames):
+      world.Update(DT)
+      with world:
+        res.append([
+          (entity.template_id, entity.AbsolutePosition().x, entity.AbsolutePosition().y,
+            tuple(spawner.live_count for spawner in entity.spawners))
+          for entity in world.root.Walk() if entity is not world.root])
+    return res
+
+  def NewWorld(self, queued: bool = False) -> World:
+    world = World(self.templates, seed=3, queued=queued)
+    world.Add('snapshot_emitter')
+    return world
+
+  def test_restore_rewindsExactly(self):
+    world = self.NewWorld()
+    self.Run(world, 50)
+    checkpoint = world.Snapshot()
+    expected = self.Run(world, 90)
+
+    world.Restore(checkpoint)
+    self.assertEqual(self.Run(world, 90), expected)
+
+  def test_restore_reusesLiveEntities(self):
+    world = self.NewWorld()
+    self.Run(world, 50)
+    checkpoint = world.Snapshot()
+    with world:
+      before = set(world.root.Walk())
+
+    world.Restore(checkpoint)
+    with world:
+      after = set(world.root.Walk())
+    self.assertGreater(len(before), 20)
+    self.assertEqual(before, after)
+
+  def test_restore_laterFrames_constructsNothing(self):
+    world = self.NewWorld()
+    self.Run(world, 50)
+    checkpoint = world.Snapshot()
+    with world:
+      before = set(world.root.Walk())
+    self.Run(world, 20)
+    with world:
+      current = set(world.root.Walk())
+      misses = Entity.POOL_.misses
+
+    world.Restore(checkpoint)
+    with world:
+      self.assertEqual(Entity.POOL_.misses, misses)
+    self.assertTrue(before - current)
+    self.assertTrue(current - before)
+
+  def test_restore_forksIntoOtherWorlds(self):
+    world = self.NewWorld()
+    self.Run(world, 70)
+    checkpoint = world.Snapshot()
+    expected = self.Run(world, 60)
+
+    for _ in range(3):
+      fork = World(self.templates)
+      fork.Restore(checkpoint)
+      self.assertEqual(self.Run(fork, 60), expected)
+
+  def test_restore_queuedSpawners(self):
+    world = self.NewWorld(queued=True)
+    self.Run(world, 40)
+    checkpoint = world.Snapshot()
+    expected = self.Run(world, 60)
+
+    world.Restore(checkpoint)
+    self.assertEqual(self.Run(world, 60), expected)
+
+  def test_restore_emptyWorld(self):
+    world = self.NewWorld()
+    empty = World(self.templates).Snapshot()
+    self.Run(world, 30)
+
+    world.Restore(empty)
+    with world:
+      self.assertEqual(world.root.children_, [])
+
+  def test_notSnapshot_raises(self):
+    with self.assertRaises(ValueError):
+      snapshot.RestoreSnapshot(b'PGMS' + bytes(8), Entity.CreateWorld())
+
+if __name__ == '__main__':
+  unittest.main()
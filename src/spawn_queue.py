@@ -0,0 +1,72 @@
+import heapq
+from itertools import count
+from typing import Any
+from typing import Callable
+from typing import Optional
+
+class SpawnQueue():
+  """A global priority queue of when each Spawner next needs to spawn.
+
+  Instead of every Spawner polling every frame, only spawners that are due
+  are updated, so the cost is proportional to spawns rather than spawners.
+  Spawners that will never spawn again are not rescheduled and leave the
+  queue entirely.
+
+  Entries are invalidated lazily: each scheduled entry records the spawner's
+  generation, and a Cancel bumps the generation so stale entries are skipped
+  when they are popped. Entries whose spawner is_live rejects when they are
+  due, e.g. because its entity was dropped from the world without being
+  released, are dropped as well.
+  """
+  def __init__(self):
+    # (due time, tie breaker, generation, spawner)
+    self.heap_: list[tuple[float, int, int, Any]] = []
+    self.counter_ = count()
+    # Time elapsed since this queue was created.
+    self.now = 0.0
+
+  def __len__(self) -> int:
+    return len(self.heap_)
+
+  def Schedule(self, spawner: Any, due_time: float):
+    heapq.heappush(
+      self.heap_,
+      (due_time, next(self.counter_), spawner.generation_, spawner))
+
+  def Clear(self):
+    self.heap_.clear()
+
+  def Run(
+      self,
+      global_vals: dict[str, float],
+      dt: float,
+      is_live: Optional[Callable[[Any], bool]] = None) -> int:
+    """Advances by dt and updates every spawner that is due.
+
+    Spawners are rescheduled after the whole batch, so a spawner is updated
+    at most once per call.
+
+    Args:
+      is_live: Whether a due spawner still belongs to what is being updated.
+        Spawners it rejects are dropped from the queue.
+
+    Returns:
+      The number of spawners that were updated.
+    """
+    self.now += dt
+    due = []
+    while self.heap_ and self.heap_[0][0] < self.now:
+      _, _, generation, spawner = heapq.heappop(self.heap_)
+      if generation != spawner.generation_:
+        continue
+      if is_live is not None and not is_live(spawner):
+        spawner.Cancel()
+        continue
+      due.append(spawner)
+
+    for spawner in due:
+      spawner.Update(global_vals, self.now - spawner.last_update_time_)
+      spawner.last_update_time_ = self.now
+    for spawner in due:
+      spawner.ScheduleNext_(self)
+    return len(due)
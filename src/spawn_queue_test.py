@@ -0,0 +1,102 @@
+import unittest
+
+from google.protobuf import text_format
+from proto import spawner_pb2
+from src import entity
+from src import spawn_queue
+
+class TestSpawnQueue(unittest.TestCase):
+  def setUp(self):
+    self.queue = spawn_queue.SpawnQueue()
+    entity.Spawner.QUEUE_ = self.queue
+    entity.Entity.CreateWorld()
+
+  def tearDown(self):
+    entity.Spawner.QUEUE_ = None
+    entity.Entity.ZA_WARUDO.children_.clear()
+
+  def MakeEmitter(self, spawner_txt: str) -> entity.Entity:
+    emitter_pb = text_format.Parse(f"""
+        movement {{
+          state_fn {{ cartesian {{}} }}
+          lifetime: 0
+        }}
+        spawner {{
+          spawn_entity {{
+            movement {{
+              state_fn {{ cartesian {{}} }}
+              lifetime: 0
+            }}
+          }}
+          {spawner_txt}
+        }}
+      """, spawner_pb2.Entity())
+    emitter = entity.Entity(emitter_pb)
+    entity.Entity.ZA_WARUDO.AddChild(emitter)
+    return emitter
+
+  def testRun_spawnerNotDue_isNotUpdated(self):
+    emitter = self.MakeEmitter('spawn_count: 1 spawn_time_fn: "5"')
+
+    entity.Entity.ZA_WARUDO.Update({}, 1)
+
+    self.assertEqual(emitter.spawners[0].current_time, 0)
+    self.assertEqual(len(self.queue), 1)
+
+  def testRun_spawnerDue_spawnsAndLeavesWhenExhausted(self):
+    emitter = self.MakeEmitter('spawn_count: 1 spawn_time_fn: "1.5"')
+
+    entity.Entity.ZA_WARUDO.Update({}, 1)
+    entity.Entity.ZA_WARUDO.Update({}, 1)
+
+    self.assertEqual(len(entity.Entity.ZA_WARUDO.children_), 2)
+    self.assertAlmostEqual(emitter.spawners[0].current_time, 2)
+    self.assertEqual(len(self.queue), 0)
+
+  def testRun_periodicSpawner_staysScheduled(self):
+    self.MakeEmitter('spawn_count: 1 spawn_time_fn: "0" period: 2')
+
+    for _ in range(5):
+      entity.Entity.ZA_WARUDO.Update({}, 1)
+
+    # Spawns at 0, 2, and 4
+    self.assertEqual(len(entity.Entity.ZA_WARUDO.children_), 4)
+    self.assertEqual(len(self.queue), 1)
+
+  def testRun_cancelledSpawner_isSkipped(self):
+    emitter = self.MakeEmitter('spawn_count: 1 spawn_time_fn: "0.5"')
+
+    emitter.spawners[0].Cancel()
+    entity.Entity.ZA_WARUDO.Update({}, 1)
+
+    self.assertEqual(len(entity.Entity.ZA_WARUDO.children_), 1)
+    self.assertEqual(len(self.queue), 0)
+
+  def testRun_ownerRemovedFromWorld_isDropped(self):
+    emitter = self.MakeEmitter('spawn_count: 1 spawn_time_fn: "0.5"')
+    follower = self.MakeEmitter('spawn_count: 1 spawn_time_fn: "0.5"')
+    entity.Entity.ZA_WARUDO.children_.remove(follower)
+    follower.parent = emitter
+    emitter.AddChild(follower)
+    stray = self.MakeEmitter('spawn_count: 1 spawn_time_fn: "0.5"')
+    entity.Entity.ZA_WARUDO.children_.remove(stray)
+
+    entity.Entity.ZA_WARUDO.Update({}, 1)
+
+    self.assertEqual(emitter.spawners[0].current_time, 1)
+    self.assertEqual(follower.spawners[0].current_time, 1)
+    self.assertEqual(stray.spawners[0].current_time, 0)
+    self.assertEqual(len(self.queue), 0)
+
+  def testCreateWorld_cancelsSpawnersOfReplacedWorld(self):
+    emitter = self.MakeEmitter('spawn_count: 1 spawn_time_fn: "0.5"')
+
+    entity.Entity.CreateWorld()
+    entity.Entity.ZA_WARUDO.Update({}, 1)
+
+    self.assertEqual(emitter.spawners[0].current_time, 0)
+    self.assertEqual(entity.Entity.ZA_WARUDO.children_, [])
+    self.assertEqual(len(self.queue), 0)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,92 @@
+from bisect import bisect_left
+from math import floor
+from typing import Optional
+
+class SpawnSchedule():
+  """Sorted spawn times of a Spawner, queried by bisect.
+
+  Each period starts a new wave of the whole table, so wave j spawns idx at
+  j * period + t. Waves can overlap if a spawn time is later than the period.
+  Times are relative to the start of the current wave, which keeps the
+  numbers small regardless of how long the spawner has been running.
+
+  Spawn times before 0 are treated as 0.
+  """
+  def __init__(self, zipped_spawn_times_idx: list[tuple[float, int]], period: float = 0):
+    self.entries = sorted(
+      ((max(t, 0), t, idx) for t, idx in zipped_spawn_times_idx),
+      key=lambda entry: entry[0])
+    self.times = [entry[0] for entry in self.entries]
+    self.period = period if period > 0 else 0
+    self.last_time = self.times[-1] if self.times else 0
+
+  def Position(self, current_time: float) -> int:
+    """Number of spawns in the current wave that are before current_time."""
+    return bisect_left(self.times, current_time)
+
+  def Due(self,
+      current_time: float,
+      dt: float,
+      first_period: int = 0) -> list[tuple[int, float, int]]:
+    """Everything spawning in [current_time, current_time + dt).
+
+    Args:
+      current_time: Time since the start of the current wave.
+      dt: Time to advance by. This may span any number of periods.
+      first_period: The earliest wave, relative to the current one, that
+        exists. Usually the negative number of periods already elapsed.
+    Returns:
+      (period_index, t, idx) for each spawn in order of when it happens,
+      where period_index is relative to the current wave.
+    """
+    if not self.times:
+      return []
+    end_time = current_time + dt
+    if not self.period:
+      return [
+        (0, t, idx) for _, t, idx in
+        self.entries[self.Position(current_time):self.Position(end_time)]]
+
+    first = max(first_period, floor((current_time - self.last_time) / self.period))
+    last = floor(end_time / self.period)
+    due = []
+    for wave in range(first, last + 1):
+      offset = wave * self.period
+      start = self.Position(current_time - offset)
+      end = self.Position(end_time - offset)
+      due.extend(
+        (offset + sort_t, wave, t, idx)
+        for sort_t, t, idx in self.entries[start:end])
+    if last > first and self.last_time >= self.period:
+      # Waves only need interleaving when they overlap.
+      due.sort(key=lambda spawn: spawn[0])
+    return [(wave, t, idx) for _, wave, t, idx in due]
+
+  def NextSpawnTime(self, current_time: float, first_period: int = 0) -> Optional[float]:
+    """Time of the next spawn at or after current_time, relative to the current wave.
+
+    Returns:
+      None if nothing will spawn again.
+    """
+    if not self.times:
+      return None
+    if not self.period:
+      pos = self.Position(current_time)
+      return self.times[pos] if pos < len(self.times) else None
+
+    first = max(first_period, floor((current_time - self.last_time) / self.period))
+    # The next wave always spawns its first entry, so nothing later can be sooner.
+    last = max(first, floor(current_time / self.period) + 1)
+    next_time = None
+    for wave in range(first, last + 1):
+      offset = wave * self.period
+      pos = self.Position(current_time - offset)
+      if pos < len(self.times):
+        candidate = offset + self.times[pos]
+        if next_time is None or candidate < next_time:
+          next_time = candidate
+    return next_time
+
+  def IsExhausted(self, current_time: float) -> bool:
+    """Whether nothing will ever spawn at or after current_time."""
+    return not self.period and self.Position(current_time) >= len(self.times)
@@ -0,0 +1,69 @@
+import unittest
+
+from src import spawn_schedule
+
+class TestSpawnSchedule(unittest.TestCase):
+  def testDue_noPeriod_returnsSpawnsInWindow(self):
+    schedule = spawn_schedule.SpawnSchedule([(0.0, 0), (1.0, 1), (2.0, 2)])
+
+    self.assertEqual(schedule.Due(0, 1), [(0, 0.0, 0)])
+    self.assertEqual(schedule.Due(1, 1.5), [(0, 1.0, 1), (0, 2.0, 2)])
+    self.assertEqual(schedule.Due(2.5, 100), [])
+    self.assertTrue(schedule.IsExhausted(2.5))
+
+  def testDue_unsortedInput_returnsInTimeOrder(self):
+    schedule = spawn_schedule.SpawnSchedule([(2.0, 0), (1.0, 1), (0.5, 2)])
+
+    self.assertEqual(
+      [idx for _, _, idx in schedule.Due(0, 3)],
+      [2, 1, 0])
+
+  def testDue_dtSpanningSeveralPeriods_returnsEveryWave(self):
+    schedule = spawn_schedule.SpawnSchedule([(0.5, 0), (1.5, 1)], period=2)
+
+    due = schedule.Due(1.0, 5)
+
+    self.assertEqual(due, [
+      (0, 1.5, 1),
+      (1, 0.5, 0), (1, 1.5, 1),
+      (2, 0.5, 0), (2, 1.5, 1),
+    ])
+
+  def testDue_spawnsLaterThanPeriod_overlapWaves(self):
+    schedule = spawn_schedule.SpawnSchedule([(0.0, 0), (3.0, 1)], period=2)
+
+    due = schedule.Due(0, 4.5)
+
+    self.assertEqual(due, [(0, 0.0, 0), (1, 0.0, 0), (0, 3.0, 1), (2, 0.0, 0)])
+
+  def testDue_firstPeriod_excludesWavesBeforeStart(self):
+    schedule = spawn_schedule.SpawnSchedule([(0.0, 0), (3.0, 1)], period=2)
+
+    # Wave -1 would have its 3.0 spawn at 1.0 if it existed.
+    self.assertEqual(schedule.Due(0.5, 1, first_period=0), [])
+    self.assertEqual(schedule.Due(0.5, 1, first_period=-1), [(-1, 3.0, 1)])
+
+  def testNextSpawnTime_noPeriod_noneWhenExhausted(self):
+    schedule = spawn_schedule.SpawnSchedule([(1.0, 0), (2.0, 1)])
+
+    self.assertEqual(schedule.NextSpawnTime(0), 1.0)
+    self.assertEqual(schedule.NextSpawnTime(1.5), 2.0)
+    self.assertIsNone(schedule.NextSpawnTime(2.5))
+
+  def testNextSpawnTime_periodic_wrapsToNextWave(self):
+    schedule = spawn_schedule.SpawnSchedule([(0.5, 0), (1.0, 1)], period=2)
+
+    self.assertEqual(schedule.NextSpawnTime(1.5), 2.5)
+
+  def testNextSpawnTime_overlappingWaves_findsEarlierWave(self):
+    schedule = spawn_schedule.SpawnSchedule([(0.0, 0), (3.0, 1)], period=2)
+
+    self.assertEqual(schedule.NextSpawnTime(0.5, first_period=-1), 1.0)
+
+  def testDue_negativeSpawnTime_spawnsAtStart(self):
+    schedule = spawn_schedule.SpawnSchedule([(-1.0, 0)])
+
+    self.assertEqual(schedule.Due(0, 0.1), [(0, -1.0, 0)])
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,416 @@
+"""Streams the world to spectators, e.g. remote viewers or replay servers.
+
+A Broadcaster encodes the world after every update as a frame of
+  templates: image and movement of each kind of entity, sent once.
+  despawns: ids of entities that are gone.
+  states: positions of streamed entities that moved.
+  spawns: new entities with their template, parent, idx, offset and the
+    state of their movement.
+
+Most entities only depend on their own state, t, idx, dt and the absolute
+positions of their ancestors, so a Spectator reconstructs them by running
+their movement itself and they cost nothing after their spawn. Only entities
+reading random numbers or targets, with baked movements, with update
+policies or below one, or reading absolute positions below a streamed
+entity, are streamed every frame they move. Frame size scales with spawns, despawns and streamed
+entities instead of with live entities.
+
+A spectator joining late starts from a KeyFrame, a snapshot of every live
+entity, and applies every Frame after it. WriteFrame and ReadFrame length
+prefix frames on a stream, e.g. a socket's makefile().
+"""
+from dataclasses import dataclass
+import struct
+from typing import BinaryIO
+from typing import Optional
+
+from proto import spawner_pb2
+from src import state_function
+from src.entity import Entity
+from src.entity import Movement
+from src.entity import WORLD_ENTITY_PB
+from src.render import CollectDrawList
+from src.render import DrawList
+from src.state_function import ABSOLUTE_VARIABLES
+from src.state_function import PositionState
+from src.state_function import TARGET_VARIABLES
+from src.world import World
+
+# Variables that depend on something other than the entity and its ancestors.
+_UNREPRODUCIBLE = TARGET_VARIABLES | frozenset({'r'})
+
+# Frame flags
+_KEYFRAME = 1
+# Spawn flags
+_FOLLOW_CENTER = 1
+_FOLLOW_ANGLE = 2
+_RECONSTRUCTED = 4
+_ACTIVE = 8
+
+# flags, dt
+_HEADER = struct.Struct('<Bd')
+# current_time, offset x, y, angle, position x, y, angle
+_MOVEMENT_STATE = struct.Struct('<7d')
+# Position plus offset of a streamed entity, as only drawing relies on it.
+_STREAMED_STATE = struct.Struct('<3f')
+_LENGTH = struct.Struct('<I')
+
+_STATE_FN_FIELDS = {
+  spawner_pb2.CartesianStateFn: 'cartesian',
+  spawner_pb2.PolarStateFn: 'polar',
+  spawner_pb2.DeltaStateFn: 'delta',
+}
+
+def _WriteVarint(out: bytearray, value: int):
+  while value > 0x7f:
+    out.append((value & 0x7f) | 0x80)
+    value >>= 7
+  out.append(value)
+
+def _ReadVarint(data: bytes, pos: int) -> tuple[int, int]:
+  """(value, position after it)"""
+  value = shift = 0
+  while True:
+    byte = data[pos]
+    pos += 1
+    value |= (byte & 0x7f) << shift
+    if byte < 0x80:
+      return value, pos
+    shift += 7
+
+def _ZigZag(value: int) -> int:
+  return value << 1 if value >= 0 else ((-value) << 1) - 1
+
+def _UnZigZag(value: int) -> int:
+  return value >> 1 if not value & 1 else -((value + 1) >> 1)
+
+def IsReconstructible(
+    entity: Entity,
+    ancestors_reconstructed: bool = True,
+    ancestor_has_lod: bool = False) -> bool:
+  """Whether a spectator can run entity's movement itself after its spawn.
+
+  Args:
+    ancestors_reconstructed: Whether every ancestor is reconstructed as well,
+      and so has exactly the same absolute position for the spectator.
+    ancestor_has_lod: Whether any ancestor has an UpdatePolicy, which
+      decides when entity updates.
+  """
+  movement = entity.movement
+  variables = movement.variables
+  return (
+    movement.__class__ is Movement and
+    entity.lod_ is None and
+    not ancestor_has_lod and
+    variables is not None and
+    not variables & _UNREPRODUCIBLE and
+    (ancestors_reconstructed or not variables & ABSOLUTE_VARIABLES))
+
+def _StreamedState(entity: Entity) -> bytes:
+  centered = entity.position + entity.offset
+  return _STREAMED_STATE.pack(centered.x, centered.y, centered.angle)
+
+@dataclass
+class _Known:
+  net_id: int
+  generation: int
+  template: int
+  # Last state sent, None if reconstructed by spectators.
+  state: Optional[bytes]
+  frame: int = 0
+
+class Broadcaster():
+  """Encodes the entities below root, defaulting to the world, as frames."""
+  def __init__(self, root: Optional[Entity] = None):
+    self.root_ = root
+    # Number of Frames encoded so far.
+    self.frame = 0
+    # 0 is the root.
+    self.next_id_ = 1
+    self.known_: dict[Entity, _Known] = {}
+    # Serialized templates and their index, in the order they were first sent.
+    self.templates_: dict[bytes, int] = {}
+    # Stats
+    self.spawns = 0
+    self.despawns = 0
+    self.states = 0
+
+  def Template_(self, entity: Entity, new_templates: list[bytes]) -> int:
+    template_pb = spawner_pb2.Entity(image=entity.image)
+    template_pb.movement.CopyFrom(entity.pb_.movement)
+    # Spectators may not have the predefined StateFns, so inline them.
+    for state_fn in template_pb.movement.state_fn:
+      if state_fn.id.id:
+        source = state_function.DEFINED_FUNCTION_SOURCES_[state_fn.id.id]
+        getattr(state_fn, _STATE_FN_FIELDS[type(source)]).CopyFrom(source)
+    data = template_pb.SerializeToString(deterministic=True)
+    ref = self.templates_.get(data)
+    if ref is None:
+      ref = self.templates_[data] = len(self.templates_)
+      new_templates.append(data)
+    return ref
+
+  def WriteSpawn_(
+      self,
+      out: bytearray,
+      entity: Entity,
+      known: _Known,
+      container_id: int):
+    flags = (
+      (_FOLLOW_CENTER if entity.follow_center else 0) |
+      (_FOLLOW_ANGLE if entity.follow_angle else 0))
+    movement = entity.movement
+    if known.state is None:
+      flags |= _RECONSTRUCTED | (_ACTIVE if movement.is_active else 0)
+    _WriteVarint(out, known.net_id)
+    _WriteVarint(out, container_id)
+    _WriteVarint(out, known.template)
+    _WriteVarint(out, _ZigZag(entity.idx))
+    out.append(flags)
+    if known.state is None:
+      _WriteVarint(out, movement.current_idx)
+      offset = entity.offset
+      position = entity.position
+      out += _MOVEMENT_STATE.pack(
+        movement.current_time,
+        offset.x, offset.y, offset.angle,
+        position.x, position.y, position.angle)
+    else:
+      out += known.state
+
+  def Frame(self, dt: float) -> bytes:
+    """Everything that changed since the last Frame.
+
+    Call after every update of the world, with the dt it was updated by.
+    """
+    self.frame += 1
+    frame = self.frame
+    root = self.root_ or Entity.World()
+    known = self.known_
+    new_templates: list[bytes] = []
+    despawns = bytearray()
+    despawn_count = 0
+    spawns = bytearray()
+    spawn_count = 0
+    states = bytearray()
+    state_count = 0
+
+    # (entity, net id of the entity it is a child of, whether that and its
+    # ancestors are reconstructed, whether any of them has an UpdatePolicy),
+    # parents before children.
+    to_visit = [(child, 0, True, False) for child in root.children_]
+    while to_visit:
+      entity, container_id, ancestors_reconstructed, ancestor_has_lod = to_visit.pop()
+      entry = known.get(entity)
+      if entry is not None and entry.generation != entity.generation_:
+        # Despawned and reused from the pool since the last frame.
+        _WriteVarint(despawns, entry.net_id)
+        despawn_count += 1
+        entry = None
+      if entry is None:
+        state = None if IsReconstructible(
+          entity, ancestors_reconstructed, ancestor_has_lod) else _StreamedState(entity)
+        entry = known[entity] = _Known(
+          self.next_id_, entity.generation_, self.Template_(entity, new_templates), state)
+        self.next_id_ += 1
+        self.WriteSpawn_(spawns, entity, entry, container_id)
+        spawn_count += 1
+      elif entry.state is not None:
+        state = _StreamedState(entity)
+        if state != entry.state:
+          entry.state = state
+          _WriteVarint(states, entry.net_id)
+          states += state
+          state_count += 1
+      entry.frame = frame
+      if entity.children_:
+        net_id = entry.net_id
+        reconstructed = ancestors_reconstructed and entry.state is None
+        has_lod = ancestor_has_lod or entity.lod_ is not None
+        to_visit.extend(
+          (child, net_id, reconstructed, has_lod) for child in entity.children_)
+
+    gone = [entity for entity, entry in known.items() if entry.frame != frame]
+    for entity in gone:
+      _WriteVarint(despawns, known.pop(entity).net_id)
+      despawn_count += 1
+
+    self.spawns += spawn_count
+    self.despawns += despawn_count
+    self.states += state_count
+    out = bytearray(_HEADER.pack(0, dt))
+    _WriteVarint(out, frame)
+    _WriteVarint(out, len(new_templates))
+    for data in new_templates:
+      _WriteVarint(out, len(data))
+      out += data
+    _WriteVarint(out, despawn_count)
+    out += despawns
+    _WriteVarint(out, state_count)
+    out += states
+    _WriteVarint(out, spawn_count)
+    out += spawns
+    return bytes(out)
+
+  def KeyFrame(self) -> bytes:
+    """Every entity as of the last Frame, for spectators joining now."""
+    root = self.root_ or Entity.World()
+    out = bytearray(_HEADER.pack(_KEYFRAME, 0.0))
+    _WriteVarint(out, self.frame)
+    _WriteVarint(out, len(self.templates_))
+    for data in self.templates_:
+      _WriteVarint(out, len(data))
+      out += data
+    # No despawns or states.
+    _WriteVarint(out, 0)
+    _WriteVarint(out, 0)
+
+    spawns = bytearray()
+    spawn_count = 0
+    to_visit = [(child, 0) for child in root.children_]
+    while to_visit:
+      entity, container_id = to_visit.pop()
+      entry = self.known_.get(entity)
+      if entry is None or entry.generation != entity.generation_:
+        # Spawned after the last Frame, the next Frame has it.
+        continue
+      self.WriteSpawn_(spawns, entity, entry, container_id)
+      spawn_count += 1
+      if entity.children_:
+        to_visit.extend((child, entry.net_id) for child in entity.children_)
+    _WriteVarint(out, spawn_count)
+    out += spawns
+    return bytes(out)
+
+class Spectator():
+  """Mirrors a Broadcaster's entities in its own World by applying its frames."""
+  def __init__(self, world: Optional[World] = None):
+    self.world = world or World()
+    # Index of the last frame applied.
+    self.frame = 0
+    # Mirrored entities and the entity they are a child of, by net id.
+    self.mirrors_: dict[int, tuple[Entity, Entity]] = {}
+    # (reconstructed, streamed) Entity protos of every template.
+    self.templates_: list[tuple[spawner_pb2.Entity, spawner_pb2.Entity]] = []
+
+  def Apply(self, frame: bytes):
+    """Applies the next Frame, or a KeyFrame at any time.
+
+    Raises:
+      ValueError: if a Frame was skipped since the last frame applied.
+    """
+    flags, dt = _HEADER.unpack_from(frame)
+    index, pos = _ReadVarint(frame, _HEADER.size)
+    keyframe = flags & _KEYFRAME
+    if not keyframe and index != self.frame + 1:
+      raise ValueError(f'Expected frame {self.frame + 1}, got {index}.')
+    self.frame = index
+
+    with self.world:
+      root = self.world.root
+      if keyframe:
+        for mirror, _ in self.mirrors_.values():
+          Entity.Release(mirror)
+        root.children_.clear()
+        self.mirrors_.clear()
+        self.templates_.clear()
+      else:
+        root.Update(self.world.globals, dt)
+
+      count, pos = _ReadVarint(frame, pos)
+      for _ in range(count):
+        size, pos = _ReadVarint(frame, pos)
+        reconstructed_pb = spawner_pb2.Entity.FromString(frame[pos:pos + size])
+        pos += size
+        streamed_pb = spawner_pb2.Entity(image=reconstructed_pb.image)
+        streamed_pb.movement.CopyFrom(WORLD_ENTITY_PB.movement)
+        self.templates_.append((reconstructed_pb, streamed_pb))
+
+      count, pos = _ReadVarint(frame, pos)
+      gone = set()
+      containers = set()
+      for _ in range(count):
+        net_id, pos = _ReadVarint(frame, pos)
+        mirror, container = self.mirrors_.pop(net_id)
+        # Mirrors are never pooled, so releasing one again after it ended in
+        # the Update above, or with its parent, is harmless.
+        Entity.Release(mirror)
+        gone.add(mirror)
+        containers.add(container)
+      for container in containers:
+        container.children_[:] = [
+          child for child in container.children_ if child not in gone]
+
+      # Streamed states come before spawns, so that no spawn caches its
+      # absolute position from a parent that moves afterwards.
+      count, pos = _ReadVarint(frame, pos)
+      for _ in range(count):
+        net_id, pos = _ReadVarint(frame, pos)
+        mirror, _ = self.mirrors_[net_id]
+        mirror.offset = PositionState(*_STREAMED_STATE.unpack_from(frame, pos))
+        pos += _STREAMED_STATE.size
+        mirror.recalc_absolute_ = True
+
+      count, pos = _ReadVarint(frame, pos)
+      for _ in range(count):
+        net_id, pos = _ReadVarint(frame, pos)
+        container_id, pos = _ReadVarint(frame, pos)
+        template, pos = _ReadVarint(frame, pos)
+        idx, pos = _ReadVarint(frame, pos)
+        flags = frame[pos]
+        pos += 1
+        container = self.mirrors_[container_id][0] if container_id else root
+        reconstructed_pb, streamed_pb = self.templates_[template]
+        reconstructed = flags & _RECONSTRUCTED
+        # Without an id or template_id the mirror is never pooled.
+        mirror = Entity(
+          reconstructed_pb if reconstructed else streamed_pb,
+          container if container_id else None,
+          None,
+          _UnZigZag(idx),
+          bool(flags & _FOLLOW_CENTER),
+          bool(flags & _FOLLOW_ANGLE))
+        if reconstructed:
+          movement = mirror.movement
+          movement.current_idx, pos = _ReadVarint(frame, pos)
+          (movement.current_time,
+            offset_x, offset_y, offset_angle,
+            x, y, angle) = _MOVEMENT_STATE.unpack_from(frame, pos)
+          pos += _MOVEMENT_STATE.size
+          movement.is_active = bool(flags & _ACTIVE)
+          mirror.offset = PositionState(offset_x, offset_y, offset_angle)
+          mirror.position = PositionState(x, y, angle)
+        else:
+          mirror.offset = PositionState(*_STREAMED_STATE.unpack_from(frame, pos))
+          pos += _STREAMED_STATE.size
+        mirror.recalc_absolute_ = True
+        container.children_.append(mirror)
+        self.mirrors_[net_id] = (mirror, container)
+
+  def LiveCount(self) -> int:
+    return len(self.mirrors_)
+
+  def DrawList(self) -> DrawList:
+    with self.world:
+      return CollectDrawList(self.world.root)
+
+def WriteFrame(stream: BinaryIO, frame: bytes):
+  stream.write(_LENGTH.pack(len(frame)))
+  stream.write(frame)
+
+def ReadFrame(stream: BinaryIO) -> Optional[bytes]:
+  """The next frame written by WriteFrame, None once stream is closed.
+
+  Raises:
+    EOFError: if stream ends in the middle of a frame.
+  """
+  header = stream.read(_LENGTH.size)
+  if not header:
+    return None
+  if len(header) < _LENGTH.size:
+    raise EOFError('Stream ended inside a frame header.')
+  size, = _LENGTH.unpack(header)
+  frame = stream.read(size)
+  if len(frame) < size:
+    raise EOFError('Stream ended inside a frame.')
+  return frame
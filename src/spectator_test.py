@@ -0,0 +1,212 @@
+import socket
+import unittest
+
+from src import spectator
+from src.loader import ParseDefinedUnits
+from src.world import Templates
+from src.world import World
+
+UNITS_PB_TXT = """
+  polar_function {
+    id { id: 'spectator_ring_out' }
+    r: '100 * t'
+    theta: 'tau * idx / 50'
+    angle: 'tau * idx / 50'
+  }
+
+  entity {
+    id { id: 'spectator_bullet' }
+    movement {
+      state_fn { id { id: 'spectator_ring_out' } }
+      state_fn { delta { dx: '-x + 10 * cos(anglea)' dy: '10 * idx' } }
+      lifetime: 0.5
+      lifetime: 0.5
+      loop: false
+    }
+  }
+
+  entity {
+    id { id: 'spectator_emitter' }
+    movement {
+      state_fn { cartesian { x: '640 + 100 * sin(t)' y: '360' angle: 't' } }
+      lifetime: 0
+    }
+    spawner {
+      spawn_entity { id { id: 'spectator_bullet' } }
+      spawn_count: 50
+      spawn_time_fn: 'idx / 100'
+      period: 0.6
+      follow_center: true
+      follow_angle: true
+    }
+  }
+
+  entity {
+    id { id: 'spectator_lazy_emitter' }
+    update_policy { interval: 3 }
+    movement {
+      state_fn { cartesian { x: '320' y: '240 + 50 * t' } }
+      lifetime: 0
+    }
+    spawner {
+      spawn_entity {
+        movement {
+          state_fn { polar { r: '60 * t' theta: 'tau * idx / 4' } }
+          lifetime: 0
+        }
+      }
+      spawn_count: 4
+      spawn_time_fn: '0'
+      follow_center: true
+    }
+  }
+
+  entity {
+    id { id: 'spectator_static' }
+    movement {
+      state_fn { cartesian { x: '10 * idx' y: '20' } }
+      lifetime: 0
+    }
+  }
+
+  entity {
+    id { id: 'spectator_wanderer' }
+    movement {
+      state_fn { delta { dx: 'r.uniform(-10, 10)' dy: '5' } }
+      lifetime: 0
+    }
+    spawner {
+      spawn_entity {
+        movement {
+          state_fn { delta { dx: '20 * cos(anglea)' } }
+          lifetime: 0
+        }
+      }
+      spawn_count: 1
+      spawn_time_fn: '0'
+      follow_center: true
+    }
+  }
+"""
+
+DT = 1 / 60
+
+class TestSpectator(unittest.TestCase):
+  @classmethod
+  def setUpClass(cls):
+    cls.templates = Templates.Compile(ParseDefinedUnits(UNITS_PB_TXT))
+
+  def setUp(self):
+    self.world = World(self.templates, seed=1)
+    with self.world:
+      self.broadcaster = spectator.Broadcaster(self.world.root)
+
+  def Step(self) -> bytes:
+    with self.world:
+      self.world.root.Update(self.world.globals, DT)
+      return self.broadcaster.Frame(DT)
+
+  def Positions(self, world: World) -> list[tuple[float, float, float]]:
+    with world:
+      return sorted(
+        (p.x, p.y, p.angle) for p in (
+          entity.AbsolutePosition() for entity in world.root.Walk()
+          if entity is not world.root))
+
+  def test_reconstructedEntities_matchExactly(self):
+    self.world.Add('spectator_emitter')
+    viewer = spectator.Spectator()
+    for _ in range(150):
+      viewer.Apply(self.Step())
+      self.assertEqual(self.Positions(viewer.world), self.Positions(self.world))
+    self.assertEqual(self.broadcaster.states, 0)
+    # Bullets ended and were reused from the pool.
+    self.assertGreater(self.broadcaster.despawns, 50)
+    self.assertGreater(self.world.pool.hits, 0)
+
+  def test_frameSize_scalesWithEventsNotLiveEntities(self):
+    for i in range(1000):
+      self.world.Add('spectator_static', idx=i)
+    viewer = spectator.Spectator()
+    viewer.Apply(self.Step())
+    self.assertEqual(viewer.LiveCount(), 1000)
+
+    for _ in range(10):
+      frame = self.Step()
+      viewer.Apply(frame)
+      # Header, frame index and empty sections.
+      self.assertLess(len(frame), 16)
+    self.assertEqual(self.Positions(viewer.world), self.Positions(self.world))
+
+  def test_unreproducibleEntities_streamed(self):
+    self.world.Add('spectator_wanderer')
+    viewer = spectator.Spectator()
+    for _ in range(30):
+      viewer.Apply(self.Step())
+      for got, want in zip(self.Positions(viewer.world), self.Positions(self.world)):
+        for a, b in zip(got, want):
+          self.assertAlmostEqual(a, b, places=3)
+    # The wanderer and its child, which reads its absolute angle.
+    self.assertEqual(self.broadcaster.states, 2 * 29)
+
+  def test_updatePolicy_descendantsStreamed(self):
+    self.world.Add('spectator_lazy_emitter')
+    viewer = spectator.Spectator()
+    for _ in range(30):
+      viewer.Apply(self.Step())
+      got = self.Positions(viewer.world)
+      want = self.Positions(self.world)
+      self.assertEqual(len(got), len(want))
+      for a, b in zip(got, want):
+        self.assertAlmostEqual(a[0], b[0], places=3)
+        self.assertAlmostEqual(a[1], b[1], places=3)
+    self.assertEqual(len(self.broadcaster.known_), 5)
+    # Only updated every third frame, 10 times, and its children 9 times
+    # after spawning.
+    self.assertEqual(self.broadcaster.states, 10 + 4 * 9)
+
+  def test_keyFrame_joinsLate(self):
+    self.world.Add('spectator_emitter')
+    self.world.Add('spectator_wanderer')
+    for _ in range(45):
+      self.Step()
+    viewer = spectator.Spectator()
+    viewer.Apply(self.broadcaster.KeyFrame())
+    self.assertEqual(viewer.LiveCount(), len(self.broadcaster.known_))
+
+    for _ in range(60):
+      viewer.Apply(self.Step())
+      got = self.Positions(viewer.world)
+      want = self.Positions(self.world)
+      self.assertEqual(len(got), len(want))
+      for a, b in zip(got, want):
+        self.assertAlmostEqual(a[0], b[0], places=3)
+        self.assertAlmostEqual(a[1], b[1], places=3)
+
+  def test_missedFrame_raises(self):
+    self.world.Add('spectator_emitter')
+    viewer = spectator.Spectator()
+    viewer.Apply(self.Step())
+    self.Step()
+    with self.assertRaises(ValueError):
+      viewer.Apply(self.Step())
+
+  def test_socket_roundTrip(self):
+    self.world.Add('spectator_emitter')
+    sender, receiver = socket.socketpair()
+    with sender, receiver:
+      outgoing = sender.makefile('wb')
+      incoming = receiver.makefile('rb')
+      viewer = spectator.Spectator()
+      for _ in range(20):
+        spectator.WriteFrame(outgoing, self.Step())
+        outgoing.flush()
+        viewer.Apply(spectator.ReadFrame(incoming))
+      outgoing.close()
+      sender.shutdown(socket.SHUT_WR)
+      self.assertIsNone(spectator.ReadFrame(incoming))
+      incoming.close()
+    self.assertEqual(self.Positions(viewer.world), self.Positions(self.world))
+
+if __name__ == '__main__':
+  unittest.main()
@@ -1,10 +1,17 @@
+import ast
+import builtins
 import math
 
 from dataclasses import dataclass
 from dataclasses import replace as CopyDataclass
+from google.protobuf.message import Message
 from proto import spawner_pb2
 from typing import Callable
+from typing import Optional
 import random
+import threading
+
+from src.instrumentation import INSTRUMENTATION
 
 _FUNCTIONS = {
   'sin': math.sin,
@@ -22,21 +29,292 @@ _CONSTANTS = {
 
 _GLOBALS = _FUNCTIONS | _CONSTANTS
 
+# Globals whose results change between calls, and are treated as variables.
+_IMPURE = frozenset({'r'})
+
+# Names that never need to be passed in through ctx.
+_KNOWN_NAMES = (frozenset(_GLOBALS) - _IMPURE) | frozenset(dir(builtins))
+
+# Variables only available through the absolute position of an Entity.
+ABSOLUTE_VARIABLES = frozenset({'xa', 'ya', 'anglea'})
+
+# Position of the nearest opposing target, see targeting.py.
+TARGET_VARIABLES = frozenset({'tx', 'ty'})
+
 def GetGlobals() -> dict:
   return _GLOBALS.copy()
 
+def ExpressionVariables(expr: str) -> frozenset[str]:
+  """Finds the free variables an expression reads from its context.
+
+  Known functions and constants (sin, pi, ...) are not included, except for
+  impure ones like r (random) so that such expressions are never considered
+  constant.
+  """
+  tree = ast.parse(expr, mode='eval')
+  loaded = set()
+  bound = set()
+  for node in ast.walk(tree):
+    if isinstance(node, ast.Name):
+      if isinstance(node.ctx, ast.Load):
+        loaded.add(node.id)
+      else:
+        # e.g. comprehension targets and walrus assignments.
+        bound.add(node.id)
+    elif isinstance(node, ast.arg):
+      bound.add(node.arg)
+  return frozenset(loaded - bound - _KNOWN_NAMES)
+
+class ExpressionCache():
+  """Per-frame memo of subexpressions that only depend on t.
+
+  Entities spawned at the same time by the same spawner share their
+  CompiledStateFns and have the same local t, so e.g. the sin(t) in a ring
+  of bullets only needs to be evaluated once per frame. Entries are keyed by
+  (term, t) and dropped every NextFrame, or all at once when there are more
+  than max_entries. Terms with the same source share entries, so inline
+  functions compiled separately for every spawn still hit.
+
+  While threads update in parallel, each counts its hits, misses and
+  evictions in its own list set with Defer, which are added with AddCounts
+  once they're done.
+  """
+  def __init__(self, max_entries: int = 1 << 16):
+    self.max_entries = max_entries
+    self.enabled = True
+    self.table_: dict[tuple[int, float], float] = {}
+    self.term_ids_: dict[str, int] = {}
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+    self.published_ = (0, 0, 0)
+    # Whether any thread may be counting in local_.counts, see Defer.
+    self.deferring = False
+    self.local_ = threading.local()
+
+  def Term(self, source: str) -> Callable[[float], float]:
+    """A memoized function of t evaluating source, which may only read t."""
+    term_id = self.term_ids_.setdefault(source, len(self.term_ids_))
+    code = compile(source, '<expression_cache>', 'eval')
+    table = self.table_
+    def Memo(t: float) -> float:
+      if not self.enabled:
+        return eval(code, _GLOBALS, {'t': t})
+      key = (term_id, t)
+      value = table.get(key)
+      counts = self.local_.__dict__.get('counts') if self.deferring else None
+      if value is None:
+        value = eval(code, _GLOBALS, {'t': t})
+        evicted = len(table) >= self.max_entries
+        if evicted:
+          table.clear()
+        table[key] = value
+        if counts is None:
+          self.misses += 1
+          self.evictions += evicted
+        else:
+          counts[1] += 1
+          counts[2] += evicted
+      elif counts is None:
+        self.hits += 1
+      else:
+        counts[0] += 1
+      return value
+    return Memo
+
+  def Defer(self, counts: Optional[list[int]]) -> Optional[list[int]]:
+    """Counts [hits, misses, evictions] of the calling thread in counts instead.
+
+    Only while deferring is set. Returns the previous counts, None meaning
+    the shared counters.
+    """
+    previous = self.local_.__dict__.get('counts')
+    self.local_.counts = counts
+    return previous
+
+  def AddCounts(self, counts: list[int]):
+    hits, misses, evictions = counts
+    self.hits += hits
+    self.misses += misses
+    self.evictions += evictions
+
+  def NextFrame(self):
+    """Drops every entry and adds this frame's counters to INSTRUMENTATION."""
+    self.table_.clear()
+    hits, misses, evictions = self.published_
+    INSTRUMENTATION.Count('expression_cache.hits', self.hits - hits)
+    INSTRUMENTATION.Count('expression_cache.misses', self.misses - misses)
+    INSTRUMENTATION.Count('expression_cache.evictions', self.evictions - evictions)
+    self.published_ = (self.hits, self.misses, self.evictions)
+
+  def HitRate(self) -> float:
+    total = self.hits + self.misses
+    return self.hits / total if total else 0.0
+
+EXPRESSION_CACHE = ExpressionCache()
+
+# Nodes whose contents are evaluated in their own scope, or maybe not at all.
+_NESTED_SCOPES = (ast.Lambda, ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp)
+_CONDITIONAL = (ast.IfExp, ast.BoolOp)
+
+def _NodeVariables(node: ast.AST) -> frozenset[str]:
+  return frozenset(
+    n.id for n in ast.walk(node)
+    if isinstance(n, ast.Name) and isinstance(n.ctx, ast.Load)) - _KNOWN_NAMES
+
+def _CallCount(node: ast.AST) -> int:
+  return sum(isinstance(n, ast.Call) for n in ast.walk(node))
+
+def _HoistTerms(
+    node: ast.AST,
+    variables: frozenset[str],
+    reference: Callable[[str], ast.expr],
+    prefix: str,
+    hoisted: list[tuple[str, ast.expr]],
+    eager: bool,
+    min_calls: int) -> ast.AST:
+  """Replaces the largest subexpressions reading exactly variables.
+
+  Args:
+    reference: Makes the expression replacing a hoisted term from its name.
+    eager: Whether hoisted terms are evaluated up front, in which case terms
+      that might not be evaluated at all (e.g. in an if else) are kept.
+    min_calls: Fewest function calls for a term to be worth hoisting.
+  """
+  if isinstance(node, ast.expr) and _NodeVariables(node) == variables:
+    if _CallCount(node) >= min_calls:
+      name = f'{prefix}{len(hoisted)}'
+      hoisted.append((name, node))
+      return reference(name)
+  if isinstance(node, _NESTED_SCOPES) or (eager and isinstance(node, _CONDITIONAL)):
+    return node
+  for field, value in ast.iter_fields(node):
+    if isinstance(value, list):
+      setattr(node, field, [
+        _HoistTerms(item, variables, reference, prefix, hoisted, eager, min_calls)
+        if isinstance(item, ast.AST) else item for item in value])
+    elif isinstance(value, ast.AST):
+      setattr(node, field, _HoistTerms(
+        value, variables, reference, prefix, hoisted, eager, min_calls))
+  return node
+
+def _Compile(node: ast.AST):
+  if not isinstance(node, ast.Expression):
+    node = ast.Expression(node)
+  return compile(ast.fix_missing_locations(node), '', 'eval')
+
+def _SplitTimeTerms(expr: str, variables: frozenset[str]) -> Optional[Callable]:
+  """Compiles expr with its t only subexpressions looked up in EXPRESSION_CACHE.
+
+  Subexpressions only depending on idx are split out as well, to be evaluated
+  once per spawn by BindIdxTerms.
+
+  Returns:
+    None if nothing is worth caching.
+  """
+  if 't' not in variables:
+    return None
+  tree = ast.parse(expr, mode='eval')
+  if variables == {'t'}:
+    if not _CallCount(tree):
+      return None
+    # Only depends on t, so skip eval altogether.
+    memo = EXPRESSION_CACHE.Term(ast.unparse(tree))
+    fn = lambda ctx: memo(ctx['t'])
+    fn.variables = variables
+    return fn
+
+  time_terms = []
+  call_with_t = lambda name: ast.Call(
+    func=ast.Name(id=name, ctx=ast.Load()),
+    args=[ast.Name(id='t', ctx=ast.Load())],
+    keywords=[])
+  # A lookup costs about as much as a call, so terms with one call aren't worth it.
+  tree = _HoistTerms(tree, frozenset({'t'}), call_with_t, '_t', time_terms, False, 2)
+  memo_locals = {
+    name: EXPRESSION_CACHE.Term(ast.unparse(term)) for name, term in time_terms}
+  idx_terms = []
+  if 'idx' in variables:
+    read_name = lambda name: ast.Name(id=name, ctx=ast.Load())
+    split_tree = _HoistTerms(
+      ast.parse(ast.unparse(tree), mode='eval'),
+      frozenset({'idx'}), read_name, '_i', idx_terms, True, 1)
+  if not time_terms and not idx_terms:
+    return None
+
+  code = _Compile(tree)
+  fn = lambda ctx: eval(code, ctx, memo_locals)
+  fn.variables = variables
+  if idx_terms:
+    fn.idx_terms = [(name, _Compile(term)) for name, term in idx_terms]
+    fn.split_code = _Compile(split_tree)
+    fn.memo_locals = memo_locals
+  return fn
+
+def BindIdxTerms(
+    fn: Callable[[dict[str, float]], float],
+    idx: int) -> Callable[[dict[str, float]], float]:
+  """Precomputes the idx only subexpressions of fn for a single spawn."""
+  idx_terms = getattr(fn, 'idx_terms', None)
+  if not idx_terms:
+    return fn
+  ctx = _GLOBALS | {'idx': idx}
+  try:
+    bound_locals = fn.memo_locals | {name: eval(code, ctx) for name, code in idx_terms}
+  except Exception:
+    # Leave the error to be raised when actually evaluated.
+    return fn
+  split_code = fn.split_code
+  bound = lambda ctx: eval(split_code, ctx, bound_locals)
+  bound.variables = fn.variables
+  return bound
+
 def MakeFn(expr: str) -> Callable[[dict[str, float]], float]:
   """Create a function from the string to be evaluated with ctx globals.
 
   Currently, this is implemented as an eval with limited ctx scope.
+  The returned function has a `variables` attribute with the names it reads
+  from ctx, see ExpressionVariables.
   """
   # TODO: Sanitize expr before using it in eval if this ever goes
   # beyond a toy phase.  This is a dangerous possibility of Arbitrary
   # Code Execution.
-  expr = compile(expr, '', 'eval')
-  return lambda ctx: eval(expr, ctx, {})
-
-DEFAULT_STATE_FN = lambda _: 0
+  code = compile(expr, '', 'eval')
+  variables = ExpressionVariables(expr)
+  if not variables:
+    # Nothing can change the result, so only evaluate it once.
+    try:
+      return ConstantFn(eval(code, GetGlobals(), {}))
+    except Exception:
+      # Leave the error to be raised when actually evaluated.
+      pass
+  fn = _SplitTimeTerms(expr, variables)
+  if fn is not None:
+    return fn
+  fn = lambda ctx: eval(code, ctx, {})
+  fn.variables = variables
+  return fn
+
+def ConstantFn(value: float) -> Callable[[dict[str, float]], float]:
+  """A precomputed function, with its value available as fn.constant."""
+  fn = lambda _: value
+  fn.variables = frozenset()
+  fn.constant = value
+  return fn
+
+def IsConstant(fn: Callable[[dict[str, float]], float]) -> bool:
+  return hasattr(fn, 'constant')
+
+DEFAULT_STATE_FN = ConstantFn(0)
+
+def FnVariables(fn: Callable[[dict[str, float]], float]) -> Optional[frozenset[str]]:
+  """The variables fn reads, or None if unknown (e.g. not made by MakeFn)."""
+  return getattr(fn, 'variables', None)
+
+def IsSpawnConstant(fn: Callable[[dict[str, float]], float]) -> bool:
+  """Whether fn only depends on values that are fixed once spawned (idx)."""
+  variables = FnVariables(fn)
+  return variables is not None and variables <= {'idx'}
 
 """
 Some notes regarding context and variables that need to be passed.
@@ -50,7 +328,7 @@ y: Entity's current y position
 o: Entity's current Angle (in radians)
 """
 
-@dataclass
+@dataclass(slots=True)
 class PositionState:
   """A Dataclass holding Entity State."""
   x: float = 0
@@ -94,6 +372,44 @@ class CompiledStateFn:
   y: Callable[[dict[str, float]], float] = DEFAULT_STATE_FN
   angle: Callable[[dict[str, float]], float] = DEFAULT_STATE_FN
 
+  def Variables(self) -> Optional[frozenset[str]]:
+    """All variables read by x, y, and angle, or None if any are unknown."""
+    res = frozenset()
+    for fn in (self.x, self.y, self.angle):
+      variables = FnVariables(fn)
+      if variables is None:
+        return None
+      res |= variables
+    return res
+
+  def IsConstant(self) -> bool:
+    return IsConstant(self.x) and IsConstant(self.y) and IsConstant(self.angle)
+
+  def ConstantPosition(self) -> Optional[PositionState]:
+    """The position this always evaluates to, or None if it isn't constant."""
+    if not self.IsConstant():
+      return None
+    return PositionState(self.x.constant, self.y.constant, self.angle.constant)
+
+  def NeedsBinding(self) -> bool:
+    """Whether Bind would precompute anything."""
+    return any(
+      (IsSpawnConstant(fn) and not IsConstant(fn)) or hasattr(fn, 'idx_terms')
+      for fn in (self.x, self.y, self.angle))
+
+  def Bind(self, idx: int) -> 'CompiledStateFn':
+    """Precomputes the functions, or parts of them, only depending on idx for a single spawn."""
+    if not self.NeedsBinding():
+      return self
+    ctx = _GLOBALS | {'idx': idx}
+    def BindFn(fn):
+      if IsConstant(fn):
+        return fn
+      if not IsSpawnConstant(fn):
+        return BindIdxTerms(fn, idx)
+      return ConstantFn(fn(ctx))
+    return CompiledStateFn(BindFn(self.x), BindFn(self.y), BindFn(self.angle))
+
   def Calc(self, ctx: dict[str, float]) -> PositionState:
     global_vars = _GLOBALS | ctx
     return PositionState(
@@ -102,9 +418,20 @@ class CompiledStateFn:
       self.angle(global_vars))
 
 DEFINED_FUNCTIONS_: dict[str, CompiledStateFn] = {}
+# The protos each DEFINED_FUNCTIONS_ entry was compiled from.
+DEFINED_FUNCTION_SOURCES_: dict[str, Message] = {}
 
 def ClearDefinedFunctions():
   DEFINED_FUNCTIONS_.clear()
+  DEFINED_FUNCTION_SOURCES_.clear()
+
+def StateFnDependencies(fn_id: str) -> Optional[frozenset[str]]:
+  """Variables read by the predefined StateFn fn_id.
+
+  Raises:
+    KeyError: if fn_id was never defined.
+  """
+  return DEFINED_FUNCTIONS_[fn_id].Variables()
 
 def GenerateCartesianStateFn(
     cartesian_pb: spawner_pb2.CartesianStateFn,
@@ -132,6 +459,7 @@ def GenerateCartesianStateFn(
     if not cartesian_pb.id.id:
       raise Exception(f'No id defined to store: {cartesian_pb}')
     DEFINED_FUNCTIONS_[cartesian_pb.id.id] = res
+    DEFINED_FUNCTION_SOURCES_[cartesian_pb.id.id] = cartesian_pb
   return res
 
 def GeneratePolarStateFn(
@@ -167,6 +495,7 @@ def GeneratePolarStateFn(
     if not polar_pb.id.id:
       raise Exception(f'No id defined to store: {polar_pb}')
     DEFINED_FUNCTIONS_[polar_pb.id.id] = res
+    DEFINED_FUNCTION_SOURCES_[polar_pb.id.id] = polar_pb
   return res
 
 def GenerateDeltaStateFn(
@@ -204,6 +533,7 @@ def GenerateDeltaStateFn(
     if not delta_pb.id.id:
       raise Exception(f'No id defined to store: {delta_pb}')
     DEFINED_FUNCTIONS_[delta_pb.id.id] = res
+    DEFINED_FUNCTION_SOURCES_[delta_pb.id.id] = delta_pb
   return res
 
 
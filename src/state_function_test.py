@@ -60,6 +60,159 @@ class TestMakeFn(unittest.TestCase):
     with self.assertRaises(NameError):
       res({})
 
+  def test_variables_excludesKnownFunctionsAndConstants(self):
+    res = state_function.MakeFn('10 * sin(tau * t) + idx * xa')
+
+    self.assertEqual(res.variables, {'t', 'idx', 'xa'})
+
+  def test_variables_excludesComprehensionTargets(self):
+    res = state_function.MakeFn('sum([i * t for i in range(3)])')
+
+    self.assertEqual(res.variables, {'t'})
+
+  def test_variables_keepsImpureRandom(self):
+    res = state_function.MakeFn('r.random() * 10')
+
+    self.assertEqual(res.variables, {'r'})
+    self.assertFalse(state_function.IsSpawnConstant(res))
+
+  def test_isSpawnConstant_onlyIdx_isTrue(self):
+    self.assertTrue(state_function.IsSpawnConstant(state_function.MakeFn('tau * idx / 36')))
+    self.assertTrue(state_function.IsSpawnConstant(state_function.MakeFn('600')))
+    self.assertFalse(state_function.IsSpawnConstant(state_function.MakeFn('idx * t')))
+    self.assertFalse(state_function.IsSpawnConstant(lambda ctx: 0))
+
+  def test_constantExpression_isPrecomputed(self):
+    res = state_function.MakeFn('2 * pi')
+
+    self.assertTrue(state_function.IsConstant(res))
+    self.assertAlmostEqual(res.constant, math.tau)
+    self.assertAlmostEqual(res({}), math.tau)
+
+  def test_failingConstantExpression_raisesWhenEvaluated(self):
+    res = state_function.MakeFn('1 / 0')
+
+    self.assertFalse(state_function.IsConstant(res))
+    with self.assertRaises(ZeroDivisionError):
+      res({})
+
+class TestCompiledStateFnBind(unittest.TestCase):
+  def test_bind_foldsIdxOnlyFunctions(self):
+    polar_pb = spawner_pb2.PolarStateFn()
+    polar_pb.r = '20'
+    polar_pb.theta = 'tau * idx / 4'
+    polar_pb.angle = 'idx * t'
+    state_fn = state_function.GeneratePolarStateFn(polar_pb)
+
+    bound = state_fn.Bind(1)
+
+    self.assertTrue(state_function.IsConstant(bound.x))
+    self.assertTrue(state_function.IsConstant(bound.y))
+    self.assertFalse(state_function.IsConstant(bound.angle))
+    self.assertEqual(
+      bound.Calc({'t': 2, 'idx': 1}),
+      state_fn.Calc({'t': 2, 'idx': 1}))
+
+  def test_bind_nothingToFold_returnsSelf(self):
+    cartesian_pb = spawner_pb2.CartesianStateFn()
+    cartesian_pb.x = 't'
+    state_fn = state_function.GenerateCartesianStateFn(cartesian_pb)
+
+    self.assertIs(state_fn.Bind(3), state_fn)
+
+  def test_constantPosition_onlyWhenAllConstant(self):
+    cartesian_pb = spawner_pb2.CartesianStateFn()
+    cartesian_pb.x = '600'
+    cartesian_pb.y = '400'
+    state_fn = state_function.GenerateCartesianStateFn(cartesian_pb)
+
+    self.assertEqual(state_fn.ConstantPosition(), state_function.PositionState(600, 400, 0))
+    state_fn.angle = state_function.MakeFn('t')
+    self.assertIsNone(state_fn.ConstantPosition())
+
+class TestExpressionCache(unittest.TestCase):
+  def setUp(self):
+    self.cache = state_function.EXPRESSION_CACHE
+    self.cache.NextFrame()
+    self.cache.hits = self.cache.misses = self.cache.evictions = 0
+    self.cache.published_ = (0, 0, 0)
+
+  def test_timeOnlyExpression_evaluatedOncePerT(self):
+    fn = state_function.MakeFn('40 + 5 * sin(t)')
+
+    first = fn(SIMPLE_CONTEXT)
+    second = fn(SIMPLE_CONTEXT)
+
+    self.assertAlmostEqual(first, 40 + 5 * math.sin(1.5))
+    self.assertEqual(first, second)
+    self.assertEqual(self.cache.misses, 1)
+    self.assertEqual(self.cache.hits, 1)
+
+  def test_separatelyCompiled_shareEntries(self):
+    state_function.MakeFn('40 + 5 * sin(t)')(SIMPLE_CONTEXT)
+    state_function.MakeFn('40 + 5 * sin(t)')(SIMPLE_CONTEXT)
+
+    self.assertEqual(self.cache.misses, 1)
+    self.assertEqual(self.cache.hits, 1)
+
+  def test_mixedExpression_sharesTimeTermAcrossIdx(self):
+    fn = state_function.MakeFn('(40 * sin(t) * cos(t / 3)) * cos(tau * idx / 8)')
+
+    for idx in range(8):
+      bound = state_function.BindIdxTerms(fn, idx)
+      ctx = state_function.GetGlobals() | SIMPLE_CONTEXT | {'idx': idx}
+      self.assertAlmostEqual(
+        bound(ctx),
+        40 * math.sin(1.5) * math.cos(0.5) * math.cos(math.tau * idx / 8))
+      self.assertAlmostEqual(bound(ctx), fn(ctx))
+
+    self.assertEqual(self.cache.misses, 1)
+
+  def test_nextFrame_dropsEntriesAndCounts(self):
+    fn = state_function.MakeFn('sin(t)')
+    fn(SIMPLE_CONTEXT)
+    fn(SIMPLE_CONTEXT)
+    counters = state_function.INSTRUMENTATION.counters
+    hits = counters.get('expression_cache.hits', 0)
+    misses = counters.get('expression_cache.misses', 0)
+
+    self.cache.NextFrame()
+
+    self.assertEqual(counters['expression_cache.hits'] - hits, 1)
+    self.assertEqual(counters['expression_cache.misses'] - misses, 1)
+    fn(SIMPLE_CONTEXT)
+    self.assertEqual(self.cache.misses, 2)
+
+  def test_full_evictsEverything(self):
+    self.cache.max_entries = 2
+    try:
+      fn = state_function.MakeFn('sin(t)')
+      for t in range(3):
+        fn({'t': t})
+    finally:
+      self.cache.max_entries = 1 << 16
+
+    self.assertEqual(self.cache.evictions, 1)
+    self.assertEqual(len(self.cache.table_), 1)
+
+  def test_conditionalIdxTerm_notEvaluatedEagerly(self):
+    fn = state_function.MakeFn('sin(t) * cos(t) if idx < 2 else sqrt(idx - 2)')
+
+    bound = state_function.BindIdxTerms(fn, 1)
+
+    self.assertFalse(getattr(fn, 'idx_terms', None))
+    ctx = state_function.GetGlobals() | SIMPLE_CONTEXT | {'idx': 1}
+    self.assertEqual(bound(ctx), math.sin(1.5) * math.cos(1.5))
+
+  def test_disabled_stillEvaluates(self):
+    self.cache.enabled = False
+    try:
+      fn = state_function.MakeFn('40 + 5 * sin(t)')
+      self.assertAlmostEqual(fn(SIMPLE_CONTEXT), 40 + 5 * math.sin(1.5))
+    finally:
+      self.cache.enabled = True
+    self.assertEqual(self.cache.misses, 0)
+
 class TestGenerateCartesianStateFn(unittest.TestCase):
   def tearDown(self):
     state_function.ClearDefinedFunctions()
@@ -145,6 +298,17 @@ class TestGenerateDeltaStateFn(unittest.TestCase):
     # 0 + 1 * 2
     self.assertAlmostEqual(state.angle, 2)
 
+  def test_variables_includeDtAndCurrentPosition(self):
+    delta_pb = spawner_pb2.DeltaStateFn()
+    delta_pb.id.id = 'delta_dependencies'
+    delta_pb.dx = '20 * cos(anglea)'
+
+    state_function.GenerateDeltaStateFn(delta_pb, True)
+
+    self.assertEqual(
+      state_function.StateFnDependencies('delta_dependencies'),
+      {'x', 'dt', 'anglea'})
+
 class TestGenerateCompiledStateFn(unittest.TestCase):
   def setUp(self):
     cartesian_pb = spawner_pb2.CartesianStateFn()
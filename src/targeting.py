@@ -0,0 +1,231 @@
+"""Nearest opposing target lookups for the tx and ty variables.
+
+Entities with a hit_radius are targets, grouped by alignment. An entity
+whose movement reads tx or ty homes in on the nearest target of any other
+alignment, or on its own position if there is none.
+
+The index is rebuilt at most once per frame, the first time a homing entity
+asks for its target: one walk of the world collects the targets into a
+KdTree per alignment and resolves every homing entity found in the same walk
+as a batch. Entities spawned later in the frame are looked up one at a time.
+Frames without homing entities never build anything, and numpy is only
+imported once something homes, so importing entity stays cheap.
+
+ParallelUpdater instead builds the index every frame, on the calling thread
+before any work is dispatched, since walking the world while other threads
+update it isn't safe. Lazy builds are serialized by a lock either way.
+"""
+from math import cos
+from math import sin
+import threading
+from typing import Any
+from typing import Optional
+from typing import TYPE_CHECKING
+
+from src.state_function import TARGET_VARIABLES
+
+if TYPE_CHECKING:
+  from src.entity import Entity
+
+class KdTree():
+  """2d tree of points answering nearest neighbour queries in O(log n) on average."""
+  LEAF_SIZE = 8
+  # Fewer points than this are searched exhaustively by NearestMany.
+  BRUTE_FORCE_SIZE = 64
+
+  def __init__(self, points: Any):
+    import numpy as np
+    self.points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    self.coords_: list[tuple[float, float]] = [
+      (x, y) for x, y in self.points.tolist()]
+    order = np.arange(len(self.points))
+    # [lo, hi, axis, split, left, right], axis is -1 for leaves over order[lo:hi].
+    self.nodes_: list[list] = []
+    if len(self.points):
+      to_build = [(0, len(self.points), None)]
+      while to_build:
+        lo, hi, parent = to_build.pop()
+        node_id = len(self.nodes_)
+        if parent is not None:
+          parent_node, side = parent
+          self.nodes_[parent_node][side] = node_id
+        if hi - lo <= KdTree.LEAF_SIZE:
+          self.nodes_.append([lo, hi, -1, 0.0, -1, -1])
+          continue
+        section = self.points[order[lo:hi]]
+        axis = int(np.ptp(section[:, 1]) > np.ptp(section[:, 0]))
+        mid = (lo + hi) // 2
+        order[lo:hi] = order[lo:hi][np.argpartition(section[:, axis], mid - lo)]
+        split = float(self.points[order[mid], axis])
+        self.nodes_.append([lo, hi, axis, split, -1, -1])
+        to_build.append((mid, hi, (node_id, 5)))
+        to_build.append((lo, mid, (node_id, 4)))
+    self.order_: list[int] = order.tolist()
+
+  def __len__(self) -> int:
+    return len(self.coords_)
+
+  def Nearest(self, x: float, y: float) -> tuple[int, float]:
+    """(index, squared distance) of the point nearest to (x, y), (-1, inf) if empty."""
+    best = -1
+    best_distance = float('inf')
+    if not self.nodes_:
+      return best, best_distance
+    nodes = self.nodes_
+    coords = self.coords_
+    order = self.order_
+    # (node, squared distance from the query to the node's half plane)
+    to_visit = [(0, 0.0)]
+    while to_visit:
+      node_id, bound = to_visit.pop()
+      if bound >= best_distance:
+        continue
+      lo, hi, axis, split, left, right = nodes[node_id]
+      if axis < 0:
+        for i in order[lo:hi]:
+          px, py = coords[i]
+          distance = (px - x) * (px - x) + (py - y) * (py - y)
+          if distance < best_distance:
+            best = i
+            best_distance = distance
+        continue
+      offset = (y if axis else x) - split
+      near, far = (left, right) if offset < 0 else (right, left)
+      # Visit the near side first by pushing it last.
+      to_visit.append((far, max(bound, offset * offset)))
+      to_visit.append((near, bound))
+    return best, best_distance
+
+  def NearestMany(self, queries: Any) -> tuple[Any, Any]:
+    """Nearest for every (x, y) row of queries, as numpy (indices, squared distances)."""
+    import numpy as np
+    queries = np.asarray(queries, dtype=np.float64).reshape(-1, 2)
+    if not len(self):
+      return np.full(len(queries), -1), np.full(len(queries), np.inf)
+    if len(self) <= KdTree.BRUTE_FORCE_SIZE:
+      deltas = queries[:, None, :] - self.points[None, :, :]
+      distances = np.einsum('qpd,qpd->qp', deltas, deltas)
+      indices = np.argmin(distances, axis=1)
+      return indices, distances[np.arange(len(queries)), indices]
+    results = [self.Nearest(x, y) for x, y in queries.tolist()]
+    indices, distances = zip(*results) if results else ((), ())
+    return np.array(indices, dtype=np.int64), np.array(distances, dtype=np.float64)
+
+class TargetIndex():
+  def __init__(self):
+    self.root_: Optional['Entity'] = None
+    # Only set once trees_ and resolved_ are complete.
+    self.built_ = False
+    self.lock_ = threading.Lock()
+    self.trees_: dict[int, KdTree] = {}
+    # Targets resolved in the batch when the index was built this frame.
+    self.resolved_: dict['Entity', tuple[float, float]] = {}
+    # Stats
+    self.builds = 0
+    self.batched = 0
+    self.single = 0
+
+  def NextFrame(self, root: 'Entity'):
+    """Forgets the previous frame's index, which is rebuilt when first needed."""
+    self.root_ = root
+    self.built_ = False
+    self.resolved_ = {}
+
+  def Target(self, entity: 'Entity') -> tuple[float, float]:
+    """(tx, ty) for entity."""
+    if not self.built_:
+      with self.lock_:
+        if not self.built_:
+          root = self.root_
+          if root is None:
+            # Not updated as part of a world, so index whatever entity is under.
+            root = entity
+            while root.parent is not None:
+              root = root.parent
+          self.Build_(root)
+    target = self.resolved_.get(entity)
+    if target is not None:
+      return target
+    self.single += 1
+    position = entity.AbsolutePosition()
+    return self.Nearest_(entity.alignment, position.x, position.y)
+
+  def Nearest_(self, alignment: int, x: float, y: float) -> tuple[float, float]:
+    best = (x, y)
+    best_distance = float('inf')
+    for target_alignment, tree in self.trees_.items():
+      if target_alignment == alignment:
+        continue
+      i, distance = tree.Nearest(x, y)
+      if distance < best_distance:
+        best_distance = distance
+        best = tree.coords_[i]
+    return best
+
+  def Build(self, root: 'Entity'):
+    """Builds this frame's index now rather than when first needed."""
+    with self.lock_:
+      self.root_ = root
+      self.Build_(root)
+
+  def Build_(self, root: 'Entity'):
+    import numpy as np
+    self.builds += 1
+    targets: dict[int, list[tuple[float, float]]] = {}
+    homing: dict[int, list[tuple['Entity', tuple[float, float]]]] = {}
+    # Absolute positions are resolved here instead of with AbsolutePosition,
+    # which would cache them for entities whose parent hasn't moved yet this
+    # frame, and so stays stale once it does.
+    position = root.position
+    offset = root.offset
+    root_angle = position.angle + offset.angle
+    # (entity, its parent's absolute x, y and angle, and the cos and sin of it)
+    to_visit = [
+      (child, position.x + offset.x, position.y + offset.y, root_angle,
+        cos(root_angle), sin(root_angle))
+      for child in root.children_]
+    while to_visit:
+      entity, parent_x, parent_y, parent_angle, cos_angle, sin_angle = to_visit.pop()
+      position = entity.position
+      offset = entity.offset
+      x = position.x + offset.x
+      y = position.y + offset.y
+      angle = position.angle + offset.angle
+      if entity.parent is not None:
+        if entity.follow_angle:
+          x, y = y * sin_angle + x * cos_angle, y * cos_angle - x * sin_angle
+          angle += parent_angle
+        if entity.follow_center:
+          x += parent_x
+          y += parent_y
+      if entity.hit_radius > 0:
+        targets.setdefault(entity.alignment, []).append((x, y))
+      variables = entity.movement.variables
+      if variables is not None and variables & TARGET_VARIABLES:
+        homing.setdefault(entity.alignment, []).append((entity, (x, y)))
+      if entity.children_:
+        cos_child = cos(angle)
+        sin_child = sin(angle)
+        to_visit.extend(
+          (child, x, y, angle, cos_child, sin_child) for child in entity.children_)
+    trees = {
+      alignment: KdTree(np.array(points)) for alignment, points in targets.items()}
+
+    resolved = {}
+    for alignment, entities in homing.items():
+      queries = np.array([p for _, p in entities], dtype=np.float64)
+      best = queries.copy()
+      best_distance = np.full(len(queries), np.inf)
+      for target_alignment, tree in trees.items():
+        if target_alignment == alignment:
+          continue
+        indices, distances = tree.NearestMany(queries)
+        closer = distances < best_distance
+        best[closer] = tree.points[indices[closer]]
+        best_distance[closer] = distances[closer]
+      for (entity, _), (x, y) in zip(entities, best.tolist()):
+        resolved[entity] = (x, y)
+      self.batched += len(entities)
+    self.trees_ = trees
+    self.resolved_ = resolved
+    self.built_ = True
@@ -0,0 +1,185 @@
+import random
+import threading
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from src import entity
+from src import parallel_update
+from src import targeting
+from src.loader import ParseDefinedUnits
+from src.world import Templates
+from src.world import World
+
+UNITS_PB_TXT = """
+  entity {
+    id { id: 'target_player' }
+    hit_radius: 4
+    alignment: 1
+    movement {
+      state_fn { cartesian { x: '100' y: '0' } }
+      lifetime: 0
+    }
+  }
+
+  entity {
+    id { id: 'target_ally' }
+    hit_radius: 4
+    alignment: 2
+    movement {
+      state_fn { cartesian { x: '-10' y: '0' } }
+      lifetime: 0
+    }
+  }
+
+  entity {
+    id { id: 'target_carrier' }
+    movement {
+      state_fn { cartesian { x: '100 * t' y: '0' } }
+      lifetime: 0
+    }
+    spawner {
+      spawn_entity {
+        hit_radius: 1
+        alignment: 1
+        movement {
+          state_fn { cartesian { x: '10' y: '0' } }
+          lifetime: 0
+        }
+      }
+      spawn_count: 1
+      spawn_time_fn: '0'
+      follow_center: true
+    }
+    spawner {
+      spawn_entity { id { id: 'target_homing' } }
+      spawn_count: 1
+      spawn_time_fn: '0'
+      follow_center: true
+    }
+  }
+
+  entity {
+    id { id: 'target_homing' }
+    alignment: 2
+    movement {
+      state_fn { delta { dx: 'tx - x' dy: 'ty - y' } }
+      lifetime: 0
+    }
+  }
+"""
+
+class TestKdTree(unittest.TestCase):
+  def test_nearest_matchesBruteForce(self):
+    rng = random.Random(7)
+    points = np.array([(rng.uniform(0, 1000), rng.uniform(0, 1000)) for _ in range(500)])
+    tree = targeting.KdTree(points)
+
+    for _ in range(200):
+      x, y = rng.uniform(-100, 1100), rng.uniform(-100, 1100)
+      i, distance = tree.Nearest(x, y)
+      expected = np.min(np.sum((points - (x, y)) ** 2, axis=1))
+      self.assertAlmostEqual(distance, expected)
+      self.assertAlmostEqual(float(np.sum((points[i] - (x, y)) ** 2)), expected)
+
+  def test_nearestMany_bruteForceAndTreeAgree(self):
+    rng = np.random.default_rng(3)
+    points = rng.uniform(0, 100, (40, 2))
+    queries = rng.uniform(0, 100, (30, 2))
+
+    brute_indices, brute_distances = targeting.KdTree(points).NearestMany(queries)
+    tree_results = [targeting.KdTree(points).Nearest(x, y) for x, y in queries]
+
+    self.assertEqual(list(brute_indices), [i for i, _ in tree_results])
+    np.testing.assert_allclose(brute_distances, [d for _, d in tree_results])
+
+  def test_empty_hasNoNearest(self):
+    self.assertEqual(targeting.KdTree(np.empty((0, 2))).Nearest(1, 2), (-1, float('inf')))
+
+class TestTargetIndex(unittest.TestCase):
+  @classmethod
+  def setUpClass(cls):
+    cls.templates = Templates.Compile(ParseDefinedUnits(UNITS_PB_TXT))
+
+  def setUp(self):
+    self.world = World(self.templates)
+
+  def test_homing_movesTowardsOpposingTarget(self):
+    self.world.Add('target_player')
+    self.world.Add('target_ally')
+    homing = self.world.Add('target_homing')
+
+    for _ in range(60):
+      self.world.Update(1 / 60)
+
+    # Closes 1 - e^-1 of the distance to the player, ignoring the closer ally.
+    self.assertAlmostEqual(homing.position.x, 100 * (1 - np.exp(-1)), delta=1)
+    self.assertAlmostEqual(homing.position.y, 0)
+
+  def test_noTarget_staysInPlace(self):
+    homing = self.world.Add('target_homing')
+
+    self.world.Update(1 / 60)
+
+    self.assertEqual((homing.position.x, homing.position.y), (0, 0))
+
+  def test_manyHoming_resolvedInOneBatch(self):
+    self.world.Add('target_player')
+    for i in range(100):
+      self.world.Add('target_homing', idx=i)
+
+    self.world.Update(1 / 60)
+
+    self.assertEqual(self.world.targets.builds, 1)
+    self.assertEqual(self.world.targets.batched, 100)
+    self.assertEqual(self.world.targets.single, 0)
+
+  def test_noHoming_neverBuilds(self):
+    self.world.Add('target_player')
+
+    self.world.Update(1 / 60)
+
+    self.assertEqual(self.world.targets.builds, 0)
+
+  def test_build_doesNotCacheStaleAbsolutePositions(self):
+    carrier = self.world.Add('target_carrier')
+
+    for frame in range(1, 4):
+      self.world.Update(1)
+      target, _ = carrier.children_
+      with self.world:
+        # The target updated before its parent moved, then the homing
+        # sibling built the index.
+        self.assertEqual(target.AbsolutePosition().x, 100 * frame + 10)
+    self.assertEqual(self.world.targets.builds, 3)
+
+  def test_parallelUpdate_buildsBeforeDispatching(self):
+    build = targeting.TargetIndex.Build_
+    built_on = []
+    def RecordThread(index, root):
+      built_on.append(threading.current_thread())
+      build(index, root)
+    positions = []
+    for threads in (1, 4):
+      world = World(self.templates)
+      world.Add('target_player')
+      for i in range(40):
+        world.Add('target_homing', idx=i)
+      with (parallel_update.ParallelUpdater(
+                threads, chunk_size=4, split_threshold=8, force=True) as updater,
+            world, mock.patch.object(targeting.TargetIndex, 'Build_', RecordThread)):
+        for _ in range(10):
+          updater.Update(world.globals, 1 / 60)
+      positions.append([(e.position.x, e.position.y) for e in world.root.children_])
+
+    # Every homing entity was resolved in one batch per frame, none on a worker.
+    self.assertEqual(set(built_on), {threading.current_thread()})
+    self.assertEqual(world.targets.builds, 10)
+    self.assertEqual(world.targets.batched, 400)
+    self.assertEqual(world.targets.single, 0)
+    self.assertEqual(positions[1], positions[0])
+    self.assertGreater(positions[0][1][0], 0)
+
+if __name__ == '__main__':
+  unittest.main()
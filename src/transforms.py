@@ -0,0 +1,68 @@
+"""Applies a parent's transform to all of its children as one array operation.
+
+Entity.AbsolutePosition resolves one entity at a time. When an entity has
+many children (e.g. 180 satellites around a sun) the same parent transform
+is applied to every one of them, which vectorizes well.
+"""
+import numpy as np
+
+from src.entity import Entity
+from src.state_function import PositionState
+
+def ApplyTransformToChildren(parent: Entity, cache: bool = True) -> np.ndarray:
+  """Absolute (x, y, angle) of every child of parent, in order.
+
+  Args:
+    parent: Entity whose children to resolve.
+    cache: Also store the results as each child's AbsolutePosition for this
+      frame, so that drawing and grandchildren don't recompute them.
+  Returns:
+    A (len(children), 3) array.
+  """
+  children = parent.children_
+  if not children:
+    return np.empty((0, 3))
+  parent_position, cos_angle, sin_angle = parent.Transform()
+
+  values = []
+  follow = []
+  for child in children:
+    position = child.position
+    offset = child.offset
+    values += (
+      position.x + offset.x, position.y + offset.y, position.angle + offset.angle)
+    follow += (child.follow_center, child.follow_angle)
+  centered = np.array(values, dtype=np.float64).reshape(-1, 3)
+  follow_center, follow_angle = np.array(follow, dtype=bool).reshape(-1, 2).T
+
+  x, y, angle = centered.T
+  res = np.empty_like(centered)
+  res[:, 0] = np.where(follow_angle, y * sin_angle + x * cos_angle, x)
+  res[:, 1] = np.where(follow_angle, y * cos_angle - x * sin_angle, y)
+  res[:, 2] = np.where(follow_angle, angle + parent_position.angle, angle)
+  res[:, 0] += np.where(follow_center, parent_position.x, 0)
+  res[:, 1] += np.where(follow_center, parent_position.y, 0)
+
+  if cache:
+    for child, (x, y, angle) in zip(children, res.tolist()):
+      if child.parent is parent:
+        child.absolute_position_ = PositionState(x, y, angle)
+        child.recalc_absolute_ = False
+  return res
+
+def ResolveAbsolutePositions(root: Entity, min_batch: int = 32):
+  """Caches the AbsolutePosition of everything below root for this frame.
+
+  Children of entities with at least min_batch children are resolved with
+  ApplyTransformToChildren, the rest one at a time.
+  """
+  to_visit = [root]
+  while to_visit:
+    parent = to_visit.pop()
+    children = parent.children_
+    if len(children) >= min_batch:
+      ApplyTransformToChildren(parent)
+    else:
+      for child in children:
+        child.AbsolutePosition()
+    to_visit.extend(children)
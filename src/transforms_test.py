@@ -0,0 +1,71 @@
+import math
+import unittest
+
+from google.protobuf import text_format
+from proto import spawner_pb2
+from src import entity
+from src import transforms
+from src.state_function import PositionState
+
+class TestTransforms(unittest.TestCase):
+  def setUp(self):
+    self.parent = entity.Entity(text_format.Parse("""
+        movement {
+          state_fn { cartesian { x: "10 + t" y: "5" angle: "t" } }
+          lifetime: 0
+        }
+      """, spawner_pb2.Entity()))
+    child_pb = text_format.Parse("""
+        movement {
+          state_fn { polar { r: "3" theta: "t + idx" angle: "idx" } }
+          lifetime: 0
+        }
+      """, spawner_pb2.Entity())
+    follows = [(True, True), (True, False), (False, True), (False, False)]
+    for i in range(8):
+      follow_center, follow_angle = follows[i % 4]
+      self.parent.AddChild(entity.Entity(
+        child_pb, self.parent, PositionState(i, -i, 0.1 * i), i,
+        follow_center, follow_angle))
+    self.parent.Update({}, 0.7)
+
+  def ExpectedPositions(self) -> list[PositionState]:
+    for child in self.parent.children_:
+      child.recalc_absolute_ = True
+    return [child.AbsolutePosition() for child in self.parent.children_]
+
+  def testApplyTransformToChildren_matchesAbsolutePosition(self):
+    expected = self.ExpectedPositions()
+
+    res = transforms.ApplyTransformToChildren(self.parent, cache=False)
+
+    self.assertEqual(res.shape, (8, 3))
+    for (x, y, angle), position in zip(res, expected):
+      self.assertAlmostEqual(x, position.x)
+      self.assertAlmostEqual(y, position.y)
+      self.assertAlmostEqual(angle, position.angle)
+
+  def testApplyTransformToChildren_cachesAbsolutePositions(self):
+    expected = self.ExpectedPositions()
+    for child in self.parent.children_:
+      child.recalc_absolute_ = True
+
+    transforms.ApplyTransformToChildren(self.parent)
+
+    for child, position in zip(self.parent.children_, expected):
+      self.assertFalse(child.recalc_absolute_)
+      self.assertAlmostEqual(child.AbsolutePosition().x, position.x)
+      self.assertAlmostEqual(child.AbsolutePosition().y, position.y)
+
+  def testTransform_isCachedUntilParentMoves(self):
+    first = self.parent.Transform()
+    self.assertIs(self.parent.Transform(), first)
+    self.assertAlmostEqual(first[1], math.cos(0.7))
+    self.assertAlmostEqual(first[2], math.sin(0.7))
+
+    self.parent.Update({}, 0.1)
+
+    self.assertAlmostEqual(self.parent.Transform()[2], math.sin(0.8))
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,176 @@
+"""Isolated simulations that can run side by side in one process.
+
+Entity, Spawner and state_function keep their registries in class and module
+attributes, which is all a process running a single simulation needs. A World
+owns its own registries, root entity, pool, target index, spawn queue and RNG,
+and swaps them in while it is active:
+
+  templates = Templates.Compile(defined)
+  worlds = [World(templates, seed=i) for i in range(100)]
+  for world in worlds:
+    world.Add('sun')
+  for world in worlds:
+    world.Update(1 / 60)
+
+Templates are compiled once and never modified, so every World made from the
+same Templates refers to the same protos and CompiledStateFns and only costs
+its live entities. Units registered in a World afterwards, e.g. by hot
+reload, only replace entries in that World's registries.
+
+Only one World is active at a time and worlds aren't thread safe, use
+processes to run them concurrently.
+"""
+from dataclasses import dataclass
+import random
+from types import MappingProxyType
+from typing import Any
+from typing import Mapping
+from typing import Optional
+
+from google.protobuf.message import Message
+from proto import spawner_pb2
+from src import entity as entity_module
+from src import state_function
+from src.entity import Entity
+from src.entity import Spawner
+from src.entity import WORLD_ENTITY_PB
+from src.loader import RegisterDefinedUnits
+from src.pool import ObjectPool
+from src.snapshot import RestoreSnapshot
+from src.snapshot import TakeSnapshot
+from src.spawn_queue import SpawnQueue
+from src.state_function import CompiledStateFn
+from src.state_function import GetGlobals
+from src.targeting import TargetIndex
+
+# (owner, attribute) of everything a World swaps in, in the order of World.State_.
+_SWAPPED = (
+  (Entity, 'ZA_WARUDO'),
+  (Entity, 'SAVED_'),
+  (Entity, 'VERSIONS_'),
+  (Entity, 'POOL_'),
+  (Entity, 'TARGETS_'),
+  (Spawner, 'SAVED_'),
+  (Spawner, 'VERSIONS_'),
+  (Spawner, 'QUEUE_'),
+  (Spawner, 'CAPPED_'),
+  (Spawner, 'SPAWNED_'),
+  (state_function, 'DEFINED_FUNCTIONS_'),
+  (state_function, 'DEFINED_FUNCTION_SOURCES_'),
+  (entity_module, 'GLOBALS_'),
+)
+
+@dataclass(frozen=True)
+class Templates:
+  """Compiled units shared by every World created from them."""
+  entities: Mapping[str, spawner_pb2.Entity]
+  spawners: Mapping[str, spawner_pb2.Spawner]
+  functions: Mapping[str, CompiledStateFn]
+  function_sources: Mapping[str, Message]
+
+  @classmethod
+  def Compile(cls, defined: spawner_pb2.DefinedUnits) -> 'Templates':
+    """Compiles defined without touching the process wide registries."""
+    world = World()
+    with world:
+      RegisterDefinedUnits(defined)
+    return cls(
+      MappingProxyType(world.entities),
+      MappingProxyType(world.spawners),
+      MappingProxyType(world.functions),
+      MappingProxyType(world.function_sources))
+
+EMPTY_TEMPLATES = Templates(
+  MappingProxyType({}), MappingProxyType({}),
+  MappingProxyType({}), MappingProxyType({}))
+
+class World():
+  def __init__(
+      self,
+      templates: Templates = EMPTY_TEMPLATES,
+      seed: Optional[int] = None,
+      queued: bool = False):
+    """
+    Args:
+      templates: Units every entity in this world can refer to by id.
+      seed: Seeds the r available to expressions, random if None.
+      queued: Update spawners through a SpawnQueue instead of polling.
+    """
+    self.templates = templates
+    self.entities: dict[str, spawner_pb2.Entity] = {'world': WORLD_ENTITY_PB}
+    self.entities.update(templates.entities)
+    self.spawners: dict[str, spawner_pb2.Spawner] = dict(templates.spawners)
+    self.functions: dict[str, CompiledStateFn] = dict(templates.functions)
+    self.function_sources: dict[str, Message] = dict(templates.function_sources)
+    self.rng = random.Random(seed)
+    self.globals: dict[str, Any] = GetGlobals() | {'r': self.rng}
+
+    self.root: Optional[Entity] = None
+    self.pool = ObjectPool()
+    self.targets = TargetIndex()
+    self.queue = SpawnQueue() if queued else None
+    self.entity_versions_: dict[str, int] = {}
+    self.spawner_versions_: dict[str, int] = {}
+    self.capped_: dict[str, int] = {}
+    self.spawned_: dict[str, int] = {}
+    # State of whatever was active before each (nested) activation.
+    self.saved_states_: list[tuple] = []
+
+  def State_(self) -> tuple:
+    return (
+      self.root,
+      self.entities,
+      self.entity_versions_,
+      self.pool,
+      self.targets,
+      self.spawners,
+      self.spawner_versions_,
+      self.queue,
+      self.capped_,
+      self.spawned_,
+      self.functions,
+      self.function_sources,
+      self.globals)
+
+  def __enter__(self) -> 'World':
+    self.saved_states_.append(
+      tuple(getattr(owner, name) for owner, name in _SWAPPED))
+    for (owner, name), value in zip(_SWAPPED, self.State_()):
+      setattr(owner, name, value)
+    if self.root is None:
+      self.root = Entity.CreateWorld()
+    return self
+
+  def __exit__(self, *args):
+    # The root is the only swapped attribute that is replaced rather than modified.
+    self.root = Entity.ZA_WARUDO
+    for (owner, name), value in zip(_SWAPPED, self.saved_states_.pop()):
+      setattr(owner, name, value)
+
+  def Add(self, entity_id: str, idx: int = 0) -> Entity:
+    """Adds a new instance of the saved entity entity_id to the root."""
+    entity_pb = spawner_pb2.Entity()
+    entity_pb.id.id = entity_id
+    with self:
+      child = Entity(entity_pb, idx=idx)
+      self.root.AddChild(child)
+    return child
+
+  def Register(self, defined: spawner_pb2.DefinedUnits):
+    """Registers more units in this world only."""
+    with self:
+      RegisterDefinedUnits(defined)
+
+  def Update(self, dt: float):
+    with self:
+      self.root.Update(self.globals, dt)
+
+  def Snapshot(self) -> bytes:
+    """Every entity in this world and the state of its RNG, see snapshot.py."""
+    with self:
+      return TakeSnapshot(self.root, self.rng)
+
+  def Restore(self, snapshot: bytes):
+    """Replaces every entity and the RNG with a Snapshot of any world."""
+    with self:
+      RestoreSnapshot(snapshot, self.root, self.rng)
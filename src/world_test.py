@@ -0,0 +1,112 @@
+import unittest
+
+from src import entity
+from src import state_function
+from src import world
+from src.loader import ParseDefinedUnits
+
+UNITS_PB_TXT = """
+  cartesian_function {
+    id { id: 'world_move' }
+    x: '10 * t'
+    y: 'r.uniform(0, 100)'
+  }
+
+  entity {
+    id { id: 'world_bullet' }
+    movement {
+      state_fn { id { id: 'world_move' } }
+      lifetime: 0
+    }
+  }
+
+  spawner {
+    id { id: 'world_spawner' }
+    spawn_entity { id { id: 'world_bullet' } }
+    spawn_count: 3
+    spawn_time_fn: 'idx / 10'
+    period: 0
+  }
+
+  entity {
+    id { id: 'world_emitter' }
+    movement {
+      state_fn { cartesian {} }
+      lifetime: 0
+    }
+    spawner { id { id: 'world_spawner' } }
+  }
+"""
+
+class TestWorld(unittest.TestCase):
+  @classmethod
+  def setUpClass(cls):
+    cls.templates = world.Templates.Compile(ParseDefinedUnits(UNITS_PB_TXT))
+
+  def Positions(self, w: world.World) -> list[tuple[float, float]]:
+    with w:
+      return [
+        (child.AbsolutePosition().x, child.AbsolutePosition().y)
+        for child in w.root.Walk() if child is not w.root]
+
+  def test_compile_leavesProcessRegistriesAlone(self):
+    self.assertNotIn('world_bullet', entity.Entity.SAVED_)
+    self.assertNotIn('world_spawner', entity.Spawner.SAVED_)
+    self.assertNotIn('world_move', state_function.DEFINED_FUNCTIONS_)
+
+  def test_worlds_shareCompiledTemplates(self):
+    a = world.World(self.templates)
+    b = world.World(self.templates)
+
+    self.assertIs(a.functions['world_move'], b.functions['world_move'])
+    self.assertIs(a.spawners['world_spawner'], b.spawners['world_spawner'])
+
+  def test_update_onlyChangesItsOwnRoot(self):
+    process_root = entity.Entity.World()
+    a = world.World(self.templates)
+    b = world.World(self.templates)
+    a.Add('world_emitter')
+
+    a.Update(0.5)
+    b.Update(0.5)
+
+    self.assertEqual(len(self.Positions(a)), 4)
+    self.assertEqual(self.Positions(b), [])
+    self.assertIs(entity.Entity.ZA_WARUDO, process_root)
+
+  def test_sameSeed_sameSimulation(self):
+    runs = []
+    for seed in (1, 1, 2):
+      w = world.World(self.templates, seed=seed)
+      w.Add('world_emitter')
+      w.Update(0.5)
+      runs.append(self.Positions(w))
+
+    self.assertEqual(runs[0], runs[1])
+    self.assertNotEqual(runs[0], runs[2])
+
+  def test_register_onlyAffectsThatWorld(self):
+    a = world.World(self.templates)
+    b = world.World(self.templates)
+
+    a.Register(ParseDefinedUnits(
+      UNITS_PB_TXT.replace("world_", "world_a_")))
+
+    self.assertIn('world_a_bullet', a.entities)
+    self.assertNotIn('world_a_bullet', b.entities)
+    self.assertNotIn('world_a_move', self.templates.functions)
+    self.assertNotIn('world_a_move', state_function.DEFINED_FUNCTIONS_)
+
+  def test_nestedActivation_restoresPrevious(self):
+    a = world.World(self.templates)
+    b = world.World(self.templates)
+
+    with a:
+      with b:
+        self.assertIs(entity.Entity.ZA_WARUDO, b.root)
+      self.assertIs(entity.Entity.ZA_WARUDO, a.root)
+      self.assertIs(entity.Entity.SAVED_, a.entities)
+    self.assertIsNot(entity.Entity.SAVED_, a.entities)
+
+if __name__ == '__main__':
+  unittest.main()